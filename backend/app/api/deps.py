@@ -3,6 +3,8 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from firebase_admin import auth
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
+from app.core.security import firebase_token_cache
+from app.core.logging import logger
 
 security = HTTPBearer()
 
@@ -28,27 +30,38 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     if settings.ENV == "production":
         pass  # Hard-block: skip mock bypass entirely in production
     elif settings.ENV in ["local", "development", "test", "staging"] and token == "admin-mock-token":
-        import logging
-        logging.getLogger(__name__).warning(f"MOCK ADMIN AUTH used in {settings.ENV}")
+        logger.warning("MOCK ADMIN AUTH used", extra={"env": settings.ENV})
         return UserRecord(
             uid="mock-admin-uid",
             email="admin@emektup.test",
             claims={"uid": "mock-admin-uid", "email": "admin@emektup.test", "admin": True}
         )
     
-    try:
-        decoded_token = auth.verify_id_token(token)
-        return UserRecord(
-            uid=decoded_token.get("uid"),
-            email=decoded_token.get("email"),
-            claims=decoded_token
-        )
-    except Exception:
+    # Reuse claims of an already verified token (skips the RSA signature check)
+    decoded_token = firebase_token_cache.get(token)
+    if decoded_token is None:
+        try:
+            decoded_token = auth.verify_id_token(token)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid authentication credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        firebase_token_cache.put(token, decoded_token)
+    
+    if firebase_token_cache.is_revoked(decoded_token):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    
+    return UserRecord(
+        uid=decoded_token.get("uid"),
+        email=decoded_token.get("email"),
+        claims=decoded_token
+    )
 
 def require_admin(user: UserRecord = Depends(get_current_user)) -> UserRecord:
     """
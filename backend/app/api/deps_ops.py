@@ -1,8 +1,7 @@
 from fastapi import HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from google.oauth2 import id_token
-from google.auth.transport import requests
 from app.core.config import settings
+from app.core.security import oidc_verifier
 from app.core.logging import logger
 
 security = HTTPBearer()
@@ -17,7 +16,7 @@ def verify_oidc_token(credentials: HTTPAuthorizationCredentials = Security(secur
     if settings.ENV == "production":
         pass  # Hard-block: skip mock bypass entirely in production
     elif settings.ENV in ["local", "development", "test", "staging"] and token == "ops-mock-token":
-        logger.warning(f"MOCK OPS TOKEN used in {settings.ENV}")
+        logger.warning("MOCK OPS TOKEN used", extra={"env": settings.ENV})
         return {"email": "local-dev@ops", "sub": "local"}
 
     audience = settings.OPS_AUDIENCE_URL # e.g. https://emektup-api-staging-xxxxxxxx-ew.a.run.app
@@ -25,19 +24,18 @@ def verify_oidc_token(credentials: HTTPAuthorizationCredentials = Security(secur
          raise HTTPException(status_code=500, detail="Server misconfiguration: OPS_AUDIENCE_URL not set")
 
     try:
-        # Verify the token against Google's public certs
-        request = requests.Request()
-        claims = id_token.verify_oauth2_token(token, request, audience=audience)
+        # Verify the token against Google's public certs (certs + claims are cached process-wide)
+        claims = oidc_verifier.verify(token, audience)
         
         # Verify the issuer and email/subject
         if claims.get("email") != settings.OPS_SERVICE_ACCOUNT_EMAIL:
-             logger.error(f"OIDC Verification failed: Unauthorized email target {claims.get('email')}")
+             logger.error("OIDC Verification failed: Unauthorized email target", extra={"email": claims.get("email")})
              raise HTTPException(status_code=403, detail="Unauthorized OPS Service Account")
              
-        # Add basic logging
-        logger.info(f"OIDC verified for OPS request: {claims.get('email')}")
+        # High-volume line (every Cloud Tasks delivery): sampled via LOG_SAMPLE_RATES
+        logger.info("OIDC verified for OPS request", extra={"email": claims.get("email"), "sample_key": "ops.oidc_verified"})
         return claims
 
     except ValueError as e:
-        logger.error(f"OIDC Token Verification Error: {str(e)}")
+        logger.error("OIDC Token Verification Error", extra={"error": str(e)})
         raise HTTPException(status_code=401, detail="Invalid OPS access token")
@@ -1,38 +1,36 @@
-from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Optional
-from firebase_admin import firestore
 from app.api.deps import require_admin, UserRecord
-from app.api.schemas import AdminOrderListResponse, AdminOrderListItem, AdminOrderStatusUpdateRequest
-from app.db.firestore import get_db
-from app.db.collections import ORDERS, ORDER_PUBLIC, ORDER_STATUS_HISTORY, ADMIN_AUDIT_LOGS
-from app.core.state_machine import is_valid_transition, get_public_step_label
+from app.api.schemas import (
+    AdminOrderListResponse, AdminOrderListItem, AdminOrderStatusUpdateRequest,
+    AdminBulkStatusUpdateRequest, AdminBulkStatusUpdateResponse, AdminBulkStatusResult, AdminOrderStatsResponse
+)
+from app.db.firestore import get_async_db
+from app.db.repositories import OrderRepository, StatsRepository, BULK_UPDATED
+from app.core.cache import order_public_cache
+from app.core.utils import encode_page_cursor, decode_page_cursor
 
 router = APIRouter(dependencies=[Depends(require_admin)])
 
 @router.get("/orders", response_model=AdminOrderListResponse)
-def list_orders(
+async def list_orders(
     status_filter: Optional[str] = Query(None, alias="status"),
     limit: int = Query(20, ge=1, le=100),
-    cursor: Optional[str] = Query(None, description="Document ID of the last item for pagination")
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
 ):
-    db = get_db()
-    
-    # Base query: Order by created_at descending
-    query = db.collection(ORDERS).order_by("created_at", direction=firestore.Query.DESCENDING)
-    
-    # Filtering (Requires Composite Indexes in Firestore)
-    if status_filter:
-        query = query.where(filter=firestore.FieldFilter("status", "==", status_filter))
-        
-    query = query.limit(limit)
-    
-    # Cursor Pagination logic
-    if cursor:
-        cursor_doc = db.collection(ORDERS).document(cursor).get()
-        if cursor_doc.exists:
-            query = query.start_after(cursor_doc)
-            
-    docs = list(query.get())
+    try:
+        after = decode_page_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    orders = OrderRepository(get_async_db())
+    docs = await orders.list_page(status_filter, limit, after)
+
+    # Orders from before recipient_summary was stored (and not anonymized): one masked batch read
+    legacy_ids = [
+        doc.id for doc in docs
+        if "recipient_summary" not in doc.to_dict() and not doc.to_dict().get("pii_cleaned_at")
+    ]
+    legacy_summaries = await orders.get_recipient_summaries(legacy_ids) if legacy_ids else {}
     
     items = []
     for doc in docs:
@@ -44,11 +42,8 @@ def list_orders(
         c_str = created_at.isoformat() if hasattr(created_at, "isoformat") else str(created_at)
         s_str = status_updated_at.isoformat() if hasattr(status_updated_at, "isoformat") else str(status_updated_at)
         
-        # Safely extract minimal summary
-        recipient = data.get("recipient", {})
-        # Note: A real app might parse the city/state, here we just truncate safely
-        addr = recipient.get("address", "")
-        summary = addr[:30] + "..." if len(addr) > 30 else addr
+        # Minimal summary only: the field mask keeps recipient and letter_content off the wire
+        summary = data.get("recipient_summary", legacy_summaries.get(doc.id))
         
         items.append(AdminOrderListItem(
             order_id=doc.id,
@@ -63,7 +58,8 @@ def list_orders(
         ))
         
     has_more = len(docs) == limit
-    next_cursor = docs[-1].id if has_more and docs else None
+    # Carries the last item's sort values, so it stays valid even if that order is deleted
+    next_cursor = encode_page_cursor(docs[-1].get("created_at"), docs[-1].id) if has_more and docs else None
     
     return AdminOrderListResponse(
         items=items,
@@ -71,97 +67,30 @@ def list_orders(
         has_more=has_more
     )
 
+@router.get("/stats", response_model=AdminOrderStatsResponse)
+async def order_stats():
+    """
+    Dashboard counts per order status. Reads the counter shards only (constant cost);
+    /api/ops/stats-reconcile corrects any drift from aggregation counts.
+    """
+    counts = await StatsRepository(get_async_db()).get_status_counts()
+    return AdminOrderStatsResponse(counts=counts, total=sum(counts.values()))
+
 @router.patch("/orders/{order_id}/status")
-def update_order_status(
+async def update_order_status(
     order_id: str, 
     payload: AdminOrderStatusUpdateRequest,
     admin_user: UserRecord = Depends(require_admin)
 ):
-    db = get_db()
-    
-    # Run the entire status update inside a Firestore Transaction
-    # This guarantees Optimistic Locking + Atomic Fan-out Writes
-    transaction = db.transaction()
-    order_ref = db.collection(ORDERS).document(order_id)
-    
-    @firestore.transactional
-    def update_in_transaction(transaction, order_ref):
-        snapshot = order_ref.get(transaction=transaction)
-        
-        if not snapshot.exists:
-            raise HTTPException(status_code=404, detail="Order not found")
-            
-        data = snapshot.to_dict()
-        current_status = data.get("status")
-        tracking_code = data.get("tracking_code")
-        
-        # 1. Optimistic Locking Check (Expected vs Current)
-        if current_status != payload.expected_from_status:
-            # According to specs, return a 409 Conflict with details
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail={
-                    "code": "STATUS_MISMATCH",
-                    "current_status": current_status,
-                    "message": f"Expected status {payload.expected_from_status} but order is currently in {current_status}"
-                }
-            )
-            
-        # 2. State Machine Rule Engine Check
-        if not is_valid_transition(current_status, payload.to_status):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid transition from {current_status} to {payload.to_status}"
-            )
-            
-        timestamp = firestore.SERVER_TIMESTAMP
-        
-        # 3. Perform the Atomic Writes
-        
-        # a) orders.status
-        transaction.update(order_ref, {
-            "status": payload.to_status,
-            "status_updated_at": timestamp,
-            "status_updated_by": admin_user.uid
-        })
-        
-        # b) order_public (NO PII)
-        public_ref = db.collection(ORDER_PUBLIC).document(tracking_code)
-        transaction.update(public_ref, {
-            "status": payload.to_status,
-            "status_updated_at": timestamp,
-            "public_step_label": get_public_step_label(payload.to_status)
-        })
-        
-        # c) order_status_history
-        history_ref = db.collection(ORDER_STATUS_HISTORY).document()
-        transaction.set(history_ref, {
-            "order_id": order_id,
-            "from_status": current_status,
-            "to_status": payload.to_status,
-            "actor": f"admin_{admin_user.uid}",
-            "source": "admin_panel",
-            "timestamp": timestamp,
-            "note": payload.note
-        })
-        
-        # d) admin_audit_logs
-        audit_ref = db.collection(ADMIN_AUDIT_LOGS).document()
-        transaction.set(audit_ref, {
-            "action": "ORDER_STATUS_CHANGE",
-            "order_id": order_id,
-            "actor": admin_user.uid,
-            "metadata": {
-                "from": current_status,
-                "to": payload.to_status
-            },
-            "timestamp": timestamp
-        })
-        
-        return current_status
-        
-    # Execute transaction
-    old_status = update_in_transaction(transaction, order_ref)
+    # Runs inside a Firestore Transaction: Optimistic Locking + Atomic Fan-out Writes
+    old_status, tracking_code = await OrderRepository(get_async_db()).transition_status(
+        order_id,
+        expected_from_status=payload.expected_from_status,
+        to_status=payload.to_status,
+        actor_uid=admin_user.uid,
+        note=payload.note
+    )
+    order_public_cache.invalidate(tracking_code)
     
     return {
         "message": "Status updated successfully",
@@ -169,3 +98,40 @@ def update_order_status(
         "previous_status": old_status,
         "new_status": payload.to_status
     }
+
+@router.post("/orders/bulk-status", response_model=AdminBulkStatusUpdateResponse)
+async def bulk_update_order_status(
+    payload: AdminBulkStatusUpdateRequest,
+    admin_user: UserRecord = Depends(require_admin)
+):
+    """
+    Moves a whole print/PTT batch in one call. Each order is validated on its own
+    (optimistic lock + state machine); failures are reported per order and never
+    block the rest of the batch.
+    """
+    results = await OrderRepository(get_async_db()).bulk_transition_status(
+        [(item.order_id, item.expected_from_status) for item in payload.items],
+        to_status=payload.to_status,
+        actor_uid=admin_user.uid,
+        note=payload.note
+    )
+
+    updated = [r for r in results if r["result"] == BULK_UPDATED]
+    for r in updated:
+        order_public_cache.invalidate(r["tracking_code"])
+
+    return AdminBulkStatusUpdateResponse(
+        to_status=payload.to_status,
+        updated_count=len(updated),
+        failed_count=len(results) - len(updated),
+        results=[
+            AdminBulkStatusResult(
+                order_id=r["order_id"],
+                result=r["result"],
+                # After a successful move the order is in the target status
+                current_status=payload.to_status if r["result"] == BULK_UPDATED else r["current_status"],
+                message=r["message"]
+            )
+            for r in results
+        ]
+    )
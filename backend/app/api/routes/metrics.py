@@ -0,0 +1,17 @@
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Response, status
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.core.config import settings
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus text exposition of app/core/metrics.py (plus process metrics)."""
+    # When a scrape token is configured, only the scraper may read internal numbers
+    if settings.METRICS_BEARER_TOKEN:
+        expected = f"Bearer {settings.METRICS_BEARER_TOKEN}"
+        if not hmac.compare_digest(authorization or "", expected):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,191 +1,258 @@
 from fastapi import APIRouter, Depends, HTTPException
-from app.api.schemas_ops import PdfGenerateJobPayload, PiiCleanupJobPayload, OpsJobResponse
+from datetime import datetime, timezone
+from typing import Optional
+from app.api.schemas_ops import PdfGenerateJobPayload, PiiCleanupJobPayload, PrintBatchJobPayload, StatsReconcileJobPayload, OutboxDispatchJobPayload, OpsJobResponse
 from app.api.deps_ops import verify_oidc_token
-from app.db.firestore import get_db
-from app.db.collections import ORDERS, ADMIN_AUDIT_LOGS
+from app.db.firestore import get_async_db
+from app.db.repositories import OrderRepository, JobRepository, StatsRepository
 from firebase_admin import firestore
 from app.core.logging import logger
+from app.core.cache import order_public_cache
+from app.core.metrics import PDF_RENDER_DURATION
+from app.services.pdf_storage import get_pdf_storage, letter_key
+from app.services.pii_cleanup_service import pii_cleanup_service
+from app.services.outbox_dispatcher import outbox_dispatcher
+from app.services.pdf_worker import (
+    pdf_render_pool, RenderPoolSaturated, render_letter_to_storage, build_print_batch_to_storage
+)
+from app.core.config import settings
 
 router = APIRouter()
 
+def _saturated(job_id: Optional[str]) -> HTTPException:
+    logger.warning("PDF render pool saturated, deferring job", extra={"job_id": job_id, "pending": pdf_render_pool.pending})
+    # Cloud Tasks treats 503 as retryable and backs off; no job state was touched
+    return HTTPException(
+        status_code=503,
+        detail="PDF render capacity exhausted, retry later",
+        headers={"Retry-After": str(settings.PDF_RENDER_RETRY_AFTER_SECONDS)}
+    )
+
 @router.post("/pdf-generate", response_model=OpsJobResponse)
-def ops_pdf_generate(payload: PdfGenerateJobPayload, claims: dict = Depends(verify_oidc_token)):
+async def ops_pdf_generate(payload: PdfGenerateJobPayload, claims: dict = Depends(verify_oidc_token)):
     """
     Called asynchronously by Cloud Tasks when an order is PAID.
     Must be idempotent. Generates a PDF and updates the order status.
     """
-    db = get_db()
-    
-    # We use a transaction to safely handle the optimistic "PENDING" to "GENERATING" state lock
-    transaction = db.transaction()
-    order_ref = db.collection(ORDERS).document(payload.order_id)
-    job_ref = db.collection("jobs").document(payload.job_id)
+    # Take a render slot before the GENERATING lock, so a deferred task leaves nothing locked
+    try:
+        with pdf_render_pool.reserve():
+            return await _generate_pdf(payload)
+    except RenderPoolSaturated:
+        raise _saturated(payload.job_id)
+
+async def _generate_pdf(payload: PdfGenerateJobPayload) -> OpsJobResponse:
+    jobs = JobRepository(get_async_db())
     
-    @firestore.transactional
-    def process_pdf_job(transaction, order_ref, job_ref):
-         # Check if job was already processed (Idempotency Key)
-         job_snap = job_ref.get() # mockfirestore compatibility
-         if job_snap.exists and job_snap.to_dict().get("status") == "SUCCEEDED":
-              return OpsJobResponse(message="No-op (Job already succeeded)", status="SUCCEEDED", job_id=payload.job_id)
-              
-         order_snap = order_ref.get() # mockfirestore compatibility
-         if not order_snap.exists:
-              raise HTTPException(status_code=404, detail="Order not found for PDF job")
-              
-         order_data = order_snap.to_dict()
-         current_pdf_status = order_data.get("pdf_status")
-         
-         # Idempotency checks based on domain model
-         if current_pdf_status == "READY":
-             return OpsJobResponse(message="No-op (PDF already READY)", status="SUCCEEDED", job_id=payload.job_id)
-             
-         if current_pdf_status == "GENERATING":
-             # Extremely edge case where concurrent tasks picked this up OR previous attempt crashed mid-generation
-             # Best practice for Cloud Tasks is returning an error (e.g. 409) so it retries later instead of colliding.
-             raise HTTPException(status_code=409, detail="PDF generation currently locked / in progress")
-         
-         # Assuming valid starting state: None or "PENDING" or "FAILED"
-         # 1. Update state to GENERATING inside transaction
-         transaction.update(order_ref, {
-             "pdf_status": "GENERATING",
-             "pdf_updated_at": firestore.SERVER_TIMESTAMP
-         })
-         
-         # 2. Record Job start
-         transaction.set(job_ref, {
-             "job_type": payload.job_type,
-             "order_id": payload.order_id,
-             "attempt": payload.attempt,
-             "status": "RUNNING",
-             "created_at": firestore.SERVER_TIMESTAMP
-         })
-         
-         return "PROCEED_GENERATION"
-         
-    # 1. Execute DB State check
+    # 1. Execute DB State check: transaction safely handles the optimistic "PENDING" to "GENERATING" state lock
     try:
-        init_result = process_pdf_job(transaction, order_ref, job_ref)
-        if isinstance(init_result, OpsJobResponse):
-            return init_result # Caught by idempotency
+        no_op_message, order_data, job_id = await jobs.start_pdf_job(payload.order_id, payload.job_type, payload.attempt)
+        if no_op_message:
+            return OpsJobResponse(message=no_op_message, status="SUCCEEDED", job_id=job_id) # Caught by idempotency
     except Exception as e:
-        logger.error(f"Failed to acquire PDF generation lock for {payload.order_id}: {str(e)}")
+        logger.error("Failed to acquire PDF generation lock", extra={"order_id": payload.order_id, "job_id": payload.job_id, "error": str(e)})
         raise # Reraise HTTPExceptions directly (e.g. 409)
         
     # 2. Actually Generate PDF (Outside transaction to not hold locks during slow I/O)
-    logger.info(f"Producing letter PDF for Order: {payload.order_id}")
+    logger.info("Producing letter PDF", extra={"order_id": payload.order_id, "job_id": job_id, "requested_job_id": payload.job_id})
     try:
         # Staging-only controlled failure for E2E testing (N7) — NEVER in production
-        from app.core.config import settings
-        if settings.ENV != "production" and settings.ENV in ["staging", "test"] and payload.job_id.startswith("FAIL_TEST_"):
-            logger.warning(f"CONTROLLED FAIL TRIGGER in {settings.ENV}: {payload.job_id}")
+        if settings.ENV != "production" and settings.ENV in ["staging", "test"] and (payload.job_id or "").startswith("FAIL_TEST_"):
+            logger.warning("CONTROLLED FAIL TRIGGER", extra={"env": settings.ENV, "job_id": payload.job_id})
             raise Exception(f"Controlled E2E test failure for job {payload.job_id}")
         
-        # TODO: integrate with real PDF service when available (ReportLab / Playwright etc)
-        mock_pdf_gs_path = f"gs://emektup-sandbox/orders/{payload.order_id}/generated/letter.pdf"
-        
-        # 3. Finalize Job and Order State
-        db.collection("jobs").document(payload.job_id).set({
-            "status": "SUCCEEDED",
-            "updated_at": firestore.SERVER_TIMESTAMP
-        }, merge=True)
+        # Rendering is CPU-bound and the upload is blocking I/O: keep both off the event loop
+        storage_key = letter_key(payload.order_id)
+        render = await pdf_render_pool.run(render_letter_to_storage, storage_key, order_data, payload.tracking_code)
+        PDF_RENDER_DURATION.observe(render.render_ms / 1000)
         
-        order_ref.set({
-            "pdf_status": "READY",
-            "pdf_path": mock_pdf_gs_path,
-            "pdf_updated_at": firestore.SERVER_TIMESTAMP
-        }, merge=True)
+        # 3. Finalize Job and Order State (render stats give a per-job throughput baseline)
+        await jobs.finish_pdf_job(job_id, payload.order_id, get_pdf_storage().uri(storage_key), {
+            "render_ms": render.render_ms,
+            "pdf_bytes": render.size_bytes,
+            "pdf_pages": render.pages
+        })
+        if payload.tracking_code:
+            order_public_cache.invalidate(payload.tracking_code)
         
-        logger.info(f"PDF Job {payload.job_id} successfully mapped.")
-        return OpsJobResponse(message="PDF successfully generated", status="SUCCEEDED", job_id=payload.job_id)
+        logger.info("PDF Job successfully mapped", extra={
+            "order_id": payload.order_id, "job_id": job_id,
+            "render_ms": render.render_ms, "pdf_bytes": render.size_bytes, "pdf_pages": render.pages
+        })
+        return OpsJobResponse(message="PDF successfully generated", status="SUCCEEDED", job_id=job_id)
         
     except Exception as e:
         # Failure tracking
-        logger.error(f"PDF Generation explicitly failed for job {payload.job_id}: {str(e)}")
+        logger.error("PDF Generation explicitly failed", extra={"order_id": payload.order_id, "job_id": job_id, "error": str(e)})
         # Save failure context for Dead Letter processing
-        db.collection("jobs").document(payload.job_id).set({
-             "status": "FAILED",
-             "last_error": str(e),
-             "updated_at": firestore.SERVER_TIMESTAMP
-        }, merge=True)
-        order_ref.set({
-             "pdf_status": "FAILED",
-             "pdf_error_message": str(e),
-             "pdf_updated_at": firestore.SERVER_TIMESTAMP
-        }, merge=True)
+        await jobs.fail_pdf_job(job_id, payload.order_id, str(e))
+        if payload.tracking_code:
+            order_public_cache.invalidate(payload.tracking_code)
         # Note: We return 500 so Cloud Tasks automatically retries (following backoff config)
         raise HTTPException(status_code=500, detail="PDF Service failure")
 
 
 @router.post("/pii-cleanup", response_model=OpsJobResponse)
-def ops_pii_cleanup(payload: PiiCleanupJobPayload, claims: dict = Depends(verify_oidc_token)):
+async def ops_pii_cleanup(payload: PiiCleanupJobPayload, claims: dict = Depends(verify_oidc_token)):
     """
     Called asynchronously by Cloud Scheduler every night.
-    Anonymizes old, completed orders to respect PII retentions.
+    Anonymizes old, completed orders to respect PII retentions. Large backlogs
+    are drained over several calls with the same job_id (status "RUNNING" until done).
     """
-    db = get_db()
+    orders = OrderRepository(get_async_db())
     try:
-        logger.info(f"Cron PII Cleanup triggered. Cutoff days: {payload.cutoff_days}, Dry run: {payload.dry_run}")
+        logger.info("Cron PII Cleanup triggered", extra={"job_id": payload.job_id, "cutoff_days": payload.cutoff_days, "dry_run": payload.dry_run})
         
         if payload.dry_run:
-            # For v0.1: just simulating read count
-            # Ideally: Query where status IN [SHIPPED, DELIVERED] and created_at < (now - cutoff_days)
-            simulate_count = 5
-            logger.info(f"DRY RUN: Would have cleared PII from {simulate_count} records.")
-            return OpsJobResponse(message=f"Dry run success. Est records: {simulate_count}", status="SUCCEEDED", job_id=payload.job_id)
+            # Aggregation counts only: no candidate documents are read
+            estimate = await pii_cleanup_service.estimate(get_async_db(), payload.cutoff_days)
+            logger.info("DRY RUN: PII cleanup estimate", extra={
+                "job_id": payload.job_id, "estimated_count": estimate["total"],
+                "by_status": estimate["by_status"], "by_age": estimate["by_age"]
+            })
+            return OpsJobResponse(
+                message=f"Dry run success. Est records: {estimate['total']}",
+                status="SUCCEEDED",
+                job_id=payload.job_id,
+                details=estimate
+            )
             
         else:
-            # Real PII cleanup: anonymize eligible orders
-            from datetime import datetime, timedelta, timezone
-            cutoff_date = datetime.now(timezone.utc) - timedelta(days=payload.cutoff_days)
-            
-            # Query eligible orders: SHIPPED or CANCELLED, created before cutoff
-            eligible_statuses = ["SHIPPED", "CANCELLED"]
-            cleaned_count = 0
-            cleaned_order_ids = []
-            
-            for eligible_status in eligible_statuses:
-                query = (db.collection(ORDERS)
-                    .where("status", "==", eligible_status)
-                    .limit(100))
-                
-                for doc in query.stream():
-                    order_data = doc.to_dict()
-                    # Filter by cutoff date in Python (avoids composite index)
-                    if payload.cutoff_days > 0:
-                        created_at = order_data.get("created_at")
-                        if created_at:
-                            # Firestore timestamps have a .replace method (they're datetime-like)
-                            try:
-                                if created_at > cutoff_date:
-                                    continue  # Not old enough
-                            except TypeError:
-                                pass  # If comparison fails, include the record
-                    # Only clean if PII fields still exist (idempotency)
-                    if order_data.get("recipient") or order_data.get("letter_content"):
-                        doc.reference.update({
-                            "recipient": firestore.DELETE_FIELD,
-                            "letter_content": firestore.DELETE_FIELD,
-                            "notes": firestore.DELETE_FIELD,
-                            "pii_cleaned_at": firestore.SERVER_TIMESTAMP
-                        })
-                        cleaned_count += 1
-                        cleaned_order_ids.append(doc.id)
-            
-            # Write audit log
-            audit_ref = db.collection(ADMIN_AUDIT_LOGS).document()
-            audit_ref.set({
+            result = await pii_cleanup_service.run(
+                get_async_db(), payload.job_id, payload.cutoff_days, payload.requested_by
+            )
+            if result.already_done:
+                return OpsJobResponse(message="No-op (PII cleanup already completed)", status="SUCCEEDED", job_id=payload.job_id)
+
+            # Write audit log (one per invocation)
+            await orders.add_audit_log({
                 "action": "PII_CLEANUP",
                 "actor": "system:scheduler",
                 "job_id": payload.job_id,
-                "cleaned_count": cleaned_count,
-                "cleaned_order_ids": cleaned_order_ids[:20],  # cap for audit size
+                "cleaned_count": result.cleaned_count,
+                "cleaned_order_ids": result.cleaned_order_ids[:20],  # cap for audit size
                 "cutoff_days": payload.cutoff_days,
+                "completed": result.done,
                 "timestamp": firestore.SERVER_TIMESTAMP
             })
-            
-            logger.info(f"PII Cleanup: anonymized {cleaned_count} orders")
-            return OpsJobResponse(message=f"PII cleaned from {cleaned_count} records.", status="SUCCEEDED", job_id=payload.job_id)
+
+            if not result.done:
+                # Checkpointed: the next call with the same job_id continues from here
+                return OpsJobResponse(
+                    message=f"PII cleaned from {result.cleaned_count} records; more remaining, resume with the same job_id.",
+                    status="RUNNING",
+                    job_id=payload.job_id
+                )
+            logger.info("PII Cleanup: anonymized orders", extra={"job_id": payload.job_id, "cleaned_count": result.total_cleaned_count})
+            return OpsJobResponse(message=f"PII cleaned from {result.total_cleaned_count} records.", status="SUCCEEDED", job_id=payload.job_id)
             
     except Exception as e:
-        logger.error(f"Cron PII Cleanup failed: {str(e)}")
+        logger.error("Cron PII Cleanup failed", extra={"job_id": payload.job_id, "error": str(e)})
         raise HTTPException(status_code=500, detail="Cleanup sweep failed")
+
+
+@router.post("/print-batch", response_model=OpsJobResponse)
+async def ops_print_batch(payload: PrintBatchJobPayload, claims: dict = Depends(verify_oidc_token)):
+    """
+    Called by Cloud Scheduler before each print run.
+    Merges every READY_FOR_PRINT order with a READY PDF into print files of at most
+    PRINT_BATCH_PART_MAX_ORDERS letters (cover + separator page per letter) and
+    records a print_batches document listing them.
+    Idempotent per job_id.
+    """
+    orders = OrderRepository(get_async_db())
+    jobs = JobRepository(get_async_db())
+    batch_id = payload.job_id
+
+    if await jobs.get_print_batch(batch_id):
+        return OpsJobResponse(message="No-op (Print batch already recorded)", status="SUCCEEDED", job_id=batch_id)
+
+    candidates = await orders.list_print_ready(payload.max_orders or settings.PRINT_BATCH_MAX_ORDERS)
+    if not candidates:
+        return OpsJobResponse(message="No orders ready for print", status="SUCCEEDED", job_id=batch_id)
+
+    members = [
+        {"order_id": order_id, "tracking_code": data.get("tracking_code"), "recipient": data.get("recipient")}
+        for order_id, data in sorted(candidates, key=lambda item: str(item[1].get("created_at", "")))
+    ]
+    created_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+
+    try:
+        # Parsing and merging PDFs is blocking: keep it off the event loop, within the render budget
+        with pdf_render_pool.reserve():
+            result = await pdf_render_pool.run(build_print_batch_to_storage, batch_id, created_at, members)
+        recorded = await jobs.record_print_batch(batch_id, [m["order_id"] for m in members], {
+            "status": "READY",
+            "pdf_parts": [get_pdf_storage().uri(key) for key in result.parts],
+            "tracking_codes": [m["tracking_code"] for m in members],
+            "pages": result.pages,
+            "pdf_bytes": result.size_bytes,
+            "build_ms": result.build_ms,
+            "requested_by": payload.requested_by
+        })
+    except RenderPoolSaturated:
+        raise _saturated(batch_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Print batch failed", extra={"job_id": batch_id, "error": str(e)})
+        # 500 so Cloud Tasks / Scheduler retries; the file is rebuilt under the same batch ID
+        raise HTTPException(status_code=500, detail="Print batch failure")
+
+    if not recorded:
+        return OpsJobResponse(message="No-op (Print batch already recorded)", status="SUCCEEDED", job_id=batch_id)
+
+    logger.info("Print batch built", extra={
+        "job_id": batch_id, "order_count": len(members), "parts": len(result.parts),
+        "pages": result.pages, "pdf_bytes": result.size_bytes, "build_ms": result.build_ms
+    })
+    return OpsJobResponse(
+        message=f"Print batch built with {len(members)} orders ({result.pages} pages in {len(result.parts)} files).",
+        status="SUCCEEDED",
+        job_id=batch_id
+    )
+
+
+@router.post("/stats-reconcile", response_model=OpsJobResponse)
+async def ops_stats_reconcile(payload: StatsReconcileJobPayload, claims: dict = Depends(verify_oidc_token)):
+    """
+    Called by Cloud Scheduler (e.g. nightly). Recomputes the dashboard status
+    counters from count() aggregations and reports the drift it corrected.
+    Safe to repeat: it always writes the current exact counts.
+    """
+    try:
+        counts, drift = await StatsRepository(get_async_db()).reconcile_status_counts()
+    except Exception as e:
+        logger.error("Status counter reconciliation failed", extra={"job_id": payload.job_id, "error": str(e)})
+        raise HTTPException(status_code=500, detail="Stats reconciliation failed")
+
+    # Drift should stay empty; anything else points at a status write path that skips the counters
+    log = logger.warning if drift else logger.info
+    log("Status counters reconciled", extra={"job_id": payload.job_id, "counts": counts, "drift": drift})
+    return OpsJobResponse(
+        message=f"Status counters reconciled ({sum(counts.values())} orders).",
+        status="SUCCEEDED",
+        job_id=payload.job_id,
+        details={"counts": counts, "drift": drift}
+    )
+
+
+@router.post("/outbox-dispatch", response_model=OpsJobResponse)
+async def ops_outbox_dispatch(payload: OutboxDispatchJobPayload, claims: dict = Depends(verify_oidc_token)):
+    """
+    Called by Cloud Scheduler (e.g. every minute). Delivers outbox entries the
+    post-webhook drain missed or could not deliver yet (crash, Cloud Tasks errors).
+    Safe to repeat: tasks are named after their entry.
+    """
+    try:
+        result = await outbox_dispatcher.drain(get_async_db())
+    except Exception as e:
+        logger.error("Outbox dispatch failed", extra={"job_id": payload.job_id, "error": str(e)})
+        raise HTTPException(status_code=500, detail="Outbox dispatch failed")
+
+    return OpsJobResponse(
+        message=f"Outbox drained ({result.dispatched} dispatched, {result.retried} rescheduled).",
+        status="SUCCEEDED",
+        job_id=payload.job_id,
+        details={"dispatched": result.dispatched, "retried": result.retried, "batches": result.batches}
+    )
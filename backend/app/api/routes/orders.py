@@ -1,38 +1,41 @@
+from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Request, HTTPException, status
 from app.api.schemas import OrderCreateRequest, OrderCreateResponse, OrderPublicResponse
 from app.core.rate_limit import limiter
-from app.core.utils import generate_tracking_code
-from app.db.firestore import get_db
-from app.db.collections import ORDERS, ORDER_PUBLIC, ORDER_STATUS_HISTORY, ADMIN_AUDIT_LOGS
+from app.core.cache import order_public_cache, MISSING
+from app.core.config import settings
+from app.core.utils import generate_tracking_code, idempotency_key_id, recipient_summary
+from app.db.firestore import get_async_db
+from app.db.repositories import OrderRepository
 from firebase_admin import firestore
 
 router = APIRouter()
 
+def _is_expired(idempotency_data: dict) -> bool:
+    expires_at = idempotency_data.get("expires_at")
+    return expires_at is not None and expires_at <= datetime.now(timezone.utc)
+
 @router.post("/create", response_model=OrderCreateResponse, status_code=status.HTTP_201_CREATED)
 @limiter.limit("5/minute")
-def create_order(request: Request, payload: OrderCreateRequest):
-    db = get_db()
-    
-    # 1. Simple Idempotency by client_request_id (check if exists)
+async def create_order(request: Request, payload: OrderCreateRequest):
+    orders = OrderRepository(get_async_db())
+
+    # 1. Idempotency by client_request_id: single point read of idempotency_keys/{key}
+    key_id = None
+    expired_snapshot = None
     if payload.client_request_id:
-        existing_orders = list(db.collection(ORDERS).where("client_request_id", "==", payload.client_request_id).limit(1).get())
-        if existing_orders:
-            existing = existing_orders[0].to_dict()
-            return OrderCreateResponse(
-                order_id=existing_orders[0].id,
-                tracking_code=existing["tracking_code"],
-                status=existing["status"]
-            )
+        key_id = idempotency_key_id("orders.create", payload.client_request_id)
+        idempotency_snap = await orders.get_idempotency_record(key_id)
+        if idempotency_snap.exists:
+            if not _is_expired(idempotency_snap.to_dict()):
+                return OrderCreateResponse(**idempotency_snap.to_dict()["response"])
+            expired_snapshot = idempotency_snap
 
     # 2. Setup Order Information
     tracking_code = generate_tracking_code()
-    order_ref = db.collection(ORDERS).document()
-    order_id = order_ref.id
+    order_id = orders.new_order_id()
     timestamp = firestore.SERVER_TIMESTAMP
-    
-    # 3. Firestore Batch (Atomic Operation for the 4 records)
-    batch = db.batch()
-    
+
     # a) orders/{orderId} (PRIVATE)
     order_data = {
         "status": "CREATED",
@@ -41,77 +44,80 @@ def create_order(request: Request, payload: OrderCreateRequest):
         "total_amount": 0.0,
         "currency": "TRY",
         "recipient": payload.recipient.model_dump(),
+        # Precomputed for listings, which fetch it via a field mask (see ADMIN_LIST_FIELDS)
+        "recipient_summary": recipient_summary(payload.recipient.model_dump()),
         "letter_content": payload.letter_content,
         "notes": payload.notes,
         "tracking_code": tracking_code,
         "client_request_id": payload.client_request_id,
+        # Queried by the PII retention sweep (app/services/pii_cleanup_service.py)
+        "pii_anonymized": False,
         "created_at": timestamp,
         "status_updated_at": timestamp
     }
-    batch.set(order_ref, order_data)
-    
+
     # b) order_public/{tracking_code} (PUBLIC) - STRICTLY NO PII
-    public_ref = db.collection(ORDER_PUBLIC).document(tracking_code)
     public_data = {
         "order_id": order_id,
         "status": "CREATED",
         "created_at": timestamp,
         "public_step_label": "Sipariş Alındı"
     }
-    batch.set(public_ref, public_data)
-    
-    # c) order_status_history/{history_id}
-    history_ref = db.collection(ORDER_STATUS_HISTORY).document()
-    history_data = {
-        "order_id": order_id,
-        "from_status": None,
-        "to_status": "CREATED",
-        "actor": "system",
-        "timestamp": timestamp
-    }
-    batch.set(history_ref, history_data)
-    
-    # d) admin_audit_logs/{log_id}
-    audit_ref = db.collection(ADMIN_AUDIT_LOGS).document()
-    audit_data = {
-        "action": "ORDER_CREATED",
-        "order_id": order_id,
-        "actor": "system",
-        "timestamp": timestamp
-    }
-    batch.set(audit_ref, audit_data)
-    
-    # 4. Commit batch
-    batch.commit()
-    
-    return OrderCreateResponse(
-        order_id=order_id,
-        tracking_code=tracking_code,
-        status="CREATED"
-    )
+
+    response = OrderCreateResponse(order_id=order_id, tracking_code=tracking_code, status="CREATED")
+    idempotency_data = None
+    if key_id:
+        idempotency_data = {
+            "scope": "orders.create",
+            "response": response.model_dump(),
+            "created_at": timestamp,
+            # Firestore TTL policy on expires_at purges old keys
+            "expires_at": datetime.now(timezone.utc) + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+        }
+
+    # 3. Firestore Batch (Atomic fan-out incl. the create-if-absent idempotency key)
+    created = await orders.create(order_id, order_data, public_data, key_id, idempotency_data, expired_snapshot)
+    if not created:
+        # A concurrent request with the same key won the race: replay its response
+        stored = await orders.get_idempotency_record(key_id)
+        return OrderCreateResponse(**stored.to_dict()["response"])
+
+    # Drop any negative (404) cache entry a tracker may have left for this code
+    order_public_cache.invalidate(tracking_code)
+
+    return response
 
 @router.get("/track/{tracking_code}", response_model=OrderPublicResponse)
 @limiter.limit("20/minute")
-def track_order(request: Request, tracking_code: str):
-    db = get_db()
-    
-    public_doc = db.collection(ORDER_PUBLIC).document(tracking_code).get()
-    
-    if not public_doc.exists:
+async def track_order(request: Request, tracking_code: str):
+    # Read-through cache: repeat lookups (including unknown codes) skip Firestore
+    cached = order_public_cache.get(tracking_code)
+    if cached is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Tracking code not found"
         )
-        
-    data = public_doc.to_dict()
-    
+    if cached is not MISSING:
+        return cached
+
+    data = await OrderRepository(get_async_db()).get_public(tracking_code)
+
+    if data is None:
+        order_public_cache.set(tracking_code, None, ttl=settings.TRACKING_CACHE_NEGATIVE_TTL_SECONDS)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Tracking code not found"
+        )
+
     # Format the server timestamp for the response
     created_at_dt = data.get("created_at")
     created_at_str = created_at_dt.isoformat() if hasattr(created_at_dt, "isoformat") else str(created_at_dt)
-    
-    return OrderPublicResponse(
+
+    response = OrderPublicResponse(
         tracking_code=tracking_code,
         status=data.get("status", "UNKNOWN"),
         created_at=created_at_str,
         public_step_label=data.get("public_step_label")
     )
+    order_public_cache.set(tracking_code, response)
+    return response
@@ -1,88 +1,35 @@
+import math
 from fastapi import APIRouter, Request, HTTPException, Header
 from app.api.schemas import PaymentCreateIntentRequest, PaymentCreateIntentResponse, PaymentWebhookPayload, PaymentStatusResponse
 from app.core.rate_limit import limiter
 from app.services.payment_service import payment_service
-from app.db.firestore import get_db
-from app.db.collections import ORDERS, ORDER_PUBLIC, ORDER_STATUS_HISTORY, ADMIN_AUDIT_LOGS, PAYMENTS
-from app.core.state_machine import OrderStatus, get_public_step_label
-from firebase_admin import firestore
+from app.services.iyzico_client import ProviderUnavailable
+from app.services.outbox_dispatcher import outbox_dispatcher
+from app.db.firestore import get_async_db
+from app.db.repositories import OrderRepository, PaymentRepository
+from app.core.cache import order_public_cache
 from fastapi import BackgroundTasks
 router = APIRouter()
 
 @router.post("/create-intent", response_model=PaymentCreateIntentResponse)
 @limiter.limit("5/minute")
-def create_payment_intent(request: Request, payload: PaymentCreateIntentRequest):
-    db = get_db()
+async def create_payment_intent(request: Request, payload: PaymentCreateIntentRequest):
+    payments = PaymentRepository(get_async_db())
     
-    # Run in transaction to prevent double-click double-charge
-    transaction = db.transaction()
-    order_ref = db.collection(ORDERS).document(payload.order_id)
-    
-    @firestore.transactional
-    def process_intent(transaction, order_ref):
-        snapshot = order_ref.get(transaction=transaction)
-        if not snapshot.exists:
-            raise HTTPException(status_code=404, detail="Order not found")
-            
-        data = snapshot.to_dict()
-        
-        # Check current payment status
-        if data.get("payment_status") in ["PAID", "PAYMENT_PENDING"]:
-            # If already pending, we could technically just return the existing token
-            # But for simplicity & idempotency, we query if an active payment exists
-            existing_payments = list(db.collection(PAYMENTS).where("order_id", "==", payload.order_id).where("status", "==", "PENDING").limit(1).get())
-            if existing_payments:
-                existing_payment = existing_payments[0].to_dict()
-                return {
-                    "token": existing_payment.get("token", ""),
-                    "checkout_url": existing_payment.get("checkout_url", ""),
-                    "status": "success"
-                }
-
-            if data.get("payment_status") == "PAID":
-                 raise HTTPException(status_code=400, detail="Order is already paid")
-                
-        # Calculate amount from backend (trust only backend)
-        # Note: In a real app we'd sum cart items here. For v0.1 we use the saved total_amount or default.
-        amount = data.get("total_amount", 100.0) 
-        if amount <= 0:
-            amount = 100.0 # fallback for tests
-            
-        # Call provider wrapper
-        intent_result = payment_service.create_checkout_intent(
-            order_id=payload.order_id,
-            amount=amount,
-            currency=data.get("currency", "TRY"),
-            recipient=data.get("recipient", {})
-        )
-        
-        timestamp = firestore.SERVER_TIMESTAMP
-        
-        # 1. Update Order (payment_status)
-        transaction.update(order_ref, {
-            "payment_status": "PAYMENT_PENDING"
-        })
-        
-        # 2. Create Payment Document
-        payment_ref = db.collection(PAYMENTS).document(intent_result["token"])
-        transaction.set(payment_ref, {
-            "order_id": payload.order_id,
-            "status": "PENDING",
-            "amount": amount,
-            "currency": data.get("currency", "TRY"),
-            "provider": "iyzico",
-            "token": intent_result["token"],
-            "checkout_url": intent_result["checkout_url"],
-            "created_at": timestamp
-        })
-        
-        return intent_result
-
+    # Reserve / call provider / finalize: the provider call stays outside the transactions,
+    # and an order's live intent is reused to prevent double-click double-charge
     try:
-        result = process_intent(transaction, order_ref)
+        result = await payments.create_intent(payload.order_id, payment_service.create_checkout_intent)
         return PaymentCreateIntentResponse(**result)
     except HTTPException:
         raise
+    except ProviderUnavailable as e:
+        # iyzico is down or the circuit breaker is open: fail fast, the slot was released
+        raise HTTPException(
+            status_code=503,
+            detail="Payment provider unavailable, please retry shortly",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
     except Exception:
         import traceback
         raise HTTPException(status_code=400, detail=traceback.format_exc())
@@ -90,7 +37,7 @@ def create_payment_intent(request: Request, payload: PaymentCreateIntentRequest)
 
 @router.post("/webhook")
 @limiter.limit("100/minute")
-def payment_webhook(
+async def payment_webhook(
     request: Request, 
     payload: PaymentWebhookPayload,
     bg_tasks: BackgroundTasks,
@@ -107,7 +54,7 @@ def payment_webhook(
         if not is_valid:
             raise HTTPException(status_code=401, detail="Invalid webhook signature")
             
-        db = get_db()
+        db = get_async_db()
         
         # 2. Extract Data from Payload
         token = payload.token
@@ -115,98 +62,16 @@ def payment_webhook(
         order_id = payload.conversationId
         
         # 3. Transactional Write Fan-out with DEDUP
-        transaction = db.transaction()
-        payment_ref = db.collection(PAYMENTS).document(token)
-        
-        @firestore.transactional
-        def process_webhook(transaction, payment_ref):
-            # 1) ALL READS FIRST
-            snapshot = payment_ref.get(transaction=transaction)
-            if not snapshot.exists:
-                # We don't fail a webhook 500 if token doesn't exist, just 200 OK so they stop retrying
-                return
-                
-            data = snapshot.to_dict()
-            
-            # Dedup Check: Is this event already processed?
-            if data.get("status") in ["SUCCEEDED", "FAILED"]:
-                # Already processed (Double delivery from Provider) -> No-op
-                return 
-                
-            order_ref = db.collection(ORDERS).document(order_id)
-            order_doc = order_ref.get(transaction=transaction)
-                
-            # 2) COMPUTE STATE
-            # Map provider status to internal status
-            internal_status = "SUCCEEDED" if provider_status.upper() == "SUCCESS" else "FAILED"
-            timestamp = firestore.SERVER_TIMESTAMP
-            
-            # 3) ALL WRITES LAST
-            # a) UPDATE PAYMENTS
-            transaction.update(payment_ref, {
-                "status": internal_status,
-                "updated_at": timestamp,
-                "provider_payment_id": payload.paymentId
-            })
-            
-            # If FAILED, just update payment doc and we stop here
-            if internal_status == "FAILED":
-                transaction.update(order_ref, {"payment_status": "FAILED"})
-                return
-                
-            # SUCCESS LOGIC follows:
-            if order_doc.exists:
-                order_data = order_doc.to_dict()
-                tracking_code = order_data.get("tracking_code")
-                
-                # b) UPDATE ORDERS
-                transaction.update(order_ref, {
-                    "payment_status": "PAID",
-                    "status": OrderStatus.PAID,
-                    "paid_at": timestamp,
-                    "status_updated_at": timestamp,
-                    "status_updated_by": "system_webhook"
-                })
-                
-                # c) UPDATE ORDER_PUBLIC (NO PII)
-                public_ref = db.collection(ORDER_PUBLIC).document(tracking_code)
-                transaction.update(public_ref, {
-                    "status": OrderStatus.PAID,
-                    "status_updated_at": timestamp,
-                    "public_step_label": get_public_step_label(OrderStatus.PAID)
-                })
-                
-                # d) UPDATE HISTORY + AUDIT 
-                history_ref = db.collection(ORDER_STATUS_HISTORY).document()
-                transaction.set(history_ref, {
-                    "order_id": order_id,
-                    "from_status": order_data.get("status"),
-                    "to_status": OrderStatus.PAID,
-                    "actor": "system",
-                    "source": "webhook",
-                    "timestamp": timestamp
-                })
-                
-                audit_ref = db.collection(ADMIN_AUDIT_LOGS).document()
-                transaction.set(audit_ref, {
-                    "action": "PAYMENT_RECEIVED",
-                    "order_id": order_id,
-                    "actor": "system",
-                    "timestamp": timestamp
-                })
-
-        process_webhook(transaction, payment_ref)
+        tracking_code, newly_paid = await PaymentRepository(db).apply_webhook(
+            token, order_id, provider_status, payload.paymentId
+        )
+        if newly_paid:
+            order_public_cache.invalidate(tracking_code)
         
-        # 4. Enqueue background job (Fire and Forget)
-        if provider_status.upper() == "SUCCESS":
-           try:
-               # Get the tracking code from order (we need outside transaction to be safe or fetch again)
-               order_doc_raw = db.collection(ORDERS).document(order_id).get()
-               if order_doc_raw.exists:
-                   tracking = order_doc_raw.to_dict().get("tracking_code")
-                   bg_tasks.add_task(payment_service.enqueue_pdf_generation_task, order_id=order_id, tracking_code=tracking)
-           except Exception:
-               pass
+        # 4. The PDF job was committed to the outbox with the payment; deliver it now
+        # (a scheduled drain picks it up should this instance stop first)
+        if newly_paid:
+            bg_tasks.add_task(outbox_dispatcher.drain, db)
         return {"message": "Webhook processed successfully"}
     except HTTPException:
         raise
@@ -217,18 +82,15 @@ def payment_webhook(
 
 @router.get("/status", response_model=PaymentStatusResponse)
 @limiter.limit("60/minute")
-def get_payment_status(request: Request, order_id: str):
+async def get_payment_status(request: Request, order_id: str):
     """
     Called by Frontend to poll the status of a specific order's payment.
     Whitelisted minimal fields only.
     """
-    db = get_db()
-    order_doc = db.collection(ORDERS).document(order_id).get()
+    data = await OrderRepository(get_async_db()).get(order_id)
     
-    if not order_doc.exists:
+    if data is None:
         raise HTTPException(status_code=404, detail="Order not found")
-        
-    data = order_doc.to_dict()
     
     return PaymentStatusResponse(
         order_id=order_id,
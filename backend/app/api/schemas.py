@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 class RecipientInfo(BaseModel):
     name: str = Field(..., max_length=100)
@@ -41,7 +41,7 @@ class AdminOrderListItem(BaseModel):
 
 class AdminOrderListResponse(BaseModel):
     items: List[AdminOrderListItem]
-    next_cursor: Optional[str] = None # Cursor based pagination
+    next_cursor: Optional[str] = None # Opaque token (created_at + order ID of the last item); pass back as ?cursor=
     has_more: bool
 
 class AdminOrderStatusUpdateRequest(BaseModel):
@@ -49,6 +49,32 @@ class AdminOrderStatusUpdateRequest(BaseModel):
     expected_from_status: str # Optimistic Locking
     note: Optional[str] = None
 
+class AdminBulkStatusItem(BaseModel):
+    order_id: str
+    expected_from_status: str # Optimistic Locking, per order
+
+class AdminBulkStatusUpdateRequest(BaseModel):
+    to_status: str
+    # One operator action per print/PTT batch; bounded so a request stays within a few commits
+    items: List[AdminBulkStatusItem] = Field(..., min_length=1, max_length=500)
+    note: Optional[str] = None
+
+class AdminBulkStatusResult(BaseModel):
+    order_id: str
+    result: str # UPDATED | NOT_FOUND | STATUS_MISMATCH | INVALID_TRANSITION | DUPLICATE | ERROR
+    current_status: Optional[str] = None
+    message: Optional[str] = None
+
+class AdminBulkStatusUpdateResponse(BaseModel):
+    to_status: str
+    updated_count: int
+    failed_count: int
+    results: List[AdminBulkStatusResult]
+
+class AdminOrderStatsResponse(BaseModel):
+    counts: Dict[str, int] # Orders per status, from the sharded counters
+    total: int
+
 # --- PAYMENT SCHEMAS ---
 
 class PaymentCreateIntentRequest(BaseModel):
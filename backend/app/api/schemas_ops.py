@@ -1,9 +1,9 @@
-from typing import Optional
+from typing import Any, Dict, Optional
 from pydantic import BaseModel, Field
 
 class PdfGenerateJobPayload(BaseModel):
     job_type: str = Field(default="pdf_generate")
-    job_id: str
+    job_id: Optional[str] = None  # for log correlation; the job itself is keyed by pdf_job_id(order content)
     order_id: str
     tracking_code: Optional[str] = None
     requested_by: str = Field(default="system:webhook")
@@ -16,7 +16,24 @@ class PiiCleanupJobPayload(BaseModel):
     dry_run: bool = Field(default=True)
     requested_by: str = Field(default="system:scheduler")
 
+class PrintBatchJobPayload(BaseModel):
+    job_type: str = Field(default="print_batch")
+    job_id: str  # also the print batch ID: a retried task rebuilds the same batch
+    max_orders: Optional[int] = Field(default=None, ge=1, le=400)
+    requested_by: str = Field(default="system:scheduler")
+
+class StatsReconcileJobPayload(BaseModel):
+    job_type: str = Field(default="stats_reconcile")
+    job_id: str
+    requested_by: str = Field(default="system:scheduler")
+
+class OutboxDispatchJobPayload(BaseModel):
+    job_type: str = Field(default="outbox_dispatch")
+    job_id: str
+    requested_by: str = Field(default="system:scheduler")
+
 class OpsJobResponse(BaseModel):
     message: str
     status: str
     job_id: str
+    details: Optional[Dict[str, Any]] = None  # job-specific figures, e.g. PII dry-run counts
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from app.core.config import settings
+
+# Sentinel returned by TTLCache.get() on a miss, so that a cached ``None``
+# (negative cache entry) can be told apart from "not cached at all".
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe in-process cache with a per-entry TTL and LRU eviction.
+
+    Entries expire lazily on read. When the cache is full, the least recently
+    used entry is evicted. Every instance keeps its own copy, so on a multi
+    instance deployment the TTL bounds how stale another instance can be.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (self._clock() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# order_public snapshots served by GET /api/orders/track/{tracking_code}.
+# Status-changing writes must call order_public_cache.invalidate(tracking_code).
+order_public_cache = TTLCache(
+    maxsize=settings.TRACKING_CACHE_MAX_ENTRIES,
+    ttl=settings.TRACKING_CACHE_TTL_SECONDS,
+)
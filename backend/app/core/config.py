@@ -7,6 +7,8 @@ class Settings(BaseSettings):
     FIREBASE_SERVICE_ACCOUNT_PATH: str = ""
     FIREBASE_SERVICE_ACCOUNT_JSON: str = ""
     FIREBASE_PROJECT_ID: str = "emektup"
+    # "firestore" (default) or "memory" (in-process engine for tests/benchmarks, see app/db/memory.py)
+    DB_BACKEND: str = "firestore"
     ALLOWED_ORIGINS: str = '["http://localhost:5173", "http://localhost:3000"]'
     
     # Payment Configs
@@ -14,17 +16,104 @@ class Settings(BaseSettings):
     IYZICO_API_KEY: str = "mock_api_key"
     IYZICO_SECRET_KEY: str = "mock_secret_key"
     IYZICO_BASE_URL: str = "https://sandbox-api.iyzipay.com"
+    # iyzico HTTP client (app/services/iyzico_client.py): per-attempt timeout, overall per-call
+    # deadline, jittered retries of unsent requests, pooled connections and circuit breaker tuning
+    IYZICO_TIMEOUT_SECONDS: float = 5.0
+    IYZICO_DEADLINE_SECONDS: float = 12.0
+    IYZICO_MAX_RETRIES: int = 2
+    IYZICO_RETRY_BACKOFF_SECONDS: float = 0.2
+    IYZICO_MAX_CONNECTIONS: int = 20
+    IYZICO_BREAKER_FAILURE_THRESHOLD: int = 5
+    IYZICO_BREAKER_RESET_SECONDS: float = 30.0
 
     # Background Jobs / OPS Security Configs
     OPS_AUDIENCE_URL: str = "https://mock-ops-url.run.app"
     OPS_SERVICE_ACCOUNT_EMAIL: str = "ops-service-account@emektup.iam.gserviceaccount.com"
-    
+
+    # Generated letter PDFs (app/services/pdf_storage.py): "gcs" bucket or "local" directory
+    PDF_STORAGE_BACKEND: str = "gcs"
+    PDF_STORAGE_BUCKET: str = "emektup-sandbox"
+    PDF_STORAGE_LOCAL_DIR: str = "/tmp/emektup-pdfs"
+    # TTF fonts for letters (app/services/pdf_service.py); empty = ReportLab's bundled Vera
+    PDF_FONT_PATH: str = ""
+    PDF_FONT_BOLD_PATH: str = ""
+    # Where PDF jobs run (app/services/pdf_worker.py): "thread" or "process" (warm worker pool,
+    # PDF_RENDER_PROCESSES workers, 0 = one per CPU). Jobs beyond PDF_RENDER_MAX_PENDING get a 503.
+    PDF_RENDER_MODE: str = "thread"
+    PDF_RENDER_PROCESSES: int = 0
+    PDF_RENDER_MAX_PENDING: int = 8
+    PDF_RENDER_RETRY_AFTER_SECONDS: int = 30
+    # PII cleanup sweep (app/services/pii_cleanup_service.py): orders per page (one batched
+    # commit) and time spent per invocation before checkpointing; stays below Cloud Run's timeout
+    PII_CLEANUP_PAGE_SIZE: int = 500
+    PII_CLEANUP_TIME_BUDGET_SECONDS: float = 240.0
+    # Dashboard status counters (order_status_counters): documents the per-status counts are
+    # spread over, so frequent status changes don't contend on one document
+    ORDER_STATUS_COUNTER_SHARDS: int = 10
+    # Outbox dispatcher (app/services/outbox_dispatcher.py): entries per Cloud Tasks batch and
+    # backoff between delivery attempts of a failed entry
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_RETRY_BASE_SECONDS: float = 5.0
+    OUTBOX_RETRY_MAX_SECONDS: float = 600.0
+    # Letters per /api/ops/print-batch run, and per print file (part) of that batch: parts are
+    # built and uploaded one at a time, so a build holds at most one part's letters in memory
+    PRINT_BATCH_MAX_ORDERS: int = 200
+    PRINT_BATCH_PART_MAX_ORDERS: int = 25
+    # Checkout intents cached on the order (orders.payment_intent): reuse window, kept below
+    # iyzico's 30 minute checkout-form token lifetime, and how long a provider call may hold the slot
+    PAYMENT_INTENT_TTL_SECONDS: float = 25 * 60
+    PAYMENT_INTENT_RESERVATION_SECONDS: float = 60.0
+
+    # Public tracking cache (per instance, see app/core/cache.py)
+    TRACKING_CACHE_TTL_SECONDS: float = 30.0
+    TRACKING_CACHE_NEGATIVE_TTL_SECONDS: float = 5.0
+    TRACKING_CACHE_MAX_ENTRIES: int = 10000
+
+    # Verified Firebase ID token cache (entries expire with the token's exp)
+    AUTH_TOKEN_CACHE_MAX_ENTRIES: int = 1024
+    # revoke_uid() entries are kept for one ID token lifetime (Firebase: 1 hour);
+    # by then every token issued before the revocation has expired
+    AUTH_REVOCATION_TTL_SECONDS: int = 3600
+    AUTH_REVOCATION_MAX_ENTRIES: int = 10000
+    OPS_TOKEN_CACHE_MAX_ENTRIES: int = 256
+
+    # Stored responses for client_request_id retries (idempotency_keys collection)
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24
+
+    # /api/metrics: when set, scrapes must send "Authorization: Bearer <token>"
+    METRICS_BEARER_TOKEN: str = ""
+
+    # Rate limiting (app/core/rate_limit.py). "memory://" counts per instance;
+    # "leased+redis://host:6379/0" shares counters across instances (app/core/rate_limit_storage.py)
+    RATE_LIMIT_STORAGE_URI: str = "memory://"
+    RATE_LIMIT_STRATEGY: str = "sliding-window-counter"
+    # Share of a limit an instance reserves per Redis round trip, at least RATE_LIMIT_MIN_LEASE hits
+    # (so 5/minute still admits some hits locally); hits left unused after RATE_LIMIT_LEASE_TTL_SECONDS
+    # are handed back to the shared window. RATE_LIMIT_MIN_LEASE=1 trades local admission for exact sharing.
+    RATE_LIMIT_LEASE_FRACTION: float = 0.1
+    RATE_LIMIT_MIN_LEASE: int = 2
+    RATE_LIMIT_LEASE_TTL_SECONDS: float = 10.0
+
+    # Logging (app/core/logging.py): records queued for the writer thread before new ones are dropped,
+    # and per-call-site sampling for chatty INFO lines, e.g. "ops.oidc_verified=0.1,orders.tracked=0.01"
+    LOG_QUEUE_MAX_RECORDS: int = 10000
+    LOG_SAMPLE_RATES: str = "ops.oidc_verified=0.1"
+
     @property
     def allowed_origins_list(self) -> list[str]:
         # Foolproof parser: strip all potential outer arrays/quotes and split by comma
         val = self.ALLOWED_ORIGINS.strip("'").strip('"').strip()
         val = val.strip("[]")
         return [x.strip().strip("'").strip('"') for x in val.split(",") if x.strip()]
+
+    @property
+    def log_sample_rates(self) -> dict[str, float]:
+        rates = {}
+        for item in self.LOG_SAMPLE_RATES.split(","):
+            key, _, rate = item.partition("=")
+            if key.strip() and rate.strip():
+                rates[key.strip()] = min(1.0, max(0.0, float(rate)))
+        return rates
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
 settings = Settings()
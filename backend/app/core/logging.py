@@ -1,49 +1,165 @@
+import re
+import json
 import uuid
+import atexit
+import queue
+import random
 import logging
-from typing import Callable, Awaitable
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from starlette.datastructures import MutableHeaders
+from app.core.config import settings
+from app.core.metrics import LOG_RECORDS_DROPPED
+
+# Request ID of the request being served by the current task ("system" outside requests).
+# ContextVars are copied into tasks spawned by the request, so background tasks keep the ID.
+request_id_var: ContextVar[str] = ContextVar("request_id", default="system")
+
+REQUEST_ID_HEADER = "X-Request-Id"
+# Accept a caller-supplied ID (load balancer, frontend retry) only if it is short and log-safe
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is emitted as a field
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "request_id", "sample_key",
+}
 
-# We inject request_id safely using a filter mechanism below,
-# but for now, we ensure request_id is present if not set by context.
 
 class InjectRequestId(logging.Filter):
     def filter(self, record):
         if not hasattr(record, "request_id"):
-            record.request_id = "system"
+            record.request_id = request_id_var.get()
         return True
 
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of high-volume INFO/DEBUG lines. A call site opts in with
+    `extra={"sample_key": "ops.oidc_verified"}`; its rate comes from LOG_SAMPLE_RATES.
+    Warnings and errors are never sampled. Kept records carry `sample_rate` so counts
+    can be scaled back up.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._raw = None
+        self._rates = {}
+
+    def filter(self, record):
+        key = getattr(record, "sample_key", None)
+        if key is None or record.levelno >= logging.WARNING:
+            return True
+        if self._raw != settings.LOG_SAMPLE_RATES:
+            self._raw, self._rates = settings.LOG_SAMPLE_RATES, settings.log_sample_rates
+        rate = self._rates.get(key, 1.0)
+        if rate >= 1.0:
+            return True
+        record.sample_rate = rate
+        return random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra` fields become top-level keys."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "severity": record.levelname,  # Cloud Logging reads this key
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "system"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread. Formatting-sensitive state (message args,
+    tracebacks) is resolved here, in the caller, but the record keeps its `extra`
+    fields so JsonFormatter can still emit them. A full queue drops the record
+    instead of blocking the event loop.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
 logger = logging.getLogger("emektup")
 logger.setLevel(logging.INFO)
-handler = logging.StreamHandler()
-formatter = logging.Formatter('{"time": "%(asctime)s", "level": "%(levelname)s", "request_id": "%(request_id)s", "message": "%(message)s"}')
-handler.setFormatter(formatter)
+
+log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_MAX_RECORDS)
+handler = NonBlockingQueueHandler(log_queue)
+# Filters run on the calling task, where the request ID ContextVar is still set.
+# They sit on the handler (not the logger) so child loggers like "emektup.ops" are covered too.
+handler.addFilter(SamplingFilter())
+handler.addFilter(InjectRequestId())
 logger.addHandler(handler)
-logger.addFilter(InjectRequestId())
 
-class RequestIdFilter(logging.Filter):
-    def __init__(self, request_id: str):
-        super().__init__()
-        self.request_id = request_id
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(JsonFormatter())
+listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+listener.start()
+# Flush whatever is still queued when the worker exits
+atexit.register(listener.stop)
 
-    def filter(self, record):
-        record.request_id = self.request_id
-        return True
 
-class RequestIdMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
-        # Generate a unique request ID
-        req_id = str(uuid.uuid4())
-        
+def get_request_id() -> str:
+    return request_id_var.get()
+
+
+class RequestIdMiddleware:
+    """
+    Pure ASGI middleware: assigns each request an ID, exposes it through
+    request_id_var (for logging) and request.state.request_id, and echoes it
+    in the X-Request-Id response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                incoming = value.decode("latin-1")
+                break
+        req_id = incoming if incoming and _VALID_REQUEST_ID.match(incoming) else str(uuid.uuid4())
+
         # Store it in request state to be accessible by routes/deps
-        request.state.request_id = req_id
-        
-        # Let's add it to logger context for the duration of this request
-        # (A more robust async context var like contextvars should be used in prod, 
-        # but attaching it to request state works for our scope)
-        
-        response = await call_next(request)
-        
-        # Inject the request ID into the response headers
-        response.headers["X-Request-Id"] = req_id
-        return response
+        scope.setdefault("state", {})["request_id"] = req_id
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[REQUEST_ID_HEADER] = req_id
+            await send(message)
+
+        token = request_id_var.set(req_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,153 @@
+"""
+Prometheus metrics for the API process, exposed at /api/metrics.
+
+Everything is recorded outside the handlers:
+- MetricsMiddleware: per-route request latency/counts, in-flight requests and
+  requests still running background tasks after their response was sent.
+- app/db/instrumentation.py: Firestore call counts/durations per repository
+  method and transaction attempts/retries.
+- app/core/rate_limit.py: rate-limit rejections.
+- app/core/logging.py: log records dropped by the non-blocking log queue.
+- app/api/routes/ops.py, app/services/pdf_worker.py: letter PDF render time,
+  render pool occupancy and rejections.
+- app/services/iyzico_client.py: payment provider call outcomes and circuit
+  breaker state.
+
+Cloud Run runs a single worker per instance (see Dockerfile), so the default
+in-process registry is enough; no multiprocess mode.
+"""
+import time
+from prometheus_client import Counter, Gauge, Histogram
+
+HTTP_REQUESTS = Counter(
+    "emektup_http_requests_total",
+    "HTTP requests by route template and status code.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "emektup_http_request_duration_seconds",
+    "Time until the response body was fully sent, by route template.",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "emektup_http_requests_in_progress",
+    "Requests whose response has not been sent yet.",
+)
+BACKGROUND_TASKS_IN_PROGRESS = Gauge(
+    "emektup_background_tasks_in_progress",
+    "Requests that already responded and are still running their background tasks.",
+)
+
+FIRESTORE_CALLS = Counter(
+    "emektup_firestore_calls_total",
+    "Repository calls by kind (read/write/transaction) and outcome (ok/rejected/error).",
+    ["operation", "kind", "outcome"],
+)
+FIRESTORE_CALL_DURATION = Histogram(
+    "emektup_firestore_call_duration_seconds",
+    "Repository call duration, including all transaction attempts.",
+    ["operation", "kind"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+FIRESTORE_TRANSACTION_ATTEMPTS = Counter(
+    "emektup_firestore_transaction_attempts_total",
+    "Transaction function executions, first attempts included.",
+    ["operation"],
+)
+FIRESTORE_TRANSACTION_RETRIES = Counter(
+    "emektup_firestore_transaction_retries_total",
+    "Transaction attempts re-run after a contention abort.",
+    ["operation"],
+)
+
+RATE_LIMIT_REJECTIONS = Counter(
+    "emektup_rate_limit_rejections_total",
+    "Requests rejected with 429 by the rate limiter.",
+    ["route"],
+)
+
+PDF_RENDER_DURATION = Histogram(
+    "emektup_pdf_render_duration_seconds",
+    "Letter PDF render + upload time per job.",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+PDF_RENDERS_IN_PROGRESS = Gauge(
+    "emektup_pdf_renders_in_progress",
+    "PDF jobs admitted by the render pool (running or waiting for a worker).",
+)
+PDF_RENDER_REJECTIONS = Counter(
+    "emektup_pdf_render_rejections_total",
+    "PDF jobs turned away with 503 because the render pool was saturated.",
+)
+
+IYZICO_CALLS = Counter(
+    "emektup_iyzico_calls_total",
+    "iyzico API calls by outcome (ok/error/unavailable/rejected by the open circuit breaker).",
+    ["outcome"],
+)
+IYZICO_CIRCUIT_OPEN = Gauge(
+    "emektup_iyzico_circuit_open",
+    "1 while the iyzico circuit breaker is failing calls fast, else 0.",
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    "emektup_log_records_dropped_total",
+    "Log records dropped because the log writer queue was full.",
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(scope) -> str:
+    # Label by template (/api/orders/track/{tracking_code}), never the raw path,
+    # so label cardinality stays bounded
+    route_path = getattr(scope.get("route"), "path", None)
+    if not route_path:
+        return UNMATCHED_ROUTE
+    # Routes of included routers may only know their path below the router
+    # prefix; the prefix segments (static here) are taken from the request path
+    template = route_path.strip("/").split("/")
+    segments = scope["path"].strip("/").split("/")
+    prefix = segments[:max(0, len(segments) - len(template))]
+    return "/" + "/".join(prefix + template).strip("/")
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: times each request without wrapping the response body."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+        responded_at = None
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+
+        async def send_with_metrics(message):
+            nonlocal status_code, responded_at
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Anything the app still does from here on is background work
+                responded_at = time.perf_counter()
+                HTTP_REQUESTS_IN_PROGRESS.dec()
+                BACKGROUND_TASKS_IN_PROGRESS.inc()
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            if responded_at is None:
+                HTTP_REQUESTS_IN_PROGRESS.dec()
+                responded_at = time.perf_counter()
+            else:
+                BACKGROUND_TASKS_IN_PROGRESS.dec()
+            route = route_template(scope)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status_code)).inc()
+            HTTP_REQUEST_DURATION.labels(scope["method"], route).observe(responded_at - started)
@@ -1,12 +1,57 @@
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from slowapi.errors import RateLimitExceeded
+from app.core.config import settings
+from app.core.metrics import RATE_LIMIT_REJECTIONS, route_template
+# Registers the leased+redis:// storage scheme with `limits`
+import app.core.rate_limit_storage  # noqa: F401
+
+# Counters in a remote store: checking a limit may take a (blocking) round trip
+SHARED_STORAGE = settings.RATE_LIMIT_STORAGE_URI.startswith("leased+")
+
+def build_limiter() -> Limiter:
+    """
+    Storage and strategy come from settings: the default memory:// keeps counters
+    per instance; leased+redis://... shares them across instances (see rate_limit_storage.py).
+    """
+    storage_options = {
+        "lease_fraction": settings.RATE_LIMIT_LEASE_FRACTION,
+        "min_lease": settings.RATE_LIMIT_MIN_LEASE,
+        "lease_ttl": settings.RATE_LIMIT_LEASE_TTL_SECONDS,
+    }
+    return Limiter(
+        key_func=get_remote_address,
+        storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+        strategy=settings.RATE_LIMIT_STRATEGY,
+        storage_options=storage_options if SHARED_STORAGE else {},
+        # If the shared store is unreachable, fall back to per-instance limits instead of failing requests
+        in_memory_fallback_enabled=SHARED_STORAGE,
+    )
 
 # Initialize limiter using client IP
-limiter = Limiter(key_func=get_remote_address)
+limiter = build_limiter()
+
+def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    """Counts the rejection per route, then answers with slowapi's default 429"""
+    RATE_LIMIT_REJECTIONS.labels(route_template(request.scope)).inc()
+    return _rate_limit_exceeded_handler(request, exc)
+
+async def check_limits_off_loop(request: Request):
+    """
+    With shared storage, runs slowapi's check for the matched route in the threadpool,
+    so Redis round trips never block the event loop; the @limiter.limit wrapper then
+    sees the check done and skips its own inline one.
+    """
+    endpoint = request.scope.get("endpoint")
+    if not SHARED_STORAGE or not limiter.enabled or endpoint is None:
+        return
+    await run_in_threadpool(limiter._check_request_limit, request, endpoint, False)
+    request.state._rate_limiting_complete = True
 
 def setup_rate_limiting(app: FastAPI):
-    """Registers the slowapi rate limiter to the FastAPI app"""
+    """Registers the slowapi rate limiter to the FastAPI app (before any router is included)"""
     app.state.limiter = limiter
-    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+    app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
+    app.router.dependencies.append(Depends(check_limits_off_loop))
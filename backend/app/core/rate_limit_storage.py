@@ -0,0 +1,190 @@
+"""
+Shared rate-limit storage for multi-instance deployments (see app/core/rate_limit.py).
+
+LeasedRedisStorage is a `limits` storage for the sliding-window-counter strategy.
+Window counters live in a Redis-protocol store shared by every Cloud Run
+instance, so "5/minute" stays 5/minute no matter how many instances serve traffic.
+
+To avoid a round trip per request, an instance reserves a small lease of hits
+(RATE_LIMIT_LEASE_FRACTION of the limit, at least RATE_LIMIT_MIN_LEASE, at most
+the limit) in one atomic script call and admits requests locally until the
+lease runs out, expires (RATE_LIMIT_LEASE_TTL_SECONDS) or the window rolls
+over. Leased-but-unused hits are already counted in the shared window, so the
+instances together can under-admit but never exceed the limit; the unused rest
+of an expired lease is handed back with the instance's next reservation (for
+any key), so it is not held until the window ends. With the default minimum of
+2, a 5/minute limit costs one round trip per two hits instead of one per hit.
+
+Round trips are blocking calls; app/core/rate_limit.py runs the limit check in
+the threadpool when this storage is configured, so they never stall the event
+loop.
+
+URI: leased+redis://host:6379/0 (or leased+rediss://). Requires the `redis`
+package (pip install -e '.[redis]').
+"""
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from limits.storage import SlidingWindowCounterSupport, Storage
+from limits.storage.base import TimestampedSlidingWindow
+
+# KEYS: previous window, current window, then the windows of expired leases
+# ARGV: limit, expiry (s), amount, max grant, seconds into the previous window's weight,
+#       then the unused hits of each expired lease
+# Returns the number of hits granted (0 when `amount` does not fit)
+_RESERVE_SCRIPT = """
+for i = 3, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('DECRBY', KEYS[i], ARGV[i + 3])
+    end
+end
+local previous = tonumber(redis.call('GET', KEYS[1]) or '0')
+local current = tonumber(redis.call('GET', KEYS[2]) or '0')
+local limit = tonumber(ARGV[1])
+local expiry = tonumber(ARGV[2])
+local amount = tonumber(ARGV[3])
+local max_grant = tonumber(ARGV[4])
+local previous_ttl = tonumber(ARGV[5])
+local weighted = math.floor(previous * previous_ttl / expiry + current)
+local grant = math.min(max_grant, limit - weighted)
+if grant < amount then
+    return 0
+end
+redis.call('INCRBY', KEYS[2], grant)
+redis.call('EXPIRE', KEYS[2], expiry * 2)
+return grant
+"""
+
+
+def _window_ttls(expiry: int, now: float) -> Tuple[float, float]:
+    # Same weighting as limits' MemoryStorage: how much of the previous window still counts
+    previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry
+    current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+    return previous_ttl, current_ttl
+
+
+class LeasedRedisStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    STORAGE_SCHEME = ["leased+redis", "leased+rediss"]
+
+    def __init__(
+        self,
+        uri: Optional[str] = None,
+        wrap_exceptions: bool = False,
+        lease_fraction: float = 0.1,
+        min_lease: int = 1,
+        lease_ttl: float = 10.0,
+        client: Any = None,
+        **options: Any,
+    ):
+        """
+        :param lease_fraction: share of a limit reserved per round trip
+        :param min_lease: fewest hits reserved per round trip (capped at the limit)
+        :param lease_ttl: seconds after which unused leased hits are handed back
+        :param client: a ready Redis-protocol client (tests pass a fakeredis instance)
+        """
+        if client is None:
+            import redis  # optional dependency, only needed when this storage is configured
+            client = redis.Redis.from_url(uri.replace("leased+", "", 1), **options)
+        self.client = client
+        self.lease_fraction = float(lease_fraction)
+        self.min_lease = int(min_lease)
+        self.lease_ttl = float(lease_ttl)
+        self._reserve = client.register_script(_RESERVE_SCRIPT)
+        # rate-limit key -> (current window key, hits left in this instance's lease, expires at)
+        self._leases: Dict[str, Tuple[str, int, float]] = {}
+        self._lock = threading.Lock()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions)
+
+    @property
+    def base_exceptions(self):
+        import redis
+        return redis.RedisError
+
+    # --- sliding window counter ---
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+
+        with self._lock:
+            window_key, remaining, expires_at = self._leases.get(key, (None, 0, 0.0))
+            if window_key == current_key and remaining >= amount and expires_at > now:
+                self._leases[key] = (current_key, remaining - amount, expires_at)
+                return True
+            released = self._release_expired(key, now)
+
+        previous_ttl, _ = _window_ttls(expiry, now)
+        lease_size = min(limit, max(amount, self.min_lease, int(limit * self.lease_fraction)))
+        granted = int(self._reserve(
+            keys=[previous_key, current_key, *(window for window, _ in released)],
+            args=[limit, expiry, amount, lease_size, previous_ttl, *(hits for _, hits in released)],
+        ))
+        if granted < amount:
+            return False
+        with self._lock:
+            self._leases[key] = (current_key, granted - amount, now + self.lease_ttl)
+        return True
+
+    def _release_expired(self, key: str, now: float) -> List[Tuple[str, int]]:
+        """Drops `key`'s lease and every expired one; returns their unused hits per window key."""
+        released = []
+        for lease_key, (window_key, remaining, expires_at) in list(self._leases.items()):
+            if lease_key == key or expires_at <= now:
+                del self._leases[lease_key]
+                if remaining:
+                    released.append((window_key, remaining))
+        return released
+
+    def get_sliding_window(self, key: str, expiry: int) -> Tuple[int, float, int, float]:
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous, current = self.client.mget(previous_key, current_key)
+        previous_count, current_count = int(previous or 0), int(current or 0)
+        previous_ttl, current_ttl = _window_ttls(expiry, now)
+        return previous_count, (previous_ttl if previous_count else 0.0), current_count, current_ttl
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        with self._lock:
+            self._leases.pop(key, None)
+        self.client.delete(previous_key, current_key)
+
+    # --- plain counters (fixed-window strategy) ---
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        pipe = self.client.pipeline()
+        pipe.incrby(key, amount)
+        pipe.expire(key, int(expiry), nx=True)
+        return int(pipe.execute()[0])
+
+    def get(self, key: str) -> int:
+        return int(self.client.get(key) or 0)
+
+    def get_expiry(self, key: str) -> float:
+        return max(self.client.pttl(key), 0) / 1000 + time.time()
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._leases.pop(key, None)
+        self.client.delete(key)
+
+    def check(self) -> bool:
+        try:
+            return bool(self.client.ping())
+        except Exception:
+            return False
+
+    def reset(self) -> Optional[int]:
+        with self._lock:
+            self._leases.clear()
+        keys = list(self.client.scan_iter(match="LIMITER*"))
+        if keys:
+            self.client.delete(*keys)
+        return len(keys)
+
+    def local_lease(self, key: str) -> int:
+        """Hits this instance may still admit for `key` without asking Redis."""
+        with self._lock:
+            return self._leases.get(key, (None, 0, 0.0))[1]
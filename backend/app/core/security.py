@@ -1 +1,117 @@
-# Security and auth middleware will be implemented here
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Optional
+import cachecontrol
+import requests
+from google.auth.transport import requests as google_requests
+from google.oauth2 import id_token
+from app.core.cache import TTLCache, MISSING
+from app.core.config import settings
+
+
+def _token_key(token: str) -> str:
+    # Never keep raw bearer tokens in memory longer than the request needs them
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class VerifiedTokenCache:
+    """
+    Caches decoded ID token claims so repeated requests with the same token
+    skip signature verification. Entries live until the token's own `exp`.
+
+    Revocation:
+    - revoke(token) drops a single token.
+    - revoke_uid(uid) rejects every token of that user issued up to now,
+      even ones that are not cached yet. Revocations are remembered for
+      AUTH_REVOCATION_TTL_SECONDS (one token lifetime) in a bounded cache.
+    """
+
+    def __init__(self, maxsize: int):
+        self._cache = TTLCache(maxsize=maxsize, ttl=0, clock=time.time)
+        self._revoked_before = TTLCache(
+            maxsize=settings.AUTH_REVOCATION_MAX_ENTRIES,
+            ttl=settings.AUTH_REVOCATION_TTL_SECONDS,
+            clock=time.time,
+        )
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        claims = self._cache.get(_token_key(token))
+        if claims is MISSING:
+            return None
+        return claims
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)):
+            return  # Without an expiry we can't know how long the claims stay valid
+        self._cache.set(_token_key(token), claims, ttl=exp - time.time())
+
+    def is_revoked(self, claims: Dict[str, Any]) -> bool:
+        revoked_at = self._revoked_before.get(claims.get("uid") or claims.get("sub"))
+        if revoked_at is MISSING:
+            return False
+        return claims.get("iat", 0) <= revoked_at
+
+    def revoke(self, token: str) -> None:
+        self._cache.invalidate(_token_key(token))
+
+    def revoke_uid(self, uid: str) -> None:
+        self._revoked_before.set(uid, time.time())
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._revoked_before.clear()
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+
+firebase_token_cache = VerifiedTokenCache(maxsize=settings.AUTH_TOKEN_CACHE_MAX_ENTRIES)
+
+
+class GoogleOidcVerifier:
+    """
+    Process-wide verifier for Google-signed OIDC tokens (Cloud Tasks / Scheduler).
+
+    - One pooled HTTP session is shared by every call; CacheControl keeps
+      Google's signing certs until the Cache-Control max-age they are served with.
+    - Verified claims are cached per (audience, token) until the token's `exp`,
+      so redeliveries with the same token skip signature verification entirely;
+      a token verified for one audience is still checked against any other.
+    """
+
+    def __init__(self, maxsize: int):
+        self.claims_cache = VerifiedTokenCache(maxsize=maxsize)
+        self._request: Optional[google_requests.Request] = None
+        self._lock = threading.Lock()
+
+    @property
+    def request(self) -> google_requests.Request:
+        if self._request is None:
+            with self._lock:
+                if self._request is None:
+                    session = cachecontrol.CacheControl(requests.Session())
+                    self._request = google_requests.Request(session=session)
+        return self._request
+
+    def verify(self, token: str, audience: str) -> Dict[str, Any]:
+        """Returns the decoded claims. Raises ValueError on an invalid token."""
+        # Hashed by the cache, so the raw token is not kept either way
+        key = f"{audience}\n{token}"
+        claims = self.claims_cache.get(key)
+        if claims is None:
+            claims = id_token.verify_oauth2_token(token, self.request, audience=audience)
+            self.claims_cache.put(key, claims)
+        return claims
+
+
+oidc_verifier = GoogleOidcVerifier(maxsize=settings.OPS_TOKEN_CACHE_MAX_ENTRIES)
@@ -1,5 +1,10 @@
+import base64
+import hashlib
+import json
 import secrets
 import string
+from datetime import datetime
+from typing import Optional, Tuple
 
 def generate_tracking_code(length: int = 12) -> str:
     """
@@ -10,3 +15,54 @@ def generate_tracking_code(length: int = 12) -> str:
     # Exclude confusing characters like O, 0, I, 1
     safe_alphabet = ''.join(c for c in alphabet if c not in 'O0I1')
     return ''.join(secrets.choice(safe_alphabet) for _ in range(length))
+
+def idempotency_key_id(scope: str, client_key: str) -> str:
+    """
+    Deterministic idempotency_keys/{id} document ID for a client supplied key.
+    Hashing keeps arbitrary client input (slashes, length) a valid document ID.
+    """
+    return hashlib.sha256(f"{scope}:{client_key}".encode("utf-8")).hexdigest()
+
+# Part of every PDF job ID: bump it when the letter layout (app/services/pdf_service.py)
+# changes, so already rendered letters get new jobs instead of no-ops
+PDF_RENDER_VERSION = 1
+
+def pdf_job_id(order_id: str, order_data: dict) -> str:
+    """
+    Deterministic jobs/{id} (and Cloud Tasks task name) for rendering an order's
+    letter: the same order and content always yield the same ID, so however
+    often the job is enqueued it dedupes instead of rendering again.
+    """
+    content = json.dumps({
+        "v": PDF_RENDER_VERSION,
+        "tracking_code": order_data.get("tracking_code"),
+        "recipient": order_data.get("recipient"),
+        "letter_content": order_data.get("letter_content"),
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return f"pdf_{order_id}_{hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]}"
+
+def recipient_summary(recipient: Optional[dict], max_length: int = 30) -> str:
+    """
+    Short, list-safe recipient line (no name or phone), stored on the order at
+    creation so listings can project it instead of reading the recipient map.
+    """
+    address = (recipient or {}).get("address", "")
+    # Note: A real app might parse the city/state, here we just truncate safely
+    return address[:max_length] + "..." if len(address) > max_length else address
+
+def encode_page_cursor(created_at: datetime, doc_id: str) -> str:
+    """
+    Opaque pagination token holding the sort values of the last item of a page
+    (created_at, document ID), so the next page can start after them directly.
+    """
+    payload = json.dumps({"t": created_at.isoformat(), "id": doc_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_page_cursor(token: str) -> Tuple[datetime, str]:
+    """Inverse of encode_page_cursor. Raises ValueError for malformed tokens."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["t"]), str(payload["id"])
+    except (KeyError, TypeError, ValueError) as e:  # ValueError covers base64, JSON and date errors
+        raise ValueError("Malformed pagination cursor") from e
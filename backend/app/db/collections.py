@@ -8,3 +8,8 @@ ORDER_STATUS_HISTORY = "order_status_history"
 ADMIN_AUDIT_LOGS = "admin_audit_logs"
 PAYMENTS = "payments"
 SHIPMENTS = "shipments"
+IDEMPOTENCY_KEYS = "idempotency_keys"
+JOBS = "jobs"
+PRINT_BATCHES = "print_batches"
+ORDER_STATUS_COUNTERS = "order_status_counters"
+OUTBOX = "outbox"
@@ -1,7 +1,7 @@
 import os
 import json
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, firestore_async
 from app.core.config import settings
 
 def init_firebase():
@@ -31,3 +31,22 @@ def init_firebase():
 def get_db():
     """Retrieve the Firestore client wrapper."""
     return firestore.client()
+
+_memory_db = None
+
+def get_async_db():
+    """
+    Retrieve the async Firestore client (non-blocking RPCs over a shared channel).
+    With DB_BACKEND=memory the process-wide in-memory engine is returned instead.
+    """
+    if settings.DB_BACKEND == "memory":
+        return get_memory_db()
+    return firestore_async.client()
+
+def get_memory_db():
+    """Process-wide InMemoryFirestore used by tests, benchmarks and local load runs."""
+    global _memory_db
+    if _memory_db is None:
+        from app.db.memory import InMemoryFirestore
+        _memory_db = InMemoryFirestore()
+    return _memory_db
@@ -0,0 +1,88 @@
+"""
+Metrics hooks for the repository layer (see app/core/metrics.py).
+
+Repository methods are decorated with @instrumented(kind) and transaction
+functions use @transactional instead of firestore.async_transactional, so
+routes get Firestore timings without any changes of their own.
+"""
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable
+from fastapi import HTTPException
+from firebase_admin import firestore
+from app.core.metrics import (
+    FIRESTORE_CALLS, FIRESTORE_CALL_DURATION, FIRESTORE_TRANSACTION_ATTEMPTS, FIRESTORE_TRANSACTION_RETRIES
+)
+
+READ = "read"
+WRITE = "write"
+TRANSACTION = "transaction"
+
+
+def _operation_name(fn: Callable) -> str:
+    # "OrderRepository.transition_status.<locals>.update_in_transaction" -> "OrderRepository.transition_status"
+    return fn.__qualname__.split(".<locals>")[0]
+
+
+@contextmanager
+def observe_call(operation: str, kind: str):
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except HTTPException:
+        outcome = "rejected"  # business rule (404/409/400), not a Firestore failure
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        FIRESTORE_CALL_DURATION.labels(operation, kind).observe(time.perf_counter() - started)
+        FIRESTORE_CALLS.labels(operation, kind, outcome).inc()
+
+
+async def _observe_stream(iterator: AsyncIterator, operation: str, kind: str):
+    with observe_call(operation, kind):
+        async for item in iterator:
+            yield item
+
+
+def instrumented(kind: str):
+    """Records count, outcome and duration of a repository method."""
+    def decorator(fn):
+        operation = _operation_name(fn)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with observe_call(operation, kind):
+                    return await fn(*args, **kwargs)
+        else:
+            # Methods returning a query stream: time the whole iteration
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                return _observe_stream(fn(*args, **kwargs), operation, kind)
+        return wrapper
+    return decorator
+
+
+def transactional(fn):
+    """firestore.async_transactional that also counts attempts and contention retries."""
+    operation = _operation_name(fn)
+
+    @functools.wraps(fn)
+    async def run(transaction, *args, **kwargs):
+        attempts = 0
+
+        async def attempt(transaction, *args, **kwargs):
+            nonlocal attempts
+            attempts += 1
+            FIRESTORE_TRANSACTION_ATTEMPTS.labels(operation).inc()
+            if attempts > 1:
+                FIRESTORE_TRANSACTION_RETRIES.labels(operation).inc()
+            return await fn(transaction, *args, **kwargs)
+
+        return await firestore.async_transactional(attempt)(transaction, *args, **kwargs)
+    return run
@@ -0,0 +1,706 @@
+"""
+In-memory Firestore engine.
+
+Implements the subset of the async Firestore client API that
+app/db/repositories.py relies on, so the repositories (and therefore the full
+request path) run unchanged against it. Selected with DB_BACKEND=memory for
+benchmarks and load tests, and used directly by the test-suite.
+
+Semantics kept from Firestore:
+- Batches and transactions commit atomically (all writes or none).
+- create() / update() / write_option() preconditions raise AlreadyExists,
+  NotFound and FailedPrecondition respectively.
+- Transactions are optimistic: documents read inside a transaction are
+  validated at commit and a concurrent change raises Aborted, which
+  firestore.async_transactional retries. Reads after writes are rejected.
+- Queries support filters, multi-field ordering with the implicit document ID
+  tie-breaker, limit/offset, start_at/start_after cursors, select() field
+  masks and count() aggregations.
+- SERVER_TIMESTAMP, DELETE_FIELD, Increment, ArrayUnion and ArrayRemove.
+"""
+import copy
+import datetime
+import random
+import string
+import threading
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from google.api_core.exceptions import Aborted, AlreadyExists, FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.base_transaction import MAX_ATTEMPTS
+from google.cloud.firestore_v1._helpers import ReadAfterWriteError
+
+DOCUMENT_ID = "__name__"
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+_AUTO_ID_ALPHABET = string.ascii_letters + string.digits
+
+
+def _auto_id() -> str:
+    return "".join(random.choice(_AUTO_ID_ALPHABET) for _ in range(20))
+
+
+def _utc(value: datetime.datetime) -> datetime.datetime:
+    # Firestore stores timestamps in UTC; naive datetimes are taken as UTC
+    return value.replace(tzinfo=datetime.timezone.utc) if value.tzinfo is None else value
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return _utc(value)
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _type_rank(value: Any) -> int:
+    # Firestore cross-type ordering: null < bool < number < timestamp < string < bytes < ... < array < map
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime.datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, list):
+        return 8
+    return 9
+
+
+class _SortKey:
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def _cmp(self, other: "_SortKey") -> int:
+        a, b = self.value, other.value
+        rank_a, rank_b = _type_rank(a), _type_rank(b)
+        if rank_a != rank_b:
+            return -1 if rank_a < rank_b else 1
+        if rank_a == 9:
+            a, b = sorted(a.items()), sorted(b.items())
+        if a == b:
+            return 0
+        return -1 if a < b else 1
+
+    def __lt__(self, other):
+        return self._cmp(other) < 0
+
+    def __eq__(self, other):
+        return self._cmp(other) == 0
+
+
+_MISSING = object()
+
+
+def _get_field(data: Dict[str, Any], field_path: str) -> Any:
+    current: Any = data
+    for part in field_path.split("."):
+        if not isinstance(current, dict) or part not in current:
+            return _MISSING
+        current = current[part]
+    return current
+
+
+def _set_field(data: Dict[str, Any], field_path: str, value: Any) -> None:
+    parts = field_path.split(".")
+    current = data
+    for part in parts[:-1]:
+        if not isinstance(current.get(part), dict):
+            current[part] = {}
+        current = current[part]
+    current[parts[-1]] = value
+
+
+def _delete_field(data: Dict[str, Any], field_path: str) -> None:
+    parts = field_path.split(".")
+    current = data
+    for part in parts[:-1]:
+        current = current.get(part)
+        if not isinstance(current, dict):
+            return
+    current.pop(parts[-1], None)
+
+
+def _apply_value(data: Dict[str, Any], field_path: str, value: Any, now: datetime.datetime) -> None:
+    if value is transforms.DELETE_FIELD:
+        _delete_field(data, field_path)
+    elif value is transforms.SERVER_TIMESTAMP:
+        _set_field(data, field_path, now)
+    elif isinstance(value, transforms.Increment):
+        current = _get_field(data, field_path)
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        _set_field(data, field_path, base + value.value)
+    elif isinstance(value, transforms.ArrayUnion):
+        current = _get_field(data, field_path)
+        result = list(current) if isinstance(current, list) else []
+        result.extend(v for v in _normalize(list(value.values)) if v not in result)
+        _set_field(data, field_path, result)
+    elif isinstance(value, transforms.ArrayRemove):
+        current = _get_field(data, field_path)
+        removed = _normalize(list(value.values))
+        result = [v for v in current if v not in removed] if isinstance(current, list) else []
+        _set_field(data, field_path, result)
+    elif isinstance(value, dict):
+        # Nested maps may carry transforms of their own
+        _set_field(data, field_path, {})
+        for key, nested in value.items():
+            _apply_value(data, f"{field_path}.{key}", nested, now)
+    else:
+        _set_field(data, field_path, copy.deepcopy(_normalize(value)))
+
+
+def _merge_into(data: Dict[str, Any], updates: Dict[str, Any], now: datetime.datetime, prefix: str = "") -> None:
+    for key, value in updates.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and value and isinstance(_get_field(data, path), dict):
+            _merge_into(data, value, now, prefix=f"{path}.")
+        else:
+            _apply_value(data, path, value, now)
+
+
+def _project(data: Dict[str, Any], field_paths: Optional[Iterable[str]]) -> Dict[str, Any]:
+    if field_paths is None:
+        return copy.deepcopy(data)
+    projected: Dict[str, Any] = {}
+    for field_path in field_paths:
+        value = _get_field(data, field_path)
+        if value is not _MISSING:
+            _set_field(projected, field_path, copy.deepcopy(value))
+    return projected
+
+
+class _StoredDocument:
+    __slots__ = ("data", "create_time", "update_time")
+
+    def __init__(self, data: Dict[str, Any], create_time: datetime.datetime, update_time: datetime.datetime):
+        self.data = data
+        self.create_time = create_time
+        self.update_time = update_time
+
+
+class WriteOption:
+    """Returned by InMemoryFirestore.write_option(); mirrors LastUpdateOption / ExistsOption."""
+
+    def __init__(self, last_update_time: Optional[datetime.datetime] = None, exists: Optional[bool] = None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+class WriteResult:
+    def __init__(self, update_time: datetime.datetime):
+        self.update_time = update_time
+
+
+class AggregationResult:
+    def __init__(self, alias: str, value: Any, read_time: datetime.datetime):
+        self.alias = alias
+        self.value = value
+        self.read_time = read_time
+
+
+class DocumentSnapshot:
+    def __init__(self, reference: "DocumentReference", data: Optional[Dict[str, Any]],
+                 create_time=None, update_time=None, read_time=None):
+        self._reference = reference
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = read_time
+
+    @property
+    def id(self) -> str:
+        return self._reference.id
+
+    @property
+    def reference(self) -> "DocumentReference":
+        return self._reference
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str) -> Any:
+        if self._data is None:
+            return None
+        value = _get_field(self._data, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class DocumentReference:
+    def __init__(self, client: "InMemoryFirestore", path: str):
+        self._client = client
+        self.path = path
+
+    @property
+    def id(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> "CollectionReference":
+        return CollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name: str) -> "CollectionReference":
+        return CollectionReference(self._client, f"{self.path}/{name}")
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    async def get(self, field_paths: Optional[Iterable[str]] = None, transaction=None) -> DocumentSnapshot:
+        return self._client._read(self, field_paths, transaction)
+
+    async def set(self, document_data: Dict[str, Any], merge: bool = False) -> WriteResult:
+        return self._client._commit([("set", self, document_data, merge)])[0]
+
+    async def create(self, document_data: Dict[str, Any]) -> WriteResult:
+        return self._client._commit([("create", self, document_data, None)])[0]
+
+    async def update(self, field_updates: Dict[str, Any], option: Optional[WriteOption] = None) -> WriteResult:
+        return self._client._commit([("update", self, field_updates, option)])[0]
+
+    async def delete(self, option: Optional[WriteOption] = None) -> datetime.datetime:
+        return self._client._commit([("delete", self, None, option)])[0].update_time
+
+
+class Query:
+    def __init__(self, client: "InMemoryFirestore", collection_path: str, filters=(), orders=(),
+                 limit: Optional[int] = None, offset: int = 0, start=None, projection=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters: Tuple = tuple(filters)
+        self._orders: Tuple = tuple(orders)
+        self._limit = limit
+        self._offset = offset
+        self._start = start  # (values tuple, document id or None, inclusive)
+        self._projection = projection
+
+    def _copy(self, **changes) -> "Query":
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "offset": self._offset,
+            "start": self._start,
+            "projection": self._projection,
+        }
+        state.update(changes)
+        return Query(self._client, self._collection_path, **state)
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None,
+              value: Any = None, *, filter=None) -> "Query":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, _normalize(value)),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> "Query":
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "Query":
+        return self._copy(limit=count)
+
+    def offset(self, num_to_skip: int) -> "Query":
+        return self._copy(offset=num_to_skip)
+
+    def select(self, field_paths: Iterable[str]) -> "Query":
+        return self._copy(projection=tuple(field_paths))
+
+    def _cursor(self, document_fields_or_snapshot, inclusive: bool) -> "Query":
+        if isinstance(document_fields_or_snapshot, DocumentSnapshot):
+            data = document_fields_or_snapshot._data or {}
+            values = tuple(
+                document_fields_or_snapshot.id if field == DOCUMENT_ID else _get_field(data, field)
+                for field, _ in self._orders
+            )
+            return self._copy(start=(values, document_fields_or_snapshot.id, inclusive))
+
+        fields = _normalize(dict(document_fields_or_snapshot))
+        values = tuple(fields.get(field) for field, _ in self._orders)
+        return self._copy(start=(values, None, inclusive))
+
+    def start_at(self, document_fields_or_snapshot) -> "Query":
+        return self._cursor(document_fields_or_snapshot, inclusive=True)
+
+    def start_after(self, document_fields_or_snapshot) -> "Query":
+        return self._cursor(document_fields_or_snapshot, inclusive=False)
+
+    def count(self, alias: Optional[str] = None) -> "AggregationQuery":
+        return AggregationQuery(self, alias or "field_1")
+
+    def _matches(self, doc_id: str, data: Dict[str, Any]) -> bool:
+        for field_path, op, expected in self._filters:
+            actual = doc_id if field_path == DOCUMENT_ID else _get_field(data, field_path)
+            if actual is _MISSING:
+                return False
+            if not _compare(actual, op, expected):
+                return False
+        for field_path, _ in self._orders:
+            if field_path != DOCUMENT_ID and _get_field(data, field_path) is _MISSING:
+                return False  # Firestore drops documents missing an order_by field
+        return True
+
+    def _sort_key(self, doc_id: str, data: Dict[str, Any]) -> List[Any]:
+        return [doc_id if field == DOCUMENT_ID else _get_field(data, field) for field, _ in self._orders]
+
+    def _after_cursor(self, doc_id: str, data: Dict[str, Any]) -> bool:
+        values, cursor_id, inclusive = self._start
+        for (field, direction), cursor_value in zip(self._orders, values):
+            actual = doc_id if field == DOCUMENT_ID else _get_field(data, field)
+            order = _SortKey(actual)._cmp(_SortKey(cursor_value))
+            if direction == DESCENDING:
+                order = -order
+            if order != 0:
+                return order > 0
+        if cursor_id is None or any(field == DOCUMENT_ID for field, _ in self._orders):
+            return inclusive
+        # Implicit document ID tie-breaker follows the direction of the last order_by
+        last_direction = self._orders[-1][1] if self._orders else ASCENDING
+        order = (doc_id > cursor_id) - (doc_id < cursor_id)
+        if last_direction == DESCENDING:
+            order = -order
+        return order > 0 or (order == 0 and inclusive)
+
+    def _run(self, transaction=None) -> List[DocumentSnapshot]:
+        return self._client._run_query(self, transaction)
+
+    async def get(self, transaction=None) -> List[DocumentSnapshot]:
+        return self._run(transaction)
+
+    async def stream(self, transaction=None) -> AsyncIterator[DocumentSnapshot]:
+        for snapshot in self._run(transaction):
+            yield snapshot
+
+
+class CollectionReference(Query):
+    def __init__(self, client: "InMemoryFirestore", path: str):
+        super().__init__(client, path)
+
+    @property
+    def id(self) -> str:
+        return self._collection_path.rsplit("/", 1)[-1]
+
+    def document(self, document_id: Optional[str] = None) -> DocumentReference:
+        return DocumentReference(self._client, f"{self._collection_path}/{document_id or _auto_id()}")
+
+    async def add(self, document_data: Dict[str, Any], document_id: Optional[str] = None):
+        ref = self.document(document_id)
+        result = await ref.create(document_data)
+        return result.update_time, ref
+
+
+class AggregationQuery:
+    def __init__(self, query: Query, alias: str):
+        self._query = query
+        self._aliases = [alias]
+
+    def count(self, alias: Optional[str] = None) -> "AggregationQuery":
+        self._aliases.append(alias or f"field_{len(self._aliases) + 1}")
+        return self
+
+    async def get(self, transaction=None) -> List[List[AggregationResult]]:
+        # Counting happens in the engine: no snapshots are materialized
+        total = self._query._client._count(self._query)
+        read_time = self._query._client._now()
+        return [[AggregationResult(alias, total, read_time) for alias in self._aliases]]
+
+
+def _compare(actual: Any, op: str, expected: Any) -> bool:
+    if op == "==":
+        return _SortKey(actual) == _SortKey(expected)
+    if op == "!=":
+        return actual is not None and not _SortKey(actual) == _SortKey(expected)
+    if op == "in":
+        return any(_SortKey(actual) == _SortKey(v) for v in expected)
+    if op == "not-in":
+        return actual is not None and not any(_SortKey(actual) == _SortKey(v) for v in expected)
+    if op == "array_contains":
+        return isinstance(actual, list) and expected in actual
+    if op == "array_contains_any":
+        return isinstance(actual, list) and any(v in actual for v in expected)
+    # Range filters only match values of the same type (like Firestore)
+    if _type_rank(actual) != _type_rank(expected):
+        return False
+    order = _SortKey(actual)._cmp(_SortKey(expected))
+    return {"<": order < 0, "<=": order <= 0, ">": order > 0, ">=": order >= 0}[op]
+
+
+class WriteBatch:
+    def __init__(self, client: "InMemoryFirestore"):
+        self._client = client
+        self._writes: List[Tuple] = []
+        self.write_results: Optional[List[WriteResult]] = None
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def _add(self, write: Tuple) -> None:
+        self._writes.append(write)
+
+    def set(self, reference: DocumentReference, document_data: Dict[str, Any], merge: bool = False) -> None:
+        self._add(("set", reference, document_data, merge))
+
+    def create(self, reference: DocumentReference, document_data: Dict[str, Any]) -> None:
+        self._add(("create", reference, document_data, None))
+
+    def update(self, reference: DocumentReference, field_updates: Dict[str, Any],
+               option: Optional[WriteOption] = None) -> None:
+        self._add(("update", reference, field_updates, option))
+
+    def delete(self, reference: DocumentReference, option: Optional[WriteOption] = None) -> None:
+        self._add(("delete", reference, None, option))
+
+    async def commit(self) -> List[WriteResult]:
+        writes, self._writes = self._writes, []
+        self.write_results = self._client._commit(writes)
+        return self.write_results
+
+
+class Transaction(WriteBatch):
+    """Compatible with firestore.async_transactional (uses _begin/_commit/_rollback)."""
+
+    def __init__(self, client: "InMemoryFirestore", max_attempts: int = MAX_ATTEMPTS, read_only: bool = False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id: Optional[str] = None
+        self._read_versions: Dict[str, Optional[datetime.datetime]] = {}
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    @property
+    def id(self) -> Optional[str]:
+        return self._id
+
+    def _add(self, write: Tuple) -> None:
+        if self._read_only:
+            raise ValueError("Cannot perform write operation in read-only transaction.")
+        super()._add(write)
+
+    def _record_read(self, path: str, stored: Optional[_StoredDocument]) -> None:
+        if self._writes:
+            raise ReadAfterWriteError("Attempted read after write in a transaction.")
+        self._read_versions.setdefault(path, stored.update_time if stored else None)
+
+    def _clean_up(self) -> None:
+        self._writes = []
+        self._read_versions = {}
+        self._id = None
+
+    async def _begin(self, retry_id=None) -> None:
+        if self.in_progress:
+            raise ValueError(f"The transaction has already begun. Current transaction ID: {self._id!r}.")
+        self._id = _auto_id()
+
+    async def _rollback(self) -> None:
+        if not self.in_progress:
+            raise ValueError("The transaction has no transaction ID, so it cannot be rolled back.")
+        self._clean_up()
+
+    async def _commit(self) -> List[WriteResult]:
+        if not self.in_progress:
+            raise ValueError("The transaction has no transaction ID, so it cannot be committed.")
+        # On failure the transaction stays in progress so the caller can roll back
+        self.write_results = self._client._commit(self._writes, self._read_versions)
+        self._clean_up()
+        return self.write_results
+
+    # Coroutines resolving to an async iterator, like AsyncTransaction's:
+    # `async for snap in await transaction.get_all(refs)`
+    async def get_all(self, references: Iterable[DocumentReference]) -> AsyncIterator[DocumentSnapshot]:
+        return self._client.get_all(references, transaction=self)
+
+    async def get(self, ref_or_query) -> AsyncIterator[DocumentSnapshot]:
+        if isinstance(ref_or_query, DocumentReference):
+            return self._client.get_all([ref_or_query], transaction=self)
+        return ref_or_query.stream(transaction=self)
+
+
+class InMemoryFirestore:
+    """Async Firestore client stand-in backed by process memory."""
+
+    def __init__(self):
+        self._collections: Dict[str, Dict[str, _StoredDocument]] = {}
+        self._lock = threading.RLock()
+        self._last_time = datetime.datetime.fromtimestamp(0, datetime.timezone.utc)
+
+    # --- Client API ---
+
+    def collection(self, collection_path: str) -> CollectionReference:
+        return CollectionReference(self, collection_path.strip("/"))
+
+    def document(self, document_path: str) -> DocumentReference:
+        return DocumentReference(self, document_path.strip("/"))
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def transaction(self, max_attempts: int = MAX_ATTEMPTS, read_only: bool = False) -> Transaction:
+        return Transaction(self, max_attempts=max_attempts, read_only=read_only)
+
+    def write_option(self, **kwargs) -> WriteOption:
+        if len(kwargs) != 1 or not set(kwargs) <= {"last_update_time", "exists"}:
+            raise TypeError("Exactly one of last_update_time or exists must be provided.")
+        return WriteOption(**kwargs)
+
+    async def get_all(self, references: Iterable[DocumentReference], field_paths: Optional[Iterable[str]] = None,
+                      transaction: Optional[Transaction] = None) -> AsyncIterator[DocumentSnapshot]:
+        snapshots = [self._read(ref, field_paths, transaction) for ref in references]
+        for snapshot in snapshots:
+            yield snapshot
+
+    # --- Sync helpers for fixtures and benchmark seeding ---
+
+    def seed(self, document_path: str, data: Dict[str, Any]) -> None:
+        """Writes a document synchronously (same semantics as set())."""
+        self._commit([("set", self.document(document_path), data, False)])
+
+    def peek(self, document_path: str) -> Optional[Dict[str, Any]]:
+        """Returns a copy of a document's data, or None if it does not exist."""
+        ref = self.document(document_path)
+        stored = self._stored(ref.path)
+        return copy.deepcopy(stored.data) if stored else None
+
+    def dump(self, collection_path: str) -> Dict[str, Dict[str, Any]]:
+        """Returns {document_id: data} for every document of a collection."""
+        with self._lock:
+            docs = self._collections.get(collection_path.strip("/"), {})
+            return {doc_id: copy.deepcopy(stored.data) for doc_id, stored in docs.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._collections.clear()
+
+    # --- Engine internals ---
+
+    def _now(self) -> datetime.datetime:
+        # Strictly increasing so update_time works as a version for preconditions
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if now <= self._last_time:
+            now = self._last_time + datetime.timedelta(microseconds=1)
+        self._last_time = now
+        return now
+
+    def _stored(self, path: str) -> Optional[_StoredDocument]:
+        collection_path, doc_id = path.rsplit("/", 1)
+        return self._collections.get(collection_path, {}).get(doc_id)
+
+    def _read(self, ref: DocumentReference, field_paths, transaction: Optional[Transaction]) -> DocumentSnapshot:
+        with self._lock:
+            stored = self._stored(ref.path)
+            if transaction is not None:
+                transaction._record_read(ref.path, stored)
+            read_time = self._now()
+            if stored is None:
+                return DocumentSnapshot(ref, None, read_time=read_time)
+            return DocumentSnapshot(ref, _project(stored.data, field_paths),
+                                    stored.create_time, stored.update_time, read_time)
+
+    def _matching(self, query: Query) -> List[Tuple[str, _StoredDocument]]:
+        docs = self._collections.get(query._collection_path, {})
+        matched = [(doc_id, stored) for doc_id, stored in docs.items() if query._matches(doc_id, stored.data)]
+
+        # Stable multi-key sort: implicit document ID order first, then order_by fields right to left
+        last_direction = query._orders[-1][1] if query._orders else ASCENDING
+        matched.sort(key=lambda item: item[0], reverse=last_direction == DESCENDING)
+        for index in range(len(query._orders) - 1, -1, -1):
+            field, direction = query._orders[index]
+            matched.sort(key=lambda item: _SortKey(query._sort_key(item[0], item[1].data)[index]),
+                         reverse=direction == DESCENDING)
+
+        if query._start is not None:
+            matched = [(doc_id, stored) for doc_id, stored in matched if query._after_cursor(doc_id, stored.data)]
+        matched = matched[query._offset:]
+        if query._limit is not None:
+            matched = matched[:query._limit]
+        return matched
+
+    def _run_query(self, query: Query, transaction: Optional[Transaction]) -> List[DocumentSnapshot]:
+        with self._lock:
+            read_time = self._now()
+            snapshots = []
+            for doc_id, stored in self._matching(query):
+                path = f"{query._collection_path}/{doc_id}"
+                if transaction is not None:
+                    transaction._record_read(path, stored)
+                snapshots.append(DocumentSnapshot(
+                    DocumentReference(self, path), _project(stored.data, query._projection),
+                    stored.create_time, stored.update_time, read_time))
+            return snapshots
+
+    def _count(self, query: Query) -> int:
+        with self._lock:
+            return len(self._matching(query))
+
+    def _check(self, kind: str, ref: DocumentReference, option: Optional[WriteOption],
+               stored: Optional[_StoredDocument]) -> None:
+        if kind == "create" and stored is not None:
+            raise AlreadyExists(f"Document already exists: {ref.path}")
+        if kind == "update" and stored is None:
+            raise NotFound(f"No document to update: {ref.path}")
+        if option is None:
+            return
+        if option.exists is not None and option.exists != (stored is not None):
+            raise FailedPrecondition(f"Document existence precondition failed: {ref.path}")
+        if option.last_update_time is not None:
+            if stored is None or stored.update_time != _utc(option.last_update_time):
+                raise FailedPrecondition(f"Document update_time precondition failed: {ref.path}")
+
+    def _commit(self, writes: List[Tuple],
+                read_versions: Optional[Dict[str, Optional[datetime.datetime]]] = None) -> List[WriteResult]:
+        with self._lock:
+            # 1. Transaction reads must still be current (optimistic concurrency)
+            for path, version in (read_versions or {}).items():
+                stored = self._stored(path)
+                if (stored.update_time if stored else None) != version:
+                    raise Aborted(f"Transaction lost a race on {path}; retry")
+
+            # 2. Every precondition is checked before anything is applied
+            staged: Dict[str, Optional[_StoredDocument]] = {}
+            for kind, ref, _, option in writes:
+                stored = staged[ref.path] if ref.path in staged else self._stored(ref.path)
+                self._check(kind, ref, option if kind in ("update", "delete") else None, stored)
+                staged[ref.path] = None if kind == "delete" else (stored or _StoredDocument({}, None, None))
+
+            # 3. Apply all writes with one commit time
+            now = self._now()
+            results = []
+            for kind, ref, data, option in writes:
+                collection_path, doc_id = ref.path.rsplit("/", 1)
+                docs = self._collections.setdefault(collection_path, {})
+                stored = docs.get(doc_id)
+                if kind == "delete":
+                    docs.pop(doc_id, None)
+                    results.append(WriteResult(now))
+                    continue
+
+                if kind == "update" or (kind == "set" and option):
+                    new_data = copy.deepcopy(stored.data) if stored else {}
+                    if kind == "update":
+                        for field_path, value in data.items():
+                            _apply_value(new_data, field_path, value, now)
+                    else:
+                        _merge_into(new_data, data, now)
+                else:
+                    new_data = {}
+                    for field, value in data.items():
+                        _apply_value(new_data, field, value, now)
+
+                docs[doc_id] = _StoredDocument(new_data, stored.create_time if stored else now, now)
+                results.append(WriteResult(now))
+            return results
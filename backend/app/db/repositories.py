@@ -0,0 +1,1099 @@
+"""
+Async data access for the Firestore collections.
+
+Routes go through these repositories instead of building document references
+themselves. Every call awaits the async Firestore client, so a single worker
+keeps many RPCs in flight instead of blocking a thread per request.
+
+Backends: a repository wraps whatever app.db.firestore.get_async_db() returns,
+either the real firestore_async client or the transactional in-memory engine
+(app/db/memory.py, DB_BACKEND=memory). Both expose the same client surface, so
+the repository code is shared and only the engine underneath changes.
+"""
+import asyncio
+import random
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException, status
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+from app.core.utils import pdf_job_id, recipient_summary
+from app.core.config import settings
+from app.core.state_machine import OrderStatus, ALLOWED_TRANSITIONS, is_valid_transition, get_public_step_label
+from app.db.instrumentation import instrumented, transactional, READ, WRITE, TRANSACTION
+from app.db.collections import (
+    ORDERS, ORDER_PUBLIC, ORDER_STATUS_HISTORY, ADMIN_AUDIT_LOGS, PAYMENTS, IDEMPOTENCY_KEYS, JOBS, PRINT_BATCHES,
+    ORDER_STATUS_COUNTERS, OUTBOX
+)
+
+# Firestore allows 500 writes per commit; a status change is 4 writes per order,
+# plus one status-counter write per commit
+MAX_WRITES_PER_BATCH = 500
+BULK_ORDERS_PER_BATCH = (MAX_WRITES_PER_BATCH - 1) // 4
+
+# Field masks: listings never download letter_content (up to 20k chars) or the full recipient
+ADMIN_LIST_FIELDS = [
+    "tracking_code", "status", "created_at", "status_updated_at", "total_amount", "is_guest", "user_id",
+    "recipient_summary", "pii_cleaned_at",
+]
+PRINT_BATCH_FIELDS = ["tracking_code", "recipient", "created_at", "print_batch_id"]
+TRANSITION_FIELDS = ["status", "tracking_code"]
+
+ALL_STATUSES = list(ALLOWED_TRANSITIONS)
+
+# Per-order outcomes of bulk_transition_status
+BULK_UPDATED = "UPDATED"
+BULK_NOT_FOUND = "NOT_FOUND"
+BULK_STATUS_MISMATCH = "STATUS_MISMATCH"
+BULK_INVALID_TRANSITION = "INVALID_TRANSITION"
+BULK_DUPLICATE = "DUPLICATE"
+BULK_ERROR = "ERROR"
+
+
+def stage_status_counts(db, writer, deltas: Dict[Optional[str], int]) -> None:
+    """
+    Adds one order-status counter update to a transaction or batch, so the
+    dashboard counts move atomically with the status change itself.
+
+    Counts are spread over ORDER_STATUS_COUNTER_SHARDS documents (a random one
+    per write) to stay clear of Firestore's ~1 write/second per document limit.
+    `deltas` maps status -> change; a None status (order creation) is ignored.
+    """
+    increments = {
+        order_status: firestore.Increment(delta)
+        for order_status, delta in deltas.items()
+        if order_status and delta
+    }
+    if not increments:
+        return
+    shard = random.randrange(settings.ORDER_STATUS_COUNTER_SHARDS)
+    writer.set(
+        db.collection(ORDER_STATUS_COUNTERS).document(f"shard_{shard}"),
+        {"counts": increments},
+        merge=True
+    )
+
+
+def _transition_deltas(from_status: Optional[str], to_status: str, count: int = 1) -> Dict[Optional[str], int]:
+    if from_status == to_status:
+        return {}
+    return {from_status: -count, to_status: count}
+
+
+# Outbox entry kinds (see app/services/outbox_dispatcher.py)
+OUTBOX_PDF_GENERATE = "pdf_generate"
+
+
+def stage_outbox_entry(db, writer, entry_id: str, kind: str, payload: Dict[str, Any]) -> None:
+    """
+    Adds an outbox entry to a transaction or batch, so the side effect (e.g. a
+    Cloud Tasks job) is recorded atomically with the state change that causes
+    it. The dispatcher delivers it later, at least once.
+    """
+    writer.set(db.collection(OUTBOX).document(entry_id), {
+        "kind": kind,
+        "payload": payload,
+        "status": "PENDING",
+        "attempts": 0,
+        "available_at": datetime.now(timezone.utc),
+        "created_at": firestore.SERVER_TIMESTAMP
+    })
+
+
+class OrderRepository:
+    def __init__(self, db):
+        self.db = db
+
+    def new_order_id(self) -> str:
+        return self.db.collection(ORDERS).document().id
+
+    @instrumented(READ)
+    async def get(self, order_id: str) -> Optional[Dict[str, Any]]:
+        snapshot = await self.db.collection(ORDERS).document(order_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    @instrumented(READ)
+    async def get_public(self, tracking_code: str) -> Optional[Dict[str, Any]]:
+        snapshot = await self.db.collection(ORDER_PUBLIC).document(tracking_code).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    @instrumented(READ)
+    async def get_idempotency_record(self, key_id: str):
+        return await self.db.collection(IDEMPOTENCY_KEYS).document(key_id).get()
+
+    @instrumented(WRITE)
+    async def create(
+        self,
+        order_id: str,
+        order_data: Dict[str, Any],
+        public_data: Dict[str, Any],
+        idempotency_key_id: Optional[str] = None,
+        idempotency_data: Optional[Dict[str, Any]] = None,
+        expired_idempotency_snapshot=None,
+    ) -> bool:
+        """
+        Writes orders, order_public, history and audit records in one batch.
+        With an idempotency key, idempotency_keys/{key} is written in the same batch
+        under a create-if-absent precondition (or, for an expired key, a
+        last_update_time precondition).
+        Returns False if a concurrent request claimed the key first.
+        """
+        timestamp = firestore.SERVER_TIMESTAMP
+        batch = self.db.batch()
+
+        # a) orders/{orderId} (PRIVATE)
+        batch.set(self.db.collection(ORDERS).document(order_id), order_data)
+
+        # b) order_public/{tracking_code} (PUBLIC) - STRICTLY NO PII
+        batch.set(self.db.collection(ORDER_PUBLIC).document(order_data["tracking_code"]), public_data)
+
+        # c) order_status_history/{history_id}
+        batch.set(self.db.collection(ORDER_STATUS_HISTORY).document(), {
+            "order_id": order_id,
+            "from_status": None,
+            "to_status": order_data["status"],
+            "actor": "system",
+            "timestamp": timestamp
+        })
+
+        # d) admin_audit_logs/{log_id}
+        batch.set(self.db.collection(ADMIN_AUDIT_LOGS).document(), {
+            "action": "ORDER_CREATED",
+            "order_id": order_id,
+            "actor": "system",
+            "timestamp": timestamp
+        })
+
+        # e) dashboard status counters
+        stage_status_counts(self.db, batch, {order_data["status"]: 1})
+
+        # f) idempotency_keys/{key}
+        if idempotency_key_id:
+            idempotency_ref = self.db.collection(IDEMPOTENCY_KEYS).document(idempotency_key_id)
+            if expired_idempotency_snapshot is not None:
+                batch.update(idempotency_ref, idempotency_data, option=self.db.write_option(
+                    last_update_time=expired_idempotency_snapshot.update_time))
+            else:
+                batch.create(idempotency_ref, idempotency_data)
+
+        try:
+            await batch.commit()
+        except (AlreadyExists, FailedPrecondition):
+            return False
+        return True
+
+    @instrumented(TRANSACTION)
+    async def transition_status(
+        self,
+        order_id: str,
+        expected_from_status: str,
+        to_status: str,
+        actor_uid: str,
+        note: Optional[str] = None,
+    ) -> Tuple[str, str]:
+        """
+        Admin status change with optimistic locking and atomic fan-out writes.
+        Returns (previous_status, tracking_code).
+        """
+        transaction = self.db.transaction()
+        order_ref = self.db.collection(ORDERS).document(order_id)
+
+        @transactional
+        async def update_in_transaction(transaction, order_ref):
+            snapshot = await order_ref.get(transaction=transaction)
+
+            if not snapshot.exists:
+                raise HTTPException(status_code=404, detail="Order not found")
+
+            data = snapshot.to_dict()
+            current_status = data.get("status")
+            tracking_code = data.get("tracking_code")
+
+            # 1. Optimistic Locking Check (Expected vs Current)
+            if current_status != expected_from_status:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail={
+                        "code": "STATUS_MISMATCH",
+                        "current_status": current_status,
+                        "message": f"Expected status {expected_from_status} but order is currently in {current_status}"
+                    }
+                )
+
+            # 2. State Machine Rule Engine Check
+            if not is_valid_transition(current_status, to_status):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid transition from {current_status} to {to_status}"
+                )
+
+            # 3. Perform the Atomic Writes
+            self._stage_transition(transaction, order_ref, tracking_code, current_status, to_status, actor_uid, note)
+
+            return current_status, tracking_code
+
+        return await update_in_transaction(transaction, order_ref)
+
+    def _stage_transition(
+        self,
+        writer,
+        order_ref,
+        tracking_code: str,
+        from_status: str,
+        to_status: str,
+        actor_uid: str,
+        note: Optional[str],
+        option=None,
+        source: str = "admin_panel",
+        count_status: bool = True,
+    ) -> None:
+        """
+        Adds the four status-change writes to a transaction or batch, plus the
+        status counter update unless the caller stages counters itself (count_status=False).
+        """
+        timestamp = firestore.SERVER_TIMESTAMP
+
+        # a) orders.status (the optional precondition guards batches against concurrent changes)
+        order_update = {
+            "status": to_status,
+            "status_updated_at": timestamp,
+            "status_updated_by": actor_uid
+        }
+        if option is not None:
+            writer.update(order_ref, order_update, option=option)
+        else:
+            writer.update(order_ref, order_update)
+
+        # b) order_public (NO PII)
+        public_ref = self.db.collection(ORDER_PUBLIC).document(tracking_code)
+        writer.update(public_ref, {
+            "status": to_status,
+            "status_updated_at": timestamp,
+            "public_step_label": get_public_step_label(to_status)
+        })
+
+        # c) order_status_history
+        writer.set(self.db.collection(ORDER_STATUS_HISTORY).document(), {
+            "order_id": order_ref.id,
+            "from_status": from_status,
+            "to_status": to_status,
+            "actor": f"admin_{actor_uid}",
+            "source": source,
+            "timestamp": timestamp,
+            "note": note
+        })
+
+        # d) admin_audit_logs
+        writer.set(self.db.collection(ADMIN_AUDIT_LOGS).document(), {
+            "action": "ORDER_STATUS_CHANGE",
+            "order_id": order_ref.id,
+            "actor": actor_uid,
+            "metadata": {
+                "from": from_status,
+                "to": to_status
+            },
+            "timestamp": timestamp
+        })
+
+        # e) dashboard status counters
+        if count_status:
+            stage_status_counts(self.db, writer, _transition_deltas(from_status, to_status))
+
+    @instrumented(WRITE)
+    async def bulk_transition_status(
+        self,
+        items: List[Tuple[str, str]],
+        to_status: str,
+        actor_uid: str,
+        note: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Moves many orders to `to_status` with one read round trip and chunked batch commits.
+        `items` are (order_id, expected_from_status) pairs. Returns one result per item,
+        in request order: {"order_id", "result", "current_status", "tracking_code", "message"}.
+
+        Every order write carries a last_update_time precondition from the read, so a
+        concurrent change fails its chunk; that chunk is then retried order by order
+        through transition_status() to get exact per-order outcomes.
+        """
+        results: List[Dict[str, Any]] = [
+            {"order_id": order_id, "result": None, "current_status": None, "tracking_code": None, "message": None}
+            for order_id, _ in items
+        ]
+
+        # 1. Read every distinct order in a single batched get
+        refs = {}
+        for order_id, _ in items:
+            refs.setdefault(order_id, self.db.collection(ORDERS).document(order_id))
+        snapshots = {
+            snapshot.id: snapshot
+            async for snapshot in self.db.get_all(list(refs.values()), field_paths=TRANSITION_FIELDS)
+        }
+
+        # 2. Validate each item against the snapshot and the state machine
+        valid = []  # (index, snapshot)
+        seen = set()
+        for index, (order_id, expected_from_status) in enumerate(items):
+            result = results[index]
+            snapshot = snapshots.get(order_id)
+            if order_id in seen:
+                result.update(result=BULK_DUPLICATE, message="Order listed more than once")
+                continue
+            seen.add(order_id)
+            if snapshot is None or not snapshot.exists:
+                result.update(result=BULK_NOT_FOUND, message="Order not found")
+                continue
+            data = snapshot.to_dict()
+            current_status = data.get("status")
+            result.update(current_status=current_status, tracking_code=data.get("tracking_code"))
+            if current_status != expected_from_status:
+                result.update(
+                    result=BULK_STATUS_MISMATCH,
+                    message=f"Expected status {expected_from_status} but order is currently in {current_status}"
+                )
+            elif not is_valid_transition(current_status, to_status):
+                result.update(result=BULK_INVALID_TRANSITION, message=f"Invalid transition from {current_status} to {to_status}")
+            else:
+                valid.append((index, snapshot))
+
+        # 3. Commit valid orders in batches within Firestore's per-commit write limit.
+        # A chunk never raises: every item of a failed chunk gets its own result, so
+        # the caller can report (and invalidate caches for) the chunks that committed.
+        async def commit_chunk(chunk):
+            try:
+                batch = self.db.batch()
+                for index, snapshot in chunk:
+                    self._stage_transition(
+                        batch, snapshot.reference, results[index]["tracking_code"], results[index]["current_status"],
+                        to_status, actor_uid, note,
+                        option=self.db.write_option(last_update_time=snapshot.update_time),
+                        source="admin_panel_bulk",
+                        count_status=False,
+                    )
+                # One counter write for the whole chunk
+                deltas = Counter()
+                for index, _ in chunk:
+                    for order_status, delta in _transition_deltas(results[index]["current_status"], to_status).items():
+                        deltas[order_status] += delta
+                stage_status_counts(self.db, batch, deltas)
+                await batch.commit()
+            except (FailedPrecondition, NotFound):
+                # Something in this chunk changed (or lost its public doc) since the read
+                for index, _ in chunk:
+                    await self._transition_one(results[index], items[index][1], to_status, actor_uid, note)
+                return
+            except Exception as e:
+                # E.g. DeadlineExceeded: the batch may or may not have been applied
+                for index, _ in chunk:
+                    results[index].update(result=BULK_ERROR, message=f"Commit failed, re-check the order: {e}")
+                return
+            for index, _ in chunk:
+                results[index].update(result=BULK_UPDATED, message=None)
+
+        chunks = [valid[i:i + BULK_ORDERS_PER_BATCH] for i in range(0, len(valid), BULK_ORDERS_PER_BATCH)]
+        await asyncio.gather(*(commit_chunk(chunk) for chunk in chunks))
+        return results
+
+    async def _transition_one(self, result: Dict[str, Any], expected_from_status: str, to_status: str,
+                              actor_uid: str, note: Optional[str]) -> None:
+        try:
+            _, tracking_code = await self.transition_status(
+                result["order_id"], expected_from_status, to_status, actor_uid, note
+            )
+            result.update(result=BULK_UPDATED, current_status=expected_from_status, tracking_code=tracking_code, message=None)
+        except HTTPException as e:
+            detail = e.detail if isinstance(e.detail, dict) else {"message": e.detail}
+            code = {404: BULK_NOT_FOUND, 409: BULK_STATUS_MISMATCH}.get(e.status_code, BULK_INVALID_TRANSITION)
+            result.update(result=code, current_status=detail.get("current_status", result["current_status"]),
+                          message=detail.get("message"))
+        except Exception as e:
+            result.update(result=BULK_ERROR, message=str(e))
+
+    @instrumented(READ)
+    async def list_page(self, status_filter: Optional[str], limit: int, after: Optional[Tuple[Any, str]]):
+        """
+        Returns one page of order snapshots ordered by created_at descending.
+        `after` is the (created_at, order_id) of the previous page's last order:
+        the cursor is built from those values, with no read of that document.
+        """
+        query = (
+            self.db.collection(ORDERS)
+            .order_by("created_at", direction=firestore.Query.DESCENDING)
+            .order_by(FieldPath.document_id(), direction=firestore.Query.DESCENDING)
+            .select(ADMIN_LIST_FIELDS)
+        )
+
+        # Filtering (Requires Composite Indexes in Firestore)
+        if status_filter:
+            query = query.where(filter=firestore.FieldFilter("status", "==", status_filter))
+
+        # Cursor Pagination logic
+        if after:
+            created_at, order_id = after
+            query = query.start_after({"created_at": created_at, FieldPath.document_id(): order_id})
+
+        return list(await query.limit(limit).get())
+
+    @instrumented(READ)
+    async def get_recipient_summaries(self, order_ids: List[str]) -> Dict[str, str]:
+        """
+        Summaries for orders created before recipient_summary was stored, computed
+        from a single masked batch read of recipient.address.
+        """
+        refs = [self.db.collection(ORDERS).document(order_id) for order_id in order_ids]
+        return {
+            snapshot.id: recipient_summary((snapshot.to_dict() or {}).get("recipient"))
+            async for snapshot in self.db.get_all(refs, field_paths=["recipient.address"])
+            if snapshot.exists
+        }
+
+    @instrumented(READ)
+    async def list_print_ready(self, limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Up to `limit` (order_id, data) pairs that can go into a new print batch:
+        READY_FOR_PRINT, PDF READY and not already in a batch. Two equality
+        filters, so Firestore's single-field indexes serve it without a composite one.
+        """
+        query = (
+            self.db.collection(ORDERS)
+            .where(filter=firestore.FieldFilter("status", "==", OrderStatus.READY_FOR_PRINT))
+            .where(filter=firestore.FieldFilter("pdf_status", "==", "READY"))
+            .select(PRINT_BATCH_FIELDS)
+        )
+        ready = []
+        # Batched orders stay READY_FOR_PRINT until the shop marks them PRINTED; skip them
+        async for doc in query.stream():
+            data = doc.to_dict()
+            if data.get("print_batch_id"):
+                continue
+            ready.append((doc.id, data))
+            if len(ready) >= limit:
+                break
+        return ready
+
+    @instrumented(READ)
+    async def page_pii_cleanup_candidates(
+        self, order_status: str, cutoff: Any, limit: int, after: Optional[Tuple[Any, str]] = None
+    ) -> List[Any]:
+        """
+        One page of not yet anonymized `order_status` orders created before `cutoff`,
+        oldest first. `after` is the (created_at, order_id) of the previous page's
+        last order. Served by the (status, pii_anonymized, created_at) composite index
+        in firestore.indexes.json, so orders swept by earlier jobs are never read
+        again; only the fields the sweep needs are downloaded.
+        """
+        query = (
+            self.db.collection(ORDERS)
+            .where(filter=firestore.FieldFilter("status", "==", order_status))
+            .where(filter=firestore.FieldFilter("pii_anonymized", "==", False))
+            .where(filter=firestore.FieldFilter("created_at", "<", cutoff))
+            .order_by("created_at")
+            .order_by(FieldPath.document_id())
+            .select(["created_at"])
+        )
+        if after:
+            created_at, order_id = after
+            query = query.start_after({"created_at": created_at, FieldPath.document_id(): order_id})
+        return list(await query.limit(limit).get())
+
+    @instrumented(READ)
+    async def count_pii_cleanup_candidates(self, order_status: str, before: Any, not_before: Any = None) -> int:
+        """
+        Aggregation count of not yet anonymized `order_status` orders with
+        not_before <= created_at < before.
+        Billed per 1000 index entries scanned; no documents are downloaded.
+        """
+        query = (
+            self.db.collection(ORDERS)
+            .where(filter=firestore.FieldFilter("status", "==", order_status))
+            .where(filter=firestore.FieldFilter("pii_anonymized", "==", False))
+            .where(filter=firestore.FieldFilter("created_at", "<", before))
+        )
+        if not_before is not None:
+            query = query.where(filter=firestore.FieldFilter("created_at", ">=", not_before))
+        results = await query.count(alias="total").get()
+        return int(results[0][0].value)
+
+    @instrumented(WRITE)
+    async def anonymize_many(self, order_ids: List[str]) -> None:
+        """Strips PII from the given orders, 500 updates per batched commit."""
+        async def commit_chunk(chunk):
+            batch = self.db.batch()
+            for order_id in chunk:
+                batch.update(self.db.collection(ORDERS).document(order_id), {
+                    "recipient": firestore.DELETE_FIELD,
+                    "letter_content": firestore.DELETE_FIELD,
+                    "notes": firestore.DELETE_FIELD,
+                    "recipient_summary": firestore.DELETE_FIELD,
+                    "pii_anonymized": True,
+                    "pii_cleaned_at": firestore.SERVER_TIMESTAMP
+                })
+            await batch.commit()
+
+        await asyncio.gather(*(
+            commit_chunk(order_ids[start:start + MAX_WRITES_PER_BATCH])
+            for start in range(0, len(order_ids), MAX_WRITES_PER_BATCH)
+        ))
+
+    @instrumented(WRITE)
+    async def backfill_pii_flags(self, limit: int, after: Optional[str] = None) -> Tuple[int, Optional[str]]:
+        """
+        Sets pii_anonymized on one page of orders (by document ID) that predate the
+        flag; the PII sweep only finds orders that have it. Returns (updated, last
+        order ID), the ID being None once every order was visited.
+        """
+        query = (self.db.collection(ORDERS)
+            .order_by(FieldPath.document_id())
+            .select(["pii_anonymized", "pii_cleaned_at"])
+            .limit(limit))
+        if after:
+            query = query.start_after({FieldPath.document_id(): after})
+        page = list(await query.get())
+
+        batch = self.db.batch()
+        updated = 0
+        for doc in page:
+            data = doc.to_dict()
+            if "pii_anonymized" not in data:
+                batch.update(doc.reference, {"pii_anonymized": bool(data.get("pii_cleaned_at"))})
+                updated += 1
+        if updated:
+            await batch.commit()
+        return updated, (page[-1].id if len(page) == limit else None)
+
+    @instrumented(WRITE)
+    async def add_audit_log(self, data: Dict[str, Any]) -> None:
+        await self.db.collection(ADMIN_AUDIT_LOGS).document().set(data)
+
+
+def _intent_response(intent: Dict[str, Any]) -> Dict[str, Any]:
+    return {"token": intent.get("token", ""), "checkout_url": intent.get("checkout_url", ""), "status": "success"}
+
+
+class PaymentRepository:
+    def __init__(self, db):
+        self.db = db
+
+    async def create_intent(
+        self,
+        order_id: str,
+        create_checkout_intent: Callable[[str, float, str, Dict], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """
+        Two-phase intent creation, so the provider round trip never runs inside a
+        (retryable) transaction:
+        1. reserve_intent: transactionally serve the order's cached intent, or claim
+           the order's payment slot (a double click now waits instead of paying twice);
+        2. call the provider outside any transaction;
+        3. finalize_intent: store the payment and cache the intent on the order.
+        A failed provider call releases the slot.
+        """
+        cached, reservation = await self.reserve_intent(order_id)
+        if cached is not None:
+            return cached
+
+        try:
+            intent_result = await create_checkout_intent(
+                order_id, reservation["amount"], reservation["currency"], reservation["recipient"]
+            )
+        except Exception:
+            await self.release_intent(order_id, reservation["attempt_id"])
+            raise
+        return await self.finalize_intent(order_id, reservation, intent_result)
+
+    @instrumented(TRANSACTION)
+    async def reserve_intent(self, order_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Returns (cached_intent, None) while the order holds an unexpired intent,
+        otherwise (None, reservation) after claiming the order's payment slot for
+        PAYMENT_INTENT_RESERVATION_SECONDS. Raises 409 while another request holds it.
+        """
+        transaction = self.db.transaction()
+        order_ref = self.db.collection(ORDERS).document(order_id)
+
+        @transactional
+        async def process_reserve(transaction, order_ref):
+            snapshot = await order_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                raise HTTPException(status_code=404, detail="Order not found")
+
+            data = snapshot.to_dict()
+            if data.get("payment_status") == "PAID":
+                raise HTTPException(status_code=400, detail="Order is already paid")
+
+            # Per-order intent cache: read with the order itself, no payments query
+            now = datetime.now(timezone.utc)
+            intent = data.get("payment_intent") or {}
+            if intent.get("status") == "READY" and intent.get("expires_at") and intent["expires_at"] > now:
+                return _intent_response(intent), None
+            if intent.get("status") == "RESERVED" and intent.get("reserved_until") and intent["reserved_until"] > now:
+                raise HTTPException(status_code=409, detail="Payment is being prepared, please retry shortly")
+
+            # Calculate amount from backend (trust only backend)
+            # Note: In a real app we'd sum cart items here. For v0.1 we use the saved total_amount or default.
+            amount = data.get("total_amount", 100.0)
+            if amount <= 0:
+                amount = 100.0  # fallback for tests
+
+            attempt_id = uuid.uuid4().hex
+            transaction.update(order_ref, {"payment_intent": {
+                "status": "RESERVED",
+                "attempt_id": attempt_id,
+                "reserved_until": now + timedelta(seconds=settings.PAYMENT_INTENT_RESERVATION_SECONDS)
+            }})
+            return None, {
+                "attempt_id": attempt_id,
+                "amount": amount,
+                "currency": data.get("currency", "TRY"),
+                "recipient": data.get("recipient", {})
+            }
+
+        return await process_reserve(transaction, order_ref)
+
+    @instrumented(TRANSACTION)
+    async def finalize_intent(
+        self, order_id: str, reservation: Dict[str, Any], intent_result: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Stores the provider's intent: the PENDING payment document plus the cached
+        intent on the order. If the reservation lapsed and another request already
+        cached a live intent, that one is returned and this token is left unused.
+        """
+        transaction = self.db.transaction()
+        order_ref = self.db.collection(ORDERS).document(order_id)
+        payment_ref = self.db.collection(PAYMENTS).document(intent_result["token"])
+
+        @transactional
+        async def process_finalize(transaction, order_ref, payment_ref):
+            snapshot = await order_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                raise HTTPException(status_code=404, detail="Order not found")
+
+            data = snapshot.to_dict()
+            if data.get("payment_status") == "PAID":
+                raise HTTPException(status_code=400, detail="Order is already paid")
+
+            now = datetime.now(timezone.utc)
+            intent = data.get("payment_intent") or {}
+            if (intent.get("attempt_id") != reservation["attempt_id"] and intent.get("status") == "READY"
+                    and intent.get("expires_at") and intent["expires_at"] > now):
+                return _intent_response(intent)
+
+            timestamp = firestore.SERVER_TIMESTAMP
+
+            # 1. Update Order (payment_status + cached intent)
+            transaction.update(order_ref, {
+                "payment_status": "PAYMENT_PENDING",
+                "payment_intent": {
+                    "status": "READY",
+                    "attempt_id": reservation["attempt_id"],
+                    "token": intent_result["token"],
+                    "checkout_url": intent_result["checkout_url"],
+                    "expires_at": now + timedelta(seconds=settings.PAYMENT_INTENT_TTL_SECONDS)
+                }
+            })
+
+            # 2. Create Payment Document
+            transaction.set(payment_ref, {
+                "order_id": order_id,
+                "status": "PENDING",
+                "amount": reservation["amount"],
+                "currency": reservation["currency"],
+                "provider": "iyzico",
+                "token": intent_result["token"],
+                "checkout_url": intent_result["checkout_url"],
+                "created_at": timestamp
+            })
+
+            return intent_result
+
+        return await process_finalize(transaction, order_ref, payment_ref)
+
+    @instrumented(TRANSACTION)
+    async def release_intent(self, order_id: str, attempt_id: str) -> None:
+        """Frees the order's payment slot after a failed provider call, if still held by `attempt_id`."""
+        transaction = self.db.transaction()
+        order_ref = self.db.collection(ORDERS).document(order_id)
+
+        @transactional
+        async def process_release(transaction, order_ref):
+            snapshot = await order_ref.get(transaction=transaction)
+            if snapshot.exists and (snapshot.to_dict().get("payment_intent") or {}).get("attempt_id") == attempt_id:
+                transaction.update(order_ref, {"payment_intent": firestore.DELETE_FIELD})
+
+        await process_release(transaction, order_ref)
+
+    @instrumented(TRANSACTION)
+    async def apply_webhook(
+        self,
+        token: str,
+        order_id: str,
+        provider_status: str,
+        provider_payment_id: Optional[str],
+    ) -> Tuple[Optional[str], bool]:
+        """
+        Transactional write fan-out with DEDUP for a provider webhook.
+        Returns (tracking_code, newly_paid): the tracking code whenever the order is
+        paid by this token, and whether this delivery moved the order to PAID (and
+        wrote the PDF job's outbox entry). Payment and order are read together in
+        one batched get.
+        """
+        transaction = self.db.transaction()
+        payment_ref = self.db.collection(PAYMENTS).document(token)
+        order_ref = self.db.collection(ORDERS).document(order_id)
+
+        @transactional
+        async def process_webhook(transaction, payment_ref, order_ref):
+            # 1) ALL READS FIRST: one RPC for both documents
+            snapshots = {
+                snap.reference.path: snap
+                async for snap in self.db.get_all([payment_ref, order_ref], transaction=transaction)
+            }
+            snapshot = snapshots[payment_ref.path]
+            order_doc = snapshots[order_ref.path]
+            if not snapshot.exists:
+                # We don't fail a webhook 500 if token doesn't exist, just 200 OK so they stop retrying
+                return None, False
+
+            data = snapshot.to_dict()
+
+            # Dedup Check: Is this event already processed?
+            if data.get("status") in ["SUCCEEDED", "FAILED"]:
+                # Already processed (Double delivery from Provider) -> No-op
+                if data.get("status") == "SUCCEEDED" and order_doc.exists:
+                    return order_doc.to_dict().get("tracking_code"), False
+                return None, False
+
+            # 2) COMPUTE STATE
+            # Map provider status to internal status
+            internal_status = "SUCCEEDED" if provider_status.upper() == "SUCCESS" else "FAILED"
+            timestamp = firestore.SERVER_TIMESTAMP
+
+            # 3) ALL WRITES LAST
+            # a) UPDATE PAYMENTS
+            transaction.update(payment_ref, {
+                "status": internal_status,
+                "updated_at": timestamp,
+                "provider_payment_id": provider_payment_id
+            })
+
+            # If FAILED, just update payment doc and we stop here
+            if internal_status == "FAILED":
+                # Drop the cached intent so the next attempt asks the provider for a new one
+                transaction.update(order_ref, {"payment_status": "FAILED", "payment_intent": firestore.DELETE_FIELD})
+                return None, False
+
+            # SUCCESS LOGIC follows:
+            if not order_doc.exists:
+                return None, False
+
+            order_data = order_doc.to_dict()
+            tracking_code = order_data.get("tracking_code")
+
+            # b) UPDATE ORDERS
+            transaction.update(order_ref, {
+                "payment_status": "PAID",
+                "status": OrderStatus.PAID,
+                "paid_at": timestamp,
+                "status_updated_at": timestamp,
+                "status_updated_by": "system_webhook"
+            })
+
+            # c) UPDATE ORDER_PUBLIC (NO PII)
+            public_ref = self.db.collection(ORDER_PUBLIC).document(tracking_code)
+            transaction.update(public_ref, {
+                "status": OrderStatus.PAID,
+                "status_updated_at": timestamp,
+                "public_step_label": get_public_step_label(OrderStatus.PAID)
+            })
+
+            # d) UPDATE HISTORY + AUDIT
+            transaction.set(self.db.collection(ORDER_STATUS_HISTORY).document(), {
+                "order_id": order_id,
+                "from_status": order_data.get("status"),
+                "to_status": OrderStatus.PAID,
+                "actor": "system",
+                "source": "webhook",
+                "timestamp": timestamp
+            })
+
+            transaction.set(self.db.collection(ADMIN_AUDIT_LOGS).document(), {
+                "action": "PAYMENT_RECEIVED",
+                "order_id": order_id,
+                "actor": "system",
+                "timestamp": timestamp
+            })
+
+            # e) dashboard status counters
+            stage_status_counts(self.db, transaction, _transition_deltas(order_data.get("status"), OrderStatus.PAID))
+
+            # f) PDF job, delivered to Cloud Tasks by the outbox dispatcher
+            # (keyed by the content-derived job ID, which also names the task)
+            job_id = pdf_job_id(order_id, order_data)
+            stage_outbox_entry(self.db, transaction, job_id, OUTBOX_PDF_GENERATE, {
+                "job_id": job_id,
+                "order_id": order_id,
+                "tracking_code": tracking_code
+            })
+
+            return tracking_code, True
+
+        return await process_webhook(transaction, payment_ref, order_ref)
+
+
+class JobRepository:
+    def __init__(self, db):
+        self.db = db
+
+    @instrumented(TRANSACTION)
+    async def start_pdf_job(
+        self, order_id: str, job_type: str, attempt: int
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]], str]:
+        """
+        Takes the optimistic "PENDING" -> "GENERATING" lock for the order's PDF job.
+        The job is keyed by pdf_job_id (order + letter content), whatever ID the
+        caller enqueued it under, so one order/content pair renders at most once.
+        Returns (no-op message, None, job_id) if the job or the PDF is already done,
+        or (None, order data, job_id) when generation should proceed, so the
+        renderer needs no second read. Raises 404 / 409 for Cloud Tasks to handle.
+        """
+        transaction = self.db.transaction()
+        order_ref = self.db.collection(ORDERS).document(order_id)
+
+        @transactional
+        async def process_pdf_job(transaction, order_ref):
+            order_snap = await order_ref.get(transaction=transaction)
+            if not order_snap.exists:
+                raise HTTPException(status_code=404, detail="Order not found for PDF job")
+
+            order_data = order_snap.to_dict()
+            job_id = pdf_job_id(order_id, order_data)
+            job_ref = self.db.collection(JOBS).document(job_id)
+
+            # Check if job was already processed (Idempotency Key)
+            job_snap = await job_ref.get(transaction=transaction)
+            if job_snap.exists and job_snap.to_dict().get("status") == "SUCCEEDED":
+                return "No-op (Job already succeeded)", None, job_id
+
+            current_pdf_status = order_data.get("pdf_status")
+
+            # Idempotency checks based on domain model. A READY PDF from another job
+            # (older layout version) is re-rendered, unless the letter was since anonymized
+            if order_data.get("pii_cleaned_at"):
+                return "No-op (Order PII already cleaned)", None, job_id
+            if current_pdf_status == "READY" and order_data.get("pdf_job_id") in (None, job_id):
+                return "No-op (PDF already READY)", None, job_id
+
+            if current_pdf_status == "GENERATING":
+                # Extremely edge case where concurrent tasks picked this up OR previous attempt crashed mid-generation
+                # Best practice for Cloud Tasks is returning an error (e.g. 409) so it retries later instead of colliding.
+                raise HTTPException(status_code=409, detail="PDF generation currently locked / in progress")
+
+            # Assuming valid starting state: None or "PENDING" or "FAILED" (or READY from an older job)
+            # 1. Update state to GENERATING inside transaction
+            transaction.update(order_ref, {
+                "pdf_status": "GENERATING",
+                "pdf_updated_at": firestore.SERVER_TIMESTAMP
+            })
+
+            # 2. Record Job start
+            transaction.set(job_ref, {
+                "job_type": job_type,
+                "order_id": order_id,
+                "attempt": attempt,
+                "status": "RUNNING",
+                "created_at": firestore.SERVER_TIMESTAMP
+            })
+
+            return None, order_data, job_id
+
+        return await process_pdf_job(transaction, order_ref)
+
+    @instrumented(WRITE)
+    async def finish_pdf_job(
+        self, job_id: str, order_id: str, pdf_path: str, render_stats: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Marks the job SUCCEEDED (with render_ms / pdf_bytes / pdf_pages when given) and the PDF READY."""
+        batch = self.db.batch()
+        batch.set(self.db.collection(JOBS).document(job_id), {
+            "status": "SUCCEEDED",
+            **(render_stats or {}),
+            "updated_at": firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        batch.set(self.db.collection(ORDERS).document(order_id), {
+            "pdf_status": "READY",
+            "pdf_path": pdf_path,
+            "pdf_job_id": job_id,
+            "pdf_updated_at": firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        await batch.commit()
+
+    @instrumented(WRITE)
+    async def fail_pdf_job(self, job_id: str, order_id: str, error: str) -> None:
+        # Save failure context for Dead Letter processing
+        batch = self.db.batch()
+        batch.set(self.db.collection(JOBS).document(job_id), {
+            "status": "FAILED",
+            "last_error": error,
+            "updated_at": firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        batch.set(self.db.collection(ORDERS).document(order_id), {
+            "pdf_status": "FAILED",
+            "pdf_error_message": error,
+            "pdf_updated_at": firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        await batch.commit()
+
+    @instrumented(READ)
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        snapshot = await self.db.collection(JOBS).document(job_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    @instrumented(WRITE)
+    async def save_progress(self, job_id: str, data: Dict[str, Any]) -> None:
+        await self.db.collection(JOBS).document(job_id).set({
+            **data,
+            "updated_at": firestore.SERVER_TIMESTAMP
+        }, merge=True)
+
+    @instrumented(READ)
+    async def get_print_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        snapshot = await self.db.collection(PRINT_BATCHES).document(batch_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    @instrumented(TRANSACTION)
+    async def record_print_batch(
+        self, batch_id: str, order_ids: List[str], batch_data: Dict[str, Any]
+    ) -> bool:
+        """
+        Creates print_batches/{batch_id} and tags every member order with it, atomically.
+        Returns False if the batch was already recorded. Raises 409 if a member left
+        READY_FOR_PRINT or joined another batch since it was selected; the caller's
+        task retry then rebuilds the batch from fresh candidates.
+        """
+        transaction = self.db.transaction()
+        batch_ref = self.db.collection(PRINT_BATCHES).document(batch_id)
+        order_refs = [self.db.collection(ORDERS).document(order_id) for order_id in order_ids]
+
+        @transactional
+        async def process_print_batch(transaction, batch_ref, order_refs):
+            batch_snap = await batch_ref.get(transaction=transaction)
+            if batch_snap.exists:
+                return False
+
+            conflicts = []
+            async for snap in self.db.get_all(order_refs, transaction=transaction):
+                data = snap.to_dict() if snap.exists else {}
+                if data.get("status") != OrderStatus.READY_FOR_PRINT or data.get("print_batch_id") not in (None, batch_id):
+                    conflicts.append(snap.id)
+            if conflicts:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail={"message": "Orders changed while the print batch was built", "order_ids": conflicts}
+                )
+
+            transaction.set(batch_ref, {
+                **batch_data,
+                "order_ids": order_ids,
+                "order_count": len(order_ids),
+                "created_at": firestore.SERVER_TIMESTAMP
+            })
+            for order_ref in order_refs:
+                transaction.update(order_ref, {
+                    "print_batch_id": batch_id,
+                    "print_batched_at": firestore.SERVER_TIMESTAMP
+                })
+            return True
+
+        return await process_print_batch(transaction, batch_ref, order_refs)
+
+
+class OutboxRepository:
+    def __init__(self, db):
+        self.db = db
+
+    @instrumented(READ)
+    async def list_due(self, limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """Oldest PENDING entries whose next attempt is due, as (entry_id, data)."""
+        query = (self.db.collection(OUTBOX)
+            .where(filter=firestore.FieldFilter("status", "==", "PENDING"))
+            .where(filter=firestore.FieldFilter("available_at", "<=", datetime.now(timezone.utc)))
+            .order_by("available_at")
+            .limit(limit))
+        return [(doc.id, doc.to_dict()) async for doc in query.stream()]
+
+    @instrumented(WRITE)
+    async def record_dispatch(self, dispatched: List[str], retries: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Marks delivered entries DISPATCHED and reschedules failed ones
+        (entry_id -> {"attempts", "available_at", "last_error"}), 500 writes per batched commit.
+        """
+        updates = [(entry_id, {"status": "DISPATCHED", "dispatched_at": firestore.SERVER_TIMESTAMP})
+                   for entry_id in dispatched]
+        updates += [(entry_id, retry) for entry_id, retry in retries.items()]
+        for start in range(0, len(updates), MAX_WRITES_PER_BATCH):
+            batch = self.db.batch()
+            for entry_id, data in updates[start:start + MAX_WRITES_PER_BATCH]:
+                batch.update(self.db.collection(OUTBOX).document(entry_id), data)
+            await batch.commit()
+
+
+class StatsRepository:
+    def __init__(self, db):
+        self.db = db
+
+    @instrumented(READ)
+    async def get_status_counts(self) -> Dict[str, int]:
+        """Sums the counter shards: one read per shard, however many orders exist."""
+        totals = {order_status: 0 for order_status in ALL_STATUSES}
+        async for shard in self.db.collection(ORDER_STATUS_COUNTERS).stream():
+            for order_status, count in (shard.to_dict().get("counts") or {}).items():
+                totals[order_status] = totals.get(order_status, 0) + int(count)
+        return totals
+
+    @instrumented(TRANSACTION)
+    async def reconcile_status_counts(self) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """
+        Recomputes the counters from count() aggregations and rewrites the shards
+        (all counts on shard_0, the other shards removed) in one transaction.
+        Returns (counts, drift) where drift = recomputed - previous, per status.
+        """
+        transaction = self.db.transaction()
+
+        @transactional
+        async def process_reconcile(transaction):
+            # All reads first: exact counts, then the shards being replaced
+            results = await asyncio.gather(*(
+                self.db.collection(ORDERS)
+                .where(filter=firestore.FieldFilter("status", "==", order_status))
+                .count(alias="total")
+                .get(transaction=transaction)
+                for order_status in ALL_STATUSES
+            ))
+            counts = {order_status: int(result[0][0].value) for order_status, result in zip(ALL_STATUSES, results)}
+
+            previous = {order_status: 0 for order_status in ALL_STATUSES}
+            shard_refs = []
+            async for shard in self.db.collection(ORDER_STATUS_COUNTERS).stream(transaction=transaction):
+                shard_refs.append(shard.reference)
+                for order_status, count in (shard.to_dict().get("counts") or {}).items():
+                    previous[order_status] = previous.get(order_status, 0) + int(count)
+
+            for shard_ref in shard_refs:
+                if shard_ref.id != "shard_0":
+                    transaction.delete(shard_ref)
+            transaction.set(self.db.collection(ORDER_STATUS_COUNTERS).document("shard_0"), {
+                "counts": counts,
+                "reconciled_at": firestore.SERVER_TIMESTAMP
+            })
+            drift = {
+                order_status: counts.get(order_status, 0) - previous.get(order_status, 0)
+                for order_status in set(counts) | set(previous)
+                if counts.get(order_status, 0) != previous.get(order_status, 0)
+            }
+            return counts, drift
+
+        return await process_reconcile(transaction)
@@ -1,10 +1,14 @@
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import health, orders, admin, payments, ops
+from app.api.routes import health, orders, admin, payments, ops, metrics
 from app.core.config import settings
 from app.db.firestore import init_firebase
 from app.core.logging import RequestIdMiddleware, logger
 from app.core.rate_limit import setup_rate_limiting
+from app.core.metrics import MetricsMiddleware
+from app.services.pdf_worker import pdf_render_pool
+from app.services.payment_service import payment_service
 
 app = FastAPI(title=settings.PROJECT_NAME)
 
@@ -20,19 +24,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.add_middleware(RequestIdMiddleware)
+# Outermost, so latency covers every other middleware too
+app.add_middleware(MetricsMiddleware)
 
 # 3. Application startup events
 @app.on_event("startup")
 def startup_event():
     init_firebase()
+    # Process mode: spawn and warm the PDF workers now rather than on the first job
+    pdf_render_pool.start()
     logger.info("Application started and Firebase initialized.")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await run_in_threadpool(pdf_render_pool.shutdown)
+    await payment_service.client.aclose()
+
 # 4. Include routers
 app.include_router(health.router, prefix="/api", tags=["health"])
 app.include_router(orders.router, prefix="/api/orders", tags=["orders"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 app.include_router(payments.router, prefix="/api/payments", tags=["payments"])
 app.include_router(ops.router, prefix="/api/ops", tags=["ops"])
+app.include_router(metrics.router, prefix="/api", tags=["metrics"])
 
 @app.get("/")
 def root():
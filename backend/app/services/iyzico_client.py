@@ -0,0 +1,211 @@
+"""
+iyzico REST client on a shared, connection-pooled httpx.AsyncClient.
+
+Every call is bounded:
+- IYZICO_TIMEOUT_SECONDS per attempt (connect, read, write and pool wait),
+  never more than what is left of IYZICO_DEADLINE_SECONDS for the whole call;
+- up to IYZICO_MAX_RETRIES retries, with full-jitter exponential backoff
+  (random 0..IYZICO_RETRY_BACKOFF_SECONDS * 2^n), but only of attempts that
+  never reached iyzico (connect errors, connect and pool timeouts). Checkout
+  form initialize is not idempotent: a request that was sent and then timed
+  out or got a 429/5xx may already have opened a checkout session, and
+  resending it would open a second one, so those raise ProviderUnavailable
+  at once;
+- a circuit breaker: after IYZICO_BREAKER_FAILURE_THRESHOLD consecutive failed
+  calls it opens and calls fail immediately with ProviderUnavailable for
+  IYZICO_BREAKER_RESET_SECONDS, then a single trial call decides whether it
+  closes again.
+
+Business errors (an iyzico response with status "failure") are answered by a
+healthy provider: they raise IyzicoError and count as successes for the breaker.
+
+Requests are signed with iyzico's IYZWSv2 scheme (HMAC-SHA256 over random key,
+URI path and body), the same as the official SDK.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import random
+import secrets
+import time
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import IYZICO_CALLS, IYZICO_CIRCUIT_OPEN
+
+CHECKOUT_FORM_INITIALIZE_PATH = "/payment/iyzipos/checkoutform/initialize/auth/ecom"
+
+# The request was never sent, so resending it cannot duplicate anything
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class IyzicoError(Exception):
+    """The provider answered, but refused the request."""
+
+
+class ProviderUnavailable(IyzicoError):
+    """The provider could not be reached in time, or the circuit breaker is open."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: CLOSED -> OPEN -> HALF_OPEN (one trial call) -> CLOSED."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.retry_after() <= 0:
+            # Let one call through to probe the provider; should the probe never
+            # report back (e.g. cancelled), another is allowed after reset_timeout
+            self.state = self.HALF_OPEN
+            self._opened_at = self._clock()
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        IYZICO_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("iyzico circuit breaker opened", extra={"failures": self.failures})
+            self.state = self.OPEN
+            self._opened_at = self._clock()
+            IYZICO_CIRCUIT_OPEN.set(1)
+
+
+class IyzicoClient:
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.base_url = (base_url or settings.IYZICO_BASE_URL).rstrip("/")
+        self.api_key = api_key or settings.IYZICO_API_KEY
+        self.secret_key = secret_key or settings.IYZICO_SECRET_KEY
+        self.timeout = settings.IYZICO_TIMEOUT_SECONDS if timeout is None else timeout
+        self.deadline = settings.IYZICO_DEADLINE_SECONDS if deadline is None else deadline
+        self.max_retries = settings.IYZICO_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = settings.IYZICO_RETRY_BACKOFF_SECONDS if backoff is None else backoff
+        self.breaker = breaker or CircuitBreaker(
+            settings.IYZICO_BREAKER_FAILURE_THRESHOLD, settings.IYZICO_BREAKER_RESET_SECONDS
+        )
+        self._http: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _client(self) -> httpx.AsyncClient:
+        # Pooled connections belong to the loop that opened them; the app runs one
+        # loop, but test clients may start a fresh loop per request
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(
+                    max_connections=settings.IYZICO_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.IYZICO_MAX_CONNECTIONS,
+                ),
+            )
+            self._loop = loop
+        return self._http
+
+    async def aclose(self) -> None:
+        http, self._http, self._loop = self._http, None, None
+        if http is not None:
+            await http.aclose()
+
+    def _headers(self, path: str, body: bytes) -> Dict[str, str]:
+        random_key = f"{int(time.time() * 1000)}{secrets.token_hex(4)}"
+        signature = hmac.new(
+            self.secret_key.encode(), random_key.encode() + path.encode() + body, hashlib.sha256
+        ).hexdigest()
+        authorization = f"apiKey:{self.api_key}&randomKey:{random_key}&signature:{signature}"
+        return {
+            "Authorization": "IYZWSv2 " + base64.b64encode(authorization.encode()).decode(),
+            "x-iyzi-rnd": random_key,
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        }
+
+    async def post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POSTs `payload` and returns the decoded success response, within the call deadline."""
+        if not self.breaker.allow():
+            IYZICO_CALLS.labels("rejected").inc()
+            raise ProviderUnavailable("iyzico circuit breaker is open", self.breaker.retry_after())
+
+        body = json.dumps(payload).encode()
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                response = await self._client().post(
+                    path,
+                    content=body,
+                    headers=self._headers(path, body),
+                    timeout=min(self.timeout, remaining),
+                )
+                if response.status_code < 500 and response.status_code != 429:
+                    break
+                error, retryable = f"HTTP {response.status_code}", False
+            except UNSENT_ERRORS as exc:
+                error, retryable = f"{type(exc).__name__}: {exc}", True
+            except httpx.TransportError as exc:
+                error, retryable = f"{type(exc).__name__}: {exc}", False
+
+            # Full jitter; give up when the request may have been processed, no retry
+            # is left or it would not fit the deadline
+            delay = random.uniform(0, self.backoff * 2 ** attempt)
+            attempt += 1
+            if not retryable or attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                self.breaker.record_failure()
+                IYZICO_CALLS.labels("unavailable").inc()
+                logger.error("iyzico unavailable", extra={"path": path, "attempts": attempt, "error": error})
+                raise ProviderUnavailable(f"iyzico unavailable: {error}", self.breaker.retry_after())
+            await asyncio.sleep(delay)
+
+        self.breaker.record_success()
+        try:
+            result = response.json()
+        except ValueError:
+            IYZICO_CALLS.labels("error").inc()
+            raise IyzicoError(f"iyzico returned HTTP {response.status_code} with a non-JSON body")
+        if result.get("status") != "success":
+            IYZICO_CALLS.labels("error").inc()
+            raise IyzicoError(result.get("errorMessage") or f"HTTP {response.status_code}")
+        IYZICO_CALLS.labels("ok").inc()
+        return result
+
+    async def initialize_checkout_form(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.post(CHECKOUT_FORM_INITIALIZE_PATH, request)
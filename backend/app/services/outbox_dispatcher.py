@@ -0,0 +1,182 @@
+"""
+Delivers outbox entries (written inside the transactions that cause them) to
+Cloud Tasks.
+
+A paid order's PDF job is an `outbox` document committed with the payment
+webhook transaction, so a crash after the commit cannot lose it. `drain` takes
+due PENDING entries in batches of OUTBOX_BATCH_SIZE, creates their Cloud Tasks
+with one long-lived client and records the outcome of the whole batch in one
+batched write:
+- delivered entries become DISPATCHED;
+- failed ones stay PENDING with exponential, jittered backoff (capped at
+  OUTBOX_RETRY_MAX_SECONDS) and are retried by a later drain, indefinitely.
+
+Tasks are named after their entry, so Cloud Tasks rejects a second delivery of
+the same entry (two instances draining at once, or a crash between task
+creation and recording it) with AlreadyExists, which counts as delivered.
+
+Drains run after each paying webhook and from /api/ops/outbox-dispatch (Cloud
+Scheduler), which picks up whatever an instance left behind. One drain runs at
+a time per instance; a drain requested while one is running makes the running
+one do another pass, so entries committed meanwhile are not left waiting.
+"""
+import json
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from google.api_core.exceptions import AlreadyExists
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.repositories import OutboxRepository, OUTBOX_PDF_GENERATE
+
+TASKS_LOCATION = "europe-west1"  # Matches the Cloud Run location
+PDF_QUEUE = "ops-pdf-generate"
+
+# Environments without Cloud Tasks: entries are logged and marked delivered
+LOCAL_ENVS = ["local", "development", "test"]
+
+
+@dataclass
+class DispatchResult:
+    dispatched: int = 0
+    retried: int = 0
+    batches: int = 0
+
+
+class _LoggingTasksClient:
+    """Stand-in for CloudTasksClient in local environments."""
+
+    def queue_path(self, project: str, location: str, queue: str) -> str:
+        return f"projects/{project}/locations/{location}/queues/{queue}"
+
+    def create_task(self, request: Dict[str, Any]):
+        logger.info("Local ENV: Mock enqueueing task", extra={"task_name": request["task"]["name"]})
+
+
+class OutboxDispatcher:
+    def __init__(self):
+        self._client = None
+        self._draining = False
+        self._drain_requested = False
+
+    def _tasks_client(self):
+        # One client (and gRPC channel) for the process, not one per task
+        if self._client is None:
+            if settings.ENV in LOCAL_ENVS:
+                self._client = _LoggingTasksClient()
+            else:
+                from google.cloud import tasks_v2
+                self._client = tasks_v2.CloudTasksClient()
+        return self._client
+
+    def _pdf_task(self, client, entry_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        from google.cloud import tasks_v2
+
+        parent = client.queue_path(settings.FIREBASE_PROJECT_ID, TASKS_LOCATION, PDF_QUEUE)
+        body = {"job_type": "pdf_generate", "requested_by": "system:webhook", "attempt": 1, **payload}
+        return {
+            "parent": parent,
+            "task": {
+                "name": f"{parent}/tasks/{entry_id}",
+                "http_request": {
+                    "http_method": tasks_v2.HttpMethod.POST,
+                    "url": f"{settings.OPS_AUDIENCE_URL}/api/ops/pdf-generate",
+                    "headers": {"Content-Type": "application/json"},
+                    "body": json.dumps(body).encode(),
+                    "oidc_token": {
+                        "service_account_email": settings.OPS_SERVICE_ACCOUNT_EMAIL,
+                        "audience": settings.OPS_AUDIENCE_URL,
+                    },
+                },
+            },
+        }
+
+    def _enqueue(self, entries: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Optional[str]]:
+        """Creates one task per entry (blocking gRPC calls); returns entry_id -> error or None."""
+        outcome: Dict[str, Optional[str]] = {}
+        try:
+            client = self._tasks_client()
+        except Exception as e:
+            return {entry_id: f"client: {e}" for entry_id, _ in entries}
+
+        for entry_id, entry in entries:
+            try:
+                if entry.get("kind") != OUTBOX_PDF_GENERATE:
+                    raise ValueError(f"unknown outbox kind {entry.get('kind')!r}")
+                client.create_task(request=self._pdf_task(client, entry_id, entry.get("payload") or {}))
+                outcome[entry_id] = None
+            except AlreadyExists:
+                # Named task: this entry was delivered before
+                outcome[entry_id] = None
+            except Exception as e:
+                outcome[entry_id] = str(e)
+        return outcome
+
+    @staticmethod
+    def _retry(entry: Dict[str, Any], error: str) -> Dict[str, Any]:
+        attempts = entry.get("attempts", 0) + 1
+        delay = min(settings.OUTBOX_RETRY_MAX_SECONDS, settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        return {
+            "attempts": attempts,
+            "available_at": datetime.now(timezone.utc) + timedelta(seconds=delay),
+            "last_error": error[:500]
+        }
+
+    async def drain(self, db) -> DispatchResult:
+        """
+        Dispatches due entries batch by batch until none are left. While another
+        drain runs, returns at once and has that drain make one more pass.
+        """
+        result = DispatchResult()
+        if self._draining:
+            self._drain_requested = True
+            return result
+        self._draining = True
+        try:
+            outbox = OutboxRepository(db)
+            while True:
+                self._drain_requested = False
+                await self._drain_pass(outbox, result)
+                # Entries committed during the pass may have missed its last list_due
+                if not self._drain_requested:
+                    break
+        finally:
+            self._draining = False
+
+        if result.batches:
+            logger.info("Outbox drained", extra={
+                "dispatched": result.dispatched, "retried": result.retried, "batches": result.batches
+            })
+        return result
+
+    async def _drain_pass(self, outbox: OutboxRepository, result: DispatchResult) -> None:
+        while True:
+            entries = await outbox.list_due(settings.OUTBOX_BATCH_SIZE)
+            if not entries:
+                break
+            outcome = await run_in_threadpool(self._enqueue, entries)
+            data = dict(entries)
+            dispatched = [entry_id for entry_id, error in outcome.items() if error is None]
+            retries = {
+                entry_id: self._retry(data[entry_id], error)
+                for entry_id, error in outcome.items() if error is not None
+            }
+            await outbox.record_dispatch(dispatched, retries)
+
+            result.batches += 1
+            result.dispatched += len(dispatched)
+            result.retried += len(retries)
+            for entry_id, retry in retries.items():
+                logger.error("Outbox dispatch failed", extra={
+                    "entry_id": entry_id, "attempts": retry["attempts"], "error": retry["last_error"]
+                })
+            if len(entries) < settings.OUTBOX_BATCH_SIZE:
+                break
+
+
+outbox_dispatcher = OutboxDispatcher()
@@ -1,5 +1,6 @@
 from typing import Dict, Any
 from app.core.config import settings
+from app.services.iyzico_client import IyzicoClient, IyzicoError
 
 class PaymentService:
     def __init__(self):
@@ -7,10 +8,13 @@ class PaymentService:
         self.api_key = settings.IYZICO_API_KEY
         self.secret_key = settings.IYZICO_SECRET_KEY
         self.base_url = settings.IYZICO_BASE_URL
+        # Shared across requests: pooled connections, deadlines, retries and circuit breaker
+        self.client = IyzicoClient(self.base_url, self.api_key, self.secret_key)
 
-    def create_checkout_intent(self, order_id: str, amount: float, currency: str = "TRY", recipient: Dict = None) -> Dict[str, Any]:
+    async def create_checkout_intent(self, order_id: str, amount: float, currency: str = "TRY", recipient: Dict = None) -> Dict[str, Any]:
         """
         Creates a payment intent (e.g., Iyzico Checkout Form Initializer).
+        Raises ProviderUnavailable when iyzico is unreachable or failing fast.
         """
         if self.env == "sandbox" and self.api_key == "mock_api_key":
             return {
@@ -19,15 +23,6 @@ class PaymentService:
                 "checkout_url": f"https://sandbox-checkout.iyzipay.com/token=sandbox_token_{order_id}"
             }
             
-        import iyzipay
-        
-        base_url_cleaned = self.base_url.replace("https://", "").replace("http://", "").rstrip("/")
-        options = {
-            'api_key': self.api_key,
-            'secret_key': self.secret_key,
-            'base_url': base_url_cleaned
-        }
-        
         # Determine the return URL for the frontend callback.
         # Ideally this should be passed from frontend, but we hardcode to the local frontend for the E2E test.
         callback_url = "http://localhost:5173/pay/return"
@@ -82,31 +77,18 @@ class PaymentService:
             ]
         }
         
-        checkout_form_initialize = iyzipay.CheckoutFormInitialize().create(request, options)
-        
-        import json
-        
-        # Handle different iyzipay SDK return signatures
-        if hasattr(checkout_form_initialize, 'read'):
-            raw_result = checkout_form_initialize.read()
-        else:
-            raw_result = checkout_form_initialize
-            
-        if isinstance(raw_result, (bytes, str)):
-            result = json.loads(raw_result)
-        else:
-            result = raw_result
-        
-        if result.get('status') == 'success':
-            return {
-                "status": "success",
-                "token": result.get('token'),
-                "checkout_url": result.get('paymentPageUrl')
-            }
-        else:
+        try:
+            result = await self.client.initialize_checkout_form(request)
+        except IyzicoError as e:
             from app.core.logging import logger
-            logger.error(f"Iyzico Intent Error: {result.get('errorMessage')}")
-            raise Exception(f"Iyzico error: {result.get('errorMessage')}")
+            logger.error("Iyzico Intent Error", extra={"order_id": order_id, "error": str(e)})
+            raise
+
+        return {
+            "status": "success",
+            "token": result.get('token'),
+            "checkout_url": result.get('paymentPageUrl')
+        }
 
     def verify_webhook_signature(self, payload_body: str, signature_header: str) -> bool:
         """
@@ -120,62 +102,5 @@ class PaymentService:
         # but let's assume a standard HMAC SHA256 for the wrapper contract.
         # return hmac.compare_digest(expected_sig, signature_header)
         return False
-        
-    def enqueue_pdf_generation_task(self, order_id: str, tracking_code: str = None) -> None:
-        """
-        Enqueues a PDF generation task to Google Cloud Tasks for async processing.
-        Local/Test environments just skip the actual GCP API call but log the action.
-        """
-        if settings.ENV in ["local", "development", "test"]:
-            from app.core.logging import logger
-            logger.info(f"Local ENV: Mock enqueueing PDF task for Order {order_id}")
-            return
-            
-        try:
-            from google.cloud import tasks_v2
-            import json
-            import uuid
-            
-            client = tasks_v2.CloudTasksClient()
-            
-            # These would ideally be configured in settings for a highly flexible environment
-            project = settings.FIREBASE_PROJECT_ID 
-            location = "europe-west1" # Matches your Cloud Run location usually
-            queue = "ops-pdf-generate"
-            
-            parent = client.queue_path(project, location, queue)
-            
-            url = f"{settings.OPS_AUDIENCE_URL}/api/ops/pdf-generate"
-            
-            job_id = f"pdf_{order_id}_{uuid.uuid4().hex[:8]}"
-            payload = {
-                "job_type": "pdf_generate",
-                "job_id": job_id,
-                "order_id": order_id,
-                "tracking_code": tracking_code,
-                "requested_by": "system:webhook",
-                "attempt": 1
-            }
-            
-            task = {
-                "http_request": {
-                    "http_method": tasks_v2.HttpMethod.POST,
-                    "url": url,
-                    "headers": {"Content-Type": "application/json"},
-                    "body": json.dumps(payload).encode(),
-                    "oidc_token": {
-                        "service_account_email": settings.OPS_SERVICE_ACCOUNT_EMAIL,
-                        "audience": settings.OPS_AUDIENCE_URL,
-                    },
-                }
-            }
-            
-            response = client.create_task(request={"parent": parent, "task": task})
-            from app.core.logging import logger
-            logger.info(f"Successfully enqueued Cloud Task {response.name} for Order {order_id}")
-        except Exception as e:
-            from app.core.logging import logger
-            logger.error(f"Failed to enqueue Cloud Task for order {order_id}: {str(e)}")
-            # In production, we might want to alert Sentry here
 
 payment_service = PaymentService()
@@ -0,0 +1,202 @@
+"""
+Letter PDF rendering (ReportLab).
+
+Print-ready A4: a recipient block followed by the letter body, with the tracking
+code in the footer of every page for the print/PTT operators.
+
+Fonts, paragraph styles and page geometry are built once per process and shared
+by every job; only the per-document flowables are created per render.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, List, Optional
+from xml.sax.saxutils import escape
+
+import reportlab
+from reportlab.lib.enums import TA_LEFT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import BaseDocTemplate, Frame, PageBreak, PageTemplate, Paragraph, Spacer
+
+from app.core.config import settings
+
+# Bundled with ReportLab and covers the Turkish alphabet (ş, ğ, ı, İ ...); the
+# built-in Type 1 fonts do not
+_BUNDLED_FONT_DIR = os.path.join(os.path.dirname(reportlab.__file__), "fonts")
+FONT_NAME = "EmektupSans"
+FONT_NAME_BOLD = "EmektupSans-Bold"
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 20 * mm
+FOOTER_HEIGHT = 12 * mm
+
+
+@dataclass
+class RenderResult:
+    pages: int
+    size_bytes: int
+    render_ms: float
+
+
+class _CountingWriter:
+    """Passes writes through to the storage stream and counts the bytes."""
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self.size_bytes = 0
+
+    def write(self, data) -> int:
+        self._stream.write(data)
+        self.size_bytes += len(data)
+        return len(data)
+
+    def flush(self):
+        flush = getattr(self._stream, "flush", None)
+        if flush:
+            flush()
+
+
+class _LetterDocTemplate(BaseDocTemplate):
+    def __init__(self, stream, footer_text: str, layout: "LetterLayout", numbered: bool = True):
+        super().__init__(
+            stream,
+            pagesize=A4,
+            leftMargin=MARGIN,
+            rightMargin=MARGIN,
+            topMargin=MARGIN,
+            bottomMargin=MARGIN + FOOTER_HEIGHT,
+            title="eMektup",
+            author="eMektup",
+            # Same bytes for the same input: retries overwrite with an identical object
+            invariant=1,
+        )
+        self.footer_text = footer_text
+        self.numbered = numbered
+        self.addPageTemplates(layout.page_template())
+
+
+class LetterLayout:
+    """Process-wide fonts, styles and page geometry."""
+
+    def __init__(self, font_path: str, bold_font_path: str):
+        pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+        pdfmetrics.registerFont(TTFont(FONT_NAME_BOLD, bold_font_path))
+
+        self.recipient_label = ParagraphStyle(
+            "RecipientLabel", fontName=FONT_NAME_BOLD, fontSize=9, leading=12, textColor="#555555"
+        )
+        self.recipient = ParagraphStyle("Recipient", fontName=FONT_NAME, fontSize=11, leading=15, alignment=TA_LEFT)
+        self.recipient_name = ParagraphStyle("RecipientName", parent=self.recipient, fontName=FONT_NAME_BOLD)
+        self.body = ParagraphStyle(
+            "Body", fontName=FONT_NAME, fontSize=11.5, leading=17, spaceAfter=8, alignment=TA_LEFT
+        )
+        self.sheet_title = ParagraphStyle("SheetTitle", fontName=FONT_NAME_BOLD, fontSize=22, leading=28, spaceAfter=10)
+        self.sheet_line = ParagraphStyle("SheetLine", fontName=FONT_NAME, fontSize=13, leading=19)
+        self.frame_geometry = (MARGIN, MARGIN + FOOTER_HEIGHT, PAGE_WIDTH - 2 * MARGIN, PAGE_HEIGHT - 2 * MARGIN - FOOTER_HEIGHT)
+
+    def page_template(self) -> PageTemplate:
+        # Frames keep per-build cursor state, so each document gets its own (cheap) instances
+        x, y, width, height = self.frame_geometry
+        frame = Frame(x, y, width, height, id="body", leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+        return PageTemplate(id="letter", frames=[frame], onPage=self._draw_footer)
+
+    @staticmethod
+    def _draw_footer(canvas, doc):
+        canvas.saveState()
+        canvas.setFont(FONT_NAME, 8)
+        canvas.setFillColor("#777777")
+        canvas.drawString(MARGIN, MARGIN, doc.footer_text)
+        if doc.numbered:
+            canvas.drawRightString(PAGE_WIDTH - MARGIN, MARGIN, f"Sayfa {doc.page}")
+        canvas.restoreState()
+
+    @staticmethod
+    def _markup(text: str) -> str:
+        return escape(text).replace("\n", "<br/>")
+
+    def flowables(self, recipient: Dict, letter_content: str) -> List:
+        story = [
+            Paragraph("ALICI", self.recipient_label),
+            Paragraph(self._markup(recipient.get("name", "")), self.recipient_name),
+            Paragraph(self._markup(recipient.get("address", "")), self.recipient),
+            Spacer(1, 12 * mm),
+        ]
+        # Blank lines separate paragraphs; single newlines are kept as line breaks
+        for block in letter_content.replace("\r\n", "\n").split("\n\n"):
+            if block.strip():
+                story.append(Paragraph(self._markup(block.strip("\n")), self.body))
+        return story
+
+    def print_sheets(self, batch_id: str, created_at: str, members: List[Dict]) -> List:
+        # Exactly one page per sheet (the caller interleaves them by page index),
+        # so every sheet has bounded content
+        story = [
+            Paragraph("BASKI PARTİSİ", self.sheet_title),
+            Paragraph(self._markup(f"Parti: {batch_id}"), self.sheet_line),
+            Paragraph(self._markup(f"Oluşturulma: {created_at}"), self.sheet_line),
+            Paragraph(f"Mektup sayısı: {len(members)}", self.sheet_line),
+        ]
+        for index, member in enumerate(members, start=1):
+            recipient = member.get("recipient") or {}
+            story += [
+                PageBreak(),
+                Paragraph(f"{index} / {len(members)}", self.sheet_line),
+                Paragraph(self._markup(member.get("tracking_code") or ""), self.sheet_title),
+                Paragraph(self._markup(recipient.get("name", "")), self.recipient_name),
+                Paragraph(self._markup(recipient.get("address", "")), self.recipient),
+            ]
+        return story
+
+
+class PdfService:
+    def __init__(self):
+        self._layout: Optional[LetterLayout] = None
+        self._lock = threading.Lock()
+
+    @property
+    def layout(self) -> LetterLayout:
+        if self._layout is None:
+            with self._lock:
+                if self._layout is None:
+                    self._layout = LetterLayout(
+                        settings.PDF_FONT_PATH or os.path.join(_BUNDLED_FONT_DIR, "Vera.ttf"),
+                        settings.PDF_FONT_BOLD_PATH or os.path.join(_BUNDLED_FONT_DIR, "VeraBd.ttf"),
+                    )
+        return self._layout
+
+    def render_letter(self, stream: BinaryIO, tracking_code: str, recipient: Dict, letter_content: str) -> RenderResult:
+        """Renders the letter into `stream` (CPU-bound: call it off the event loop)."""
+        started = time.perf_counter()
+        layout = self.layout
+        writer = _CountingWriter(stream)
+        doc = _LetterDocTemplate(writer, f"Takip No: {tracking_code or ''}", layout)
+        doc.build(layout.flowables(recipient or {}, letter_content or ""))
+        return RenderResult(
+            pages=doc.page,
+            size_bytes=writer.size_bytes,
+            render_ms=round((time.perf_counter() - started) * 1000, 2),
+        )
+
+    def render_print_sheets(self, stream: BinaryIO, batch_id: str, created_at: str, members: List[Dict]) -> RenderResult:
+        """
+        Renders a print batch's cover (page 1) followed by one separator page per
+        member ({"tracking_code", "recipient"}), in member order.
+        """
+        started = time.perf_counter()
+        layout = self.layout
+        writer = _CountingWriter(stream)
+        doc = _LetterDocTemplate(writer, f"Baskı Partisi: {batch_id}", layout, numbered=False)
+        doc.build(layout.print_sheets(batch_id, created_at, members))
+        return RenderResult(
+            pages=doc.page,
+            size_bytes=writer.size_bytes,
+            render_ms=round((time.perf_counter() - started) * 1000, 2),
+        )
+
+
+pdf_service = PdfService()
@@ -0,0 +1,124 @@
+"""
+Where generated PDFs go. Backends expose the same calls:
+
+- open_write(key): a context manager yielding a binary stream; the object becomes
+  visible only once the block exits without an error.
+- open_read(key): a context manager yielding a seekable binary stream.
+- exists(key)
+- uri(key): the stable location recorded on the order (gs://... or file://...).
+
+PDF_STORAGE_BACKEND selects "gcs" (Cloud Storage bucket, default) or "local"
+(a directory; used by tests and local runs).
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+from app.core.config import settings
+
+
+def letter_key(order_id: str) -> str:
+    return f"orders/{order_id}/generated/letter.pdf"
+
+
+def print_batch_part_key(batch_id: str, part: int) -> str:
+    return f"print_batches/{batch_id}/part-{part:03d}.pdf"
+
+
+class LocalPdfStorage:
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Storage key escapes the storage root: {key}")
+        return path
+
+    def uri(self, key: str) -> str:
+        return self.path(key).as_uri()
+
+    @contextmanager
+    def open_write(self, key: str, content_type: str = "application/pdf") -> Iterator[BinaryIO]:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file in the same directory, then rename: readers never see half a PDF
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as stream:
+                yield stream
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @contextmanager
+    def open_read(self, key: str) -> Iterator[BinaryIO]:
+        with open(self.path(key), "rb") as stream:
+            yield stream
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).is_file()
+
+
+class GcsPdfStorage:
+    def __init__(self, bucket: str):
+        self.bucket_name = bucket
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        # Client creation is slow (credentials discovery): once per process, on first use
+        if self._bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    from google.cloud import storage
+                    self._bucket = storage.Client().bucket(self.bucket_name)
+        return self._bucket
+
+    def uri(self, key: str) -> str:
+        return f"gs://{self.bucket_name}/{key}"
+
+    @contextmanager
+    def open_write(self, key: str, content_type: str = "application/pdf") -> Iterator[BinaryIO]:
+        # Resumable upload: chunks are sent while the PDF is being written
+        writer = self.bucket.blob(key).open("wb", content_type=content_type)
+        yield writer
+        # Only finalize on success: an unfinished resumable session never becomes an object
+        writer.close()
+
+    @contextmanager
+    def open_read(self, key: str) -> Iterator[BinaryIO]:
+        # Chunked, seekable reader: the object is fetched in ranges, not downloaded up front
+        reader = self.bucket.blob(key).open("rb")
+        try:
+            yield reader
+        finally:
+            reader.close()
+
+    def exists(self, key: str) -> bool:
+        return self.bucket.blob(key).exists()
+
+
+_storage = None
+_storage_config: Optional[tuple] = None
+_storage_lock = threading.Lock()
+
+
+def get_pdf_storage():
+    """Process-wide storage backend for the current settings."""
+    global _storage, _storage_config
+    config = (settings.PDF_STORAGE_BACKEND, settings.PDF_STORAGE_BUCKET, settings.PDF_STORAGE_LOCAL_DIR)
+    with _storage_lock:
+        if _storage is None or _storage_config != config:
+            if settings.PDF_STORAGE_BACKEND == "local":
+                _storage = LocalPdfStorage(settings.PDF_STORAGE_LOCAL_DIR)
+            elif settings.PDF_STORAGE_BACKEND == "gcs":
+                _storage = GcsPdfStorage(settings.PDF_STORAGE_BUCKET)
+            else:
+                raise ValueError(f"Unknown PDF_STORAGE_BACKEND: {settings.PDF_STORAGE_BACKEND}")
+            _storage_config = config
+        return _storage
@@ -0,0 +1,146 @@
+"""
+Where PDF jobs run, and how many may be in flight.
+
+PDF_RENDER_MODE selects the executor:
+- "thread" (default): Starlette's threadpool. Fine for I/O-heavy work, but
+  ReportLab/pypdf hold the GIL, so renders on one instance serialize.
+- "process": a warm pool of PDF_RENDER_PROCESSES worker processes (0 = one per
+  CPU). Each worker loads fonts and styles once at start-up, so throughput
+  scales with the instance's cores.
+
+In both modes at most PDF_RENDER_MAX_PENDING jobs are admitted (running plus
+waiting for a worker). Callers take a slot with `reserve()` *before* touching
+job state; when none is free it raises RenderPoolSaturated and the route
+answers 503 + Retry-After, so Cloud Tasks backs off and retries later instead
+of piling work onto a saturated instance.
+
+The job functions below are module-level so worker processes can import them.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import PDF_RENDER_REJECTIONS, PDF_RENDERS_IN_PROGRESS
+from app.services.pdf_service import pdf_service, RenderResult
+from app.services.pdf_storage import get_pdf_storage
+from app.services.print_batch_service import print_batch_service, PrintBatchResult
+
+
+def render_letter_to_storage(storage_key: str, order_data: Dict[str, Any], tracking_code: Optional[str]) -> RenderResult:
+    with get_pdf_storage().open_write(storage_key) as stream:
+        return pdf_service.render_letter(
+            stream,
+            tracking_code=order_data.get("tracking_code") or tracking_code,
+            recipient=order_data.get("recipient"),
+            letter_content=order_data.get("letter_content")
+        )
+
+
+def build_print_batch_to_storage(batch_id: str, created_at: str, members: List[Dict[str, Any]]) -> PrintBatchResult:
+    return print_batch_service.build(
+        get_pdf_storage(), batch_id, created_at, members, settings.PRINT_BATCH_PART_MAX_ORDERS
+    )
+
+
+def _init_worker(config: Dict[str, Any]) -> None:
+    # Spawned workers re-read settings from the environment; apply the parent's
+    # effective values instead (they may have been overridden at runtime)
+    for name, value in config.items():
+        setattr(settings, name, value)
+    # Warm-up: register fonts and build styles before the first job arrives
+    pdf_service.layout
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class RenderPoolSaturated(Exception):
+    pass
+
+
+class PdfRenderPool:
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def process_mode(self) -> bool:
+        return settings.PDF_RENDER_MODE == "process"
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _process_count(self) -> int:
+        return settings.PDF_RENDER_PROCESSES or os.cpu_count() or 1
+
+    def start(self) -> None:
+        """Creates and warms the process pool (no-op in thread mode or when already running)."""
+        if not self.process_mode:
+            return
+        with self._lock:
+            if self._executor is not None:
+                return
+            processes = self._process_count()
+            # spawn, not fork: the parent runs threads (log writer, executor) that fork would copy mid-state
+            self._executor = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(settings.model_dump(),),
+            )
+            executor = self._executor
+        # Workers are spawned on demand; one task per worker starts them all now
+        for future in [executor.submit(_ping) for _ in range(processes)]:
+            future.result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @contextmanager
+    def reserve(self):
+        """Admits one job or raises RenderPoolSaturated; hold it for the job's whole duration."""
+        with self._lock:
+            if self._pending >= settings.PDF_RENDER_MAX_PENDING:
+                PDF_RENDER_REJECTIONS.inc()
+                raise RenderPoolSaturated()
+            self._pending += 1
+        PDF_RENDERS_IN_PROGRESS.inc()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pending -= 1
+            PDF_RENDERS_IN_PROGRESS.dec()
+
+    async def run(self, fn: Callable, *args):
+        if not self.process_mode:
+            return await run_in_threadpool(fn, *args)
+        if self._executor is None:
+            await run_in_threadpool(self.start)
+        executor = self._executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # A worker died (OOM, segfault): drop the pool so the next job starts a fresh one
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+pdf_render_pool = PdfRenderPool()
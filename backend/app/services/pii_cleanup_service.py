@@ -0,0 +1,153 @@
+"""
+PII retention sweep: strips recipient, letter and notes from finished orders
+older than the cutoff.
+
+The sweep walks (status, pii_anonymized == False, created_at < cutoff) with
+cursor pagination and anonymizes each page with batched writes. Anonymized
+orders drop out of that query, so a job never re-reads what earlier jobs
+cleaned. After every page it checkpoints its position on jobs/{job_id}, and
+it stops taking new pages once PII_CLEANUP_TIME_BUDGET_SECONDS are used up.
+Calling it again with the same job_id resumes from the checkpoint (with the
+cutoff fixed at the first call), so a large backlog is drained over several
+invocations, each well within the request timeout. A finished job_id is a no-op.
+
+Orders created before pii_anonymized existed are not matched by the sweep
+until backfill_pii_flags.py has run once.
+
+`estimate` answers the dry run with aggregation count() queries only, split by
+status and by age bucket, so deciding whether to sweep costs a handful of reads.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from firebase_admin import firestore
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.state_machine import OrderStatus
+from app.db.repositories import OrderRepository, JobRepository
+
+# Terminal statuses whose PII is no longer needed, swept in this order
+ELIGIBLE_STATUSES = [OrderStatus.SHIPPED, OrderStatus.CANCELLED]
+
+JOB_TYPE = "pii_cleanup"
+
+# Dry-run age buckets (days since creation) beyond the cutoff: e.g. 30-90d, 90-180d, 180-365d, 365d+
+AGE_BUCKET_DAYS = (90, 180, 365)
+
+
+@dataclass
+class PiiCleanupResult:
+    done: bool
+    already_done: bool = False
+    cleaned_count: int = 0  # this invocation
+    total_cleaned_count: int = 0  # whole job so far
+    pages: int = 0
+    cleaned_order_ids: List[str] = field(default_factory=list)
+
+
+class PiiCleanupService:
+    async def run(self, db, job_id: str, cutoff_days: int, requested_by: str) -> PiiCleanupResult:
+        orders = OrderRepository(db)
+        jobs = JobRepository(db)
+        deadline = time.monotonic() + settings.PII_CLEANUP_TIME_BUDGET_SECONDS
+
+        job = await jobs.get(job_id) or {}
+        if job.get("status") == "SUCCEEDED":
+            return PiiCleanupResult(done=True, already_done=True, total_cleaned_count=job.get("cleaned_count", 0))
+
+        cutoff = job.get("cutoff_date") or datetime.now(timezone.utc) - timedelta(days=cutoff_days)
+        cursor = job.get("cursor") or {}
+        status_index = ELIGIBLE_STATUSES.index(cursor["status"]) if cursor.get("status") else 0
+        after = (cursor["created_at"], cursor["order_id"]) if cursor.get("order_id") else None
+        result = PiiCleanupResult(done=False, total_cleaned_count=job.get("cleaned_count", 0))
+
+        if not job:
+            await jobs.save_progress(job_id, {
+                "job_type": JOB_TYPE,
+                "status": "RUNNING",
+                "cutoff_days": cutoff_days,
+                "cutoff_date": cutoff,
+                "requested_by": requested_by,
+                "cleaned_count": 0,
+                "created_at": firestore.SERVER_TIMESTAMP
+            })
+
+        while status_index < len(ELIGIBLE_STATUSES):
+            # Always make progress, then keep going only while the budget lasts
+            if result.pages and time.monotonic() >= deadline:
+                break
+            order_status = ELIGIBLE_STATUSES[status_index]
+            page = await orders.page_pii_cleanup_candidates(
+                order_status, cutoff, settings.PII_CLEANUP_PAGE_SIZE, after
+            )
+            result.pages += 1
+
+            eligible = [doc.id for doc in page]
+            if eligible:
+                await orders.anonymize_many(eligible)
+            result.cleaned_count += len(eligible)
+            result.total_cleaned_count += len(eligible)
+            result.cleaned_order_ids.extend(eligible)
+
+            if len(page) < settings.PII_CLEANUP_PAGE_SIZE:
+                status_index, after = status_index + 1, None
+            else:
+                last = page[-1]
+                after = (last.get("created_at"), last.id)
+
+            await jobs.save_progress(job_id, {
+                "cursor": self._cursor(status_index, after),
+                "cleaned_count": result.total_cleaned_count
+            })
+
+        result.done = status_index >= len(ELIGIBLE_STATUSES)
+        if result.done:
+            await jobs.save_progress(job_id, {"status": "SUCCEEDED", "finished_at": firestore.SERVER_TIMESTAMP})
+        logger.info("PII cleanup progress", extra={
+            "job_id": job_id, "pages": result.pages, "cleaned_count": result.cleaned_count,
+            "total_cleaned_count": result.total_cleaned_count, "done": result.done
+        })
+        return result
+
+    async def estimate(self, db, cutoff_days: int) -> Dict[str, Any]:
+        """
+        Candidate counts (not yet anonymized orders) per status and per age bucket.
+        """
+        orders = OrderRepository(db)
+        now = datetime.now(timezone.utc)
+        bounds = [cutoff_days] + [days for days in AGE_BUCKET_DAYS if days > cutoff_days]
+        buckets = []  # (label, created_at upper bound, lower bound or None)
+        for index, days in enumerate(bounds):
+            older = bounds[index + 1] if index + 1 < len(bounds) else None
+            label = f"{days}-{older}d" if older else f"{days}d+"
+            buckets.append((label, now - timedelta(days=days), now - timedelta(days=older) if older else None))
+
+        cells = [(order_status, bucket) for order_status in ELIGIBLE_STATUSES for bucket in buckets]
+        counts = await asyncio.gather(*(
+            orders.count_pii_cleanup_candidates(order_status, before, not_before)
+            for order_status, (_, before, not_before) in cells
+        ))
+
+        by_status = {order_status: 0 for order_status in ELIGIBLE_STATUSES}
+        by_age = {label: 0 for label, _, _ in buckets}
+        for (order_status, (label, _, _)), count in zip(cells, counts):
+            by_status[order_status] += count
+            by_age[label] += count
+        return {
+            "cutoff_date": buckets[0][1].isoformat(),
+            "total": sum(counts),
+            "by_status": by_status,
+            "by_age": by_age,
+        }
+
+    @staticmethod
+    def _cursor(status_index: int, after: Optional[tuple]) -> Optional[dict]:
+        if status_index >= len(ELIGIBLE_STATUSES):
+            return None
+        created_at, order_id = after or (None, None)
+        return {"status": ELIGIBLE_STATUSES[status_index], "created_at": created_at, "order_id": order_id}
+
+
+pii_cleanup_service = PiiCleanupService()
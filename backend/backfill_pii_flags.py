@@ -0,0 +1,26 @@
+"""
+One-off: sets pii_anonymized on orders created before the field existed, so the
+PII retention sweep (which only matches pii_anonymized == False) finds them.
+Safe to re-run; orders that already have the field are left alone.
+"""
+import asyncio
+
+from app.db.firestore import get_async_db
+from app.db.repositories import OrderRepository
+
+PAGE_SIZE = 500
+
+
+async def backfill_pii_flags():
+    orders = OrderRepository(get_async_db())
+    total, after = 0, None
+    while True:
+        updated, after = await orders.backfill_pii_flags(PAGE_SIZE, after)
+        total += updated
+        print(f"Backfilled {total} orders (last: {after})")
+        if after is None:
+            break
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_pii_flags())
@@ -0,0 +1,9 @@
+"""
+In-process benchmarks for the order lifecycle.
+
+Drives the ASGI app through httpx against the in-memory Firestore engine
+(DB_BACKEND=memory), so runs are repeatable and never touch a real project.
+
+    python -m benchmarks.run --concurrency 16 --requests 500
+    python -m benchmarks.compare            # newest result vs the one before
+"""
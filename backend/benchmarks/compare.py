@@ -0,0 +1,72 @@
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.harness import latest_results, load_results
+
+# Higher is worse for latencies, lower is worse for throughput
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+THROUGHPUT_METRIC = "throughput_rps"
+
+
+def find_regressions(base: Dict[str, Any], head: Dict[str, Any], threshold: float) -> List[str]:
+    """Scenario/metric pairs where head is more than `threshold` (fraction) worse than base."""
+    regressions = []
+    for name, head_stats in head["scenarios"].items():
+        base_stats = base["scenarios"].get(name)
+        if base_stats is None:
+            continue
+        for metric in LATENCY_METRICS:
+            if base_stats[metric] > 0 and head_stats[metric] > base_stats[metric] * (1 + threshold):
+                regressions.append(f"{name}.{metric}")
+        if base_stats[THROUGHPUT_METRIC] > 0 and head_stats[THROUGHPUT_METRIC] < base_stats[THROUGHPUT_METRIC] * (1 - threshold):
+            regressions.append(f"{name}.{THROUGHPUT_METRIC}")
+    return regressions
+
+
+def _delta(base: float, head: float) -> str:
+    if not base:
+        return "n/a"
+    return f"{(head - base) / base * 100:+.1f}%"
+
+
+def format_comparison(base: Dict[str, Any], head: Dict[str, Any]) -> str:
+    lines = [f"base {base['meta']['git']['sha'][:8]}  ->  head {head['meta']['git']['sha'][:8]}", ""]
+    for name, head_stats in head["scenarios"].items():
+        base_stats = base["scenarios"].get(name)
+        if base_stats is None:
+            lines.append(f"{name}: new scenario")
+            continue
+        cells = [
+            f"{metric} {base_stats[metric]:.2f} -> {head_stats[metric]:.2f} ({_delta(base_stats[metric], head_stats[metric])})"
+            for metric in (*LATENCY_METRICS, THROUGHPUT_METRIC)
+        ]
+        lines.append(f"{name}: " + ", ".join(cells))
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("base", nargs="?", type=Path, help="Older result. Default: second newest in benchmarks/results")
+    parser.add_argument("head", nargs="?", type=Path, help="Newer result. Default: newest in benchmarks/results")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown as a fraction (default 0.10)")
+    args = parser.parse_args(argv)
+
+    if args.base is None or args.head is None:
+        newest = latest_results(2)
+        if len(newest) < 2:
+            parser.error("need two result files (run `python -m benchmarks.run` twice or pass paths)")
+        args.head, args.base = newest[0], newest[1]
+
+    base, head = load_results(args.base), load_results(args.head)
+    print(format_comparison(base, head))
+
+    regressions = find_regressions(base, head, args.threshold)
+    if regressions:
+        print(f"\nRegressions beyond {args.threshold:.0%}: " + ", ".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import platform
+import subprocess
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# setup(client, count) -> context handed to every request(client, context, i)
+SetupFn = Callable[[httpx.AsyncClient, int], Awaitable[Any]]
+RequestFn = Callable[[httpx.AsyncClient, Any, int], Awaitable[httpx.Response]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    setup: SetupFn
+    request: RequestFn
+    # Status codes that count as success for this scenario
+    ok_statuses: tuple = (200,)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Linear-interpolated percentile (pct in 0..100) of an unsorted sample list."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies: List[float], statuses: Counter, errors: int, wall_seconds: float) -> Dict[str, Any]:
+    ms = [latency * 1000.0 for latency in latencies]
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "wall_seconds": round(wall_seconds, 4),
+        "throughput_rps": round(len(latencies) / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int) -> Dict[str, Any]:
+    """Runs `requests` calls of one scenario with `concurrency` workers sharing the work."""
+    context = await scenario.setup(client, requests)
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    errors = 0
+    pending = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        # The shared iterator hands each index to exactly one worker
+        for i in pending:
+            start = time.perf_counter()
+            response = await scenario.request(client, context, i)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+            if response.status_code not in scenario.ok_statuses:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return summarize(latencies, statuses, errors, time.perf_counter() - started)
+
+
+def git_revision() -> Dict[str, Any]:
+    cwd = Path(__file__).parent
+    try:
+        sha = subprocess.run(["git", "rev-parse", "HEAD"], cwd=cwd, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"sha": "unknown", "dirty": None}
+    return {"sha": sha, "dirty": dirty}
+
+
+def build_meta(requests: int, concurrency: int) -> Dict[str, Any]:
+    return {
+        "git": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "requests": requests,
+        "concurrency": concurrency,
+        "db_backend": "memory",
+    }
+
+
+def write_results(results: Dict[str, Any], output: Optional[Path] = None) -> Path:
+    """Writes results to `output` or benchmarks/results/<utc time>-<short sha>.json."""
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = RESULTS_DIR / f"{stamp}-{results['meta']['git']['sha'][:8]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, sort_keys=True))
+    return output
+
+
+def load_results(path: Path) -> Dict[str, Any]:
+    return json.loads(Path(path).read_text())
+
+
+def latest_results(count: int = 2) -> List[Path]:
+    """Newest result files first (file names start with a sortable UTC timestamp)."""
+    return sorted(RESULTS_DIR.glob("*.json"), reverse=True)[:count]
@@ -0,0 +1,52 @@
+import argparse
+import asyncio
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.harness import build_meta, run_scenario, write_results
+from benchmarks.scenarios import SCENARIOS, benchmark_app
+
+
+async def run_benchmarks(names: List[str], requests: int, concurrency: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"meta": build_meta(requests, concurrency), "scenarios": {}}
+    with benchmark_app() as app:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in names:
+                results["scenarios"][name] = await run_scenario(client, SCENARIOS[name], requests, concurrency)
+    return results
+
+
+def format_table(results: Dict[str, Any]) -> str:
+    header = f"{'scenario':<24}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    lines = [header, "-" * len(header)]
+    for name, stats in results["scenarios"].items():
+        lines.append(
+            f"{name:<24}{stats['throughput_rps']:>10.1f}{stats['p50_ms']:>10.2f}"
+            f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['errors']:>8}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Order lifecycle benchmarks (in-process, in-memory Firestore)")
+    parser.add_argument("--requests", type=int, default=300, help="Timed requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent in-flight requests")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), dest="scenarios",
+                        help="Run only this scenario (repeatable). Default: all")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Result file. Default: benchmarks/results/<utc time>-<sha>.json")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_benchmarks(args.scenarios or list(SCENARIOS), args.requests, args.concurrency))
+    path = write_results(results, args.output)
+
+    print(format_table(results))
+    print(f"\nResults written to {path}")
+    return 1 if any(stats["errors"] for stats in results["scenarios"].values()) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+import httpx
+
+from app.api.deps import UserRecord, require_admin
+from app.core.cache import order_public_cache
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.rate_limit import limiter
+from app.db.firestore import get_memory_db
+from app.main import app
+from app.services.outbox_dispatcher import _LoggingTasksClient, outbox_dispatcher
+from benchmarks.harness import Scenario
+
+SETUP_CHUNK = 50
+ADMIN_LIST_ORDERS = 200
+
+
+def _bench_admin() -> UserRecord:
+    return UserRecord(uid="bench-admin", email="bench@emektup.test", claims={"admin": True})
+
+
+@contextmanager
+def benchmark_app() -> Iterator:
+    """
+    The app wired for in-process runs: in-memory engine, no rate limits,
+    admin auth and the outbox dispatcher's Cloud Tasks client stubbed, and
+    per-request INFO logs muted. Restores everything on exit.
+    """
+    previous = (settings.DB_BACKEND, settings.ENV, limiter.enabled, logger.level, outbox_dispatcher._client)
+    settings.DB_BACKEND = "memory"
+    settings.ENV = "local"
+    # Drained PDF jobs are logged (muted below) instead of created on Cloud Tasks
+    outbox_dispatcher._client = _LoggingTasksClient()
+    limiter.enabled = False
+    logger.setLevel(logging.WARNING)
+    app.dependency_overrides[require_admin] = _bench_admin
+    try:
+        yield app
+    finally:
+        app.dependency_overrides.pop(require_admin, None)
+        settings.DB_BACKEND, settings.ENV, limiter.enabled, _, outbox_dispatcher._client = previous
+        logger.setLevel(previous[3])
+
+
+def _fresh_state() -> None:
+    # Every scenario starts from an empty database and a cold tracking cache
+    get_memory_db().reset()
+    order_public_cache.clear()
+
+
+def _order_payload(i: int) -> Dict:
+    return {
+        "client_request_id": f"bench-{uuid.uuid4().hex}",
+        "is_guest": True,
+        "recipient": {"name": f"Alıcı {i}", "address": f"Silivri Kapalı Cezaevi, Blok {i % 12}, İstanbul"},
+        "letter_content": "Merhaba, umarım iyisindir. " * 40,
+        "notes": None,
+    }
+
+
+async def _create_orders(client: httpx.AsyncClient, count: int) -> List[Dict]:
+    created: List[Dict] = []
+    for start in range(0, count, SETUP_CHUNK):
+        responses = await asyncio.gather(*(
+            client.post("/api/orders/create", json=_order_payload(i))
+            for i in range(start, min(start + SETUP_CHUNK, count))
+        ))
+        for response in responses:
+            response.raise_for_status()
+            created.append(response.json())
+    return created
+
+
+async def _create_intents(client: httpx.AsyncClient, orders: List[Dict]) -> List[Dict]:
+    intents: List[Dict] = []
+    for start in range(0, len(orders), SETUP_CHUNK):
+        responses = await asyncio.gather(*(
+            client.post("/api/payments/create-intent", json={"order_id": order["order_id"]})
+            for order in orders[start:start + SETUP_CHUNK]
+        ))
+        for order, response in zip(orders[start:start + SETUP_CHUNK], responses):
+            response.raise_for_status()
+            intents.append({"order_id": order["order_id"], "token": response.json()["token"]})
+    return intents
+
+
+# --- /orders/create ---
+
+async def _setup_none(client, count):
+    _fresh_state()
+    return None
+
+async def _orders_create(client, context, i):
+    return await client.post("/api/orders/create", json=_order_payload(i))
+
+
+# --- /orders/track/{code} ---
+
+async def _setup_track(client, count):
+    _fresh_state()
+    # Fewer orders than requests: repeat lookups are what the cache is for
+    return [order["tracking_code"] for order in await _create_orders(client, max(1, min(count, 100)))]
+
+async def _orders_track(client, codes, i):
+    return await client.get(f"/api/orders/track/{codes[i % len(codes)]}")
+
+
+# --- /payments/create-intent ---
+
+async def _setup_orders(client, count):
+    _fresh_state()
+    return await _create_orders(client, count)
+
+async def _payments_create_intent(client, orders, i):
+    return await client.post("/api/payments/create-intent", json={"order_id": orders[i]["order_id"]})
+
+
+# --- /payments/webhook ---
+
+async def _setup_webhook(client, count):
+    _fresh_state()
+    return await _create_intents(client, await _create_orders(client, count))
+
+async def _payments_webhook(client, intents, i):
+    return await client.post(
+        "/api/payments/webhook",
+        json={
+            "token": intents[i]["token"],
+            "status": "SUCCESS",
+            "paymentId": f"bench-payment-{i}",
+            "conversationId": intents[i]["order_id"],
+        },
+        headers={"x-iyz-signature": "mock_valid_signature"},
+    )
+
+
+# --- GET /admin/orders ---
+
+async def _setup_admin_list(client, count):
+    _fresh_state()
+    await _create_orders(client, ADMIN_LIST_ORDERS)
+    return None
+
+async def _admin_list(client, context, i):
+    return await client.get("/api/admin/orders", params={"limit": 20})
+
+
+# --- PATCH /admin/orders/{id}/status ---
+
+async def _admin_status(client, orders, i):
+    return await client.patch(
+        f"/api/admin/orders/{orders[i]['order_id']}/status",
+        json={"expected_from_status": "CREATED", "to_status": "PAID", "note": "benchmark"},
+    )
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario
+    for scenario in [
+        Scenario("orders_create", _setup_none, _orders_create, ok_statuses=(201,)),
+        Scenario("orders_track", _setup_track, _orders_track),
+        Scenario("payments_create_intent", _setup_orders, _payments_create_intent),
+        Scenario("payments_webhook", _setup_webhook, _payments_webhook),
+        Scenario("admin_list_orders", _setup_admin_list, _admin_list),
+        Scenario("admin_update_status", _setup_orders, _admin_status),
+    ]
+}
@@ -0,0 +1,18 @@
+import tempfile
+import pytest
+from app.core.config import settings
+from app.db.firestore import get_memory_db
+
+# Every test runs the real repositories against the in-memory engine (app/db/memory.py)
+settings.DB_BACKEND = "memory"
+# Generated PDFs go to a throwaway directory instead of the GCS bucket
+settings.PDF_STORAGE_BACKEND = "local"
+settings.PDF_STORAGE_LOCAL_DIR = tempfile.mkdtemp(prefix="emektup-pdfs-")
+
+
+@pytest.fixture
+def memory_db():
+    db = get_memory_db()
+    db.reset()
+    yield db
+    db.reset()
@@ -1,53 +1,20 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch
 from app.main import app
-from mockfirestore import MockFirestore
-from app.api.routes.admin import get_db
 from app.api.deps import UserRecord, require_admin
-from firebase_admin import firestore
-import mockfirestore.document
+import asyncio
 import datetime
+from app.core.cache import order_public_cache, MISSING
 client = TestClient(app)
 
-# Inject dummy methods for MockFirestore to simulate transactions
-class DummyTransaction:
-    def __init__(self, db):
-        self.db = db
-    def update(self, ref, data):
-        self.db.collection(ref._path[0]).document(ref.id).update(data)
-    def set(self, ref, data):
-        self.db.collection(ref._path[0]).document(ref.id).set(data)
-    def get(self, ref):
-        return ref.get()
-
-# We need to monkeypath the firestore transactional decorator
-
-def fake_transactional(func):
-    def wrapper(transaction, *args, **kwargs):
-        return func(transaction, *args, **kwargs)
-    return wrapper
-firestore.transactional = fake_transactional
-
-original_doc_get = mockfirestore.document.DocumentReference.get
-def fake_doc_get(self, *args, **kwargs):
-    kwargs.pop("transaction", None)
-    return original_doc_get(self, *args, **kwargs)
-mockfirestore.document.DocumentReference.get = fake_doc_get
-
-
-
 @pytest.fixture
-def mock_db():
-    mock = MockFirestore()
-    mock.transaction = lambda: DummyTransaction(mock)
-    
-    app.dependency_overrides[get_db] = lambda: mock
+def mock_db(memory_db):
+    mock = memory_db
     
     now = datetime.datetime.now()
     
     # Pre-seed the database with an order for our specs
-    mock.collection("orders").document("test_order_1").set({
+    mock.seed("orders/test_order_1", {
         "status": "CREATED",
         "tracking_code": "TRACK123",
         "total_amount": 100.0,
@@ -56,14 +23,13 @@ def mock_db():
         "created_at": now,
         "status_updated_at": now
     })
-    mock.collection("order_public").document("TRACK123").set({
+    mock.seed("order_public/TRACK123", {
         "status": "CREATED",
         "created_at": now,
         "status_updated_at": now
     })
     
-    with patch("app.api.routes.admin.get_db", return_value=mock):
-        yield mock
+    yield mock
     app.dependency_overrides.clear()
 
 # Override the admin auth check for tests
@@ -99,7 +65,7 @@ def test_admin_patch_status_success(mock_db):
     assert res.status_code == 200
     
     # Verify in DB
-    order = mock_db.collection("orders").document("test_order_1").get().to_dict()
+    order = mock_db.peek("orders/test_order_1")
     assert order["status"] == "PAID"
     
     app.dependency_overrides.clear()
@@ -134,3 +100,221 @@ def test_admin_patch_invalid_transition(mock_db):
     assert "Invalid transition" in res.json()["detail"]
     
     app.dependency_overrides.clear()
+
+def test_admin_patch_invalidates_tracking_cache(mock_db):
+    app.dependency_overrides[require_admin] = override_require_admin
+    order_public_cache.set("TRACK123", "stale-snapshot")
+    
+    payload = {"to_status": "PAID", "expected_from_status": "CREATED"}
+    res = client.patch("/api/admin/orders/test_order_1/status", json=payload)
+    assert res.status_code == 200
+    assert order_public_cache.get("TRACK123") is MISSING
+    
+    app.dependency_overrides.clear()
+
+def seed_batch(mock_db, count, status="READY_FOR_PRINT"):
+    for i in range(count):
+        mock_db.seed(f"orders/batch_{i}", {"status": status, "tracking_code": f"BATCH{i}"})
+        mock_db.seed(f"order_public/BATCH{i}", {"status": status})
+
+def test_admin_bulk_status_reports_per_order(mock_db):
+    app.dependency_overrides[require_admin] = override_require_admin
+    seed_batch(mock_db, 2)
+    order_public_cache.set("BATCH0", "stale-snapshot")
+
+    payload = {
+        "to_status": "PRINTED",
+        "note": "Printer run 7",
+        "items": [
+            {"order_id": "batch_0", "expected_from_status": "READY_FOR_PRINT"},
+            {"order_id": "batch_1", "expected_from_status": "PAID"},             # stale view
+            {"order_id": "test_order_1", "expected_from_status": "CREATED"},     # CREATED -> PRINTED not allowed
+            {"order_id": "missing", "expected_from_status": "READY_FOR_PRINT"},
+            {"order_id": "batch_0", "expected_from_status": "READY_FOR_PRINT"},
+        ]
+    }
+    res = client.post("/api/admin/orders/bulk-status", json=payload)
+    assert res.status_code == 200
+    data = res.json()
+    assert [r["result"] for r in data["results"]] == [
+        "UPDATED", "STATUS_MISMATCH", "INVALID_TRANSITION", "NOT_FOUND", "DUPLICATE"
+    ]
+    assert data["updated_count"] == 1
+    assert data["failed_count"] == 4
+    assert data["results"][1]["current_status"] == "READY_FOR_PRINT"
+
+    assert mock_db.peek("orders/batch_0")["status"] == "PRINTED"
+    assert mock_db.peek("order_public/BATCH0")["status"] == "PRINTED"
+    assert mock_db.peek("orders/batch_1")["status"] == "READY_FOR_PRINT"
+    history = list(mock_db.dump("order_status_history").values())
+    assert [(h["order_id"], h["note"], h["source"]) for h in history] == [("batch_0", "Printer run 7", "admin_panel_bulk")]
+    assert order_public_cache.get("BATCH0") is MISSING
+
+    app.dependency_overrides.clear()
+
+def test_admin_bulk_status_spans_multiple_batches(mock_db):
+    app.dependency_overrides[require_admin] = override_require_admin
+    seed_batch(mock_db, 300)
+
+    payload = {
+        "to_status": "PRINTED",
+        "items": [{"order_id": f"batch_{i}", "expected_from_status": "READY_FOR_PRINT"} for i in range(300)]
+    }
+    res = client.post("/api/admin/orders/bulk-status", json=payload)
+    assert res.status_code == 200
+    assert res.json()["updated_count"] == 300
+    assert all(o["status"] == "PRINTED" for o in mock_db.dump("orders").values() if o.get("tracking_code", "").startswith("BATCH"))
+    assert len(mock_db.dump("admin_audit_logs")) == 300
+
+    app.dependency_overrides.clear()
+
+def test_admin_bulk_status_falls_back_on_concurrent_change(mock_db):
+    app.dependency_overrides[require_admin] = override_require_admin
+    seed_batch(mock_db, 3)
+
+    # Another admin cancels batch_1 right after the bulk read
+    original_get_all = mock_db.get_all
+    async def get_all_then_cancel(refs, *args, **kwargs):
+        async for snapshot in original_get_all(refs, *args, **kwargs):
+            yield snapshot
+        mock_db.seed("orders/batch_1", {"status": "CANCELLED", "tracking_code": "BATCH1"})
+    mock_db.get_all = get_all_then_cancel
+    try:
+        payload = {
+            "to_status": "PRINTED",
+            "items": [{"order_id": f"batch_{i}", "expected_from_status": "READY_FOR_PRINT"} for i in range(3)]
+        }
+        res = client.post("/api/admin/orders/bulk-status", json=payload)
+    finally:
+        del mock_db.get_all
+
+    assert res.status_code == 200
+    results = res.json()["results"]
+    assert [r["result"] for r in results] == ["UPDATED", "STATUS_MISMATCH", "UPDATED"]
+    assert results[1]["current_status"] == "CANCELLED"
+    assert mock_db.peek("orders/batch_1")["status"] == "CANCELLED"
+    assert mock_db.peek("orders/batch_2")["status"] == "PRINTED"
+
+    app.dependency_overrides.clear()
+
+def test_admin_bulk_status_reports_failed_chunk(mock_db, monkeypatch):
+    from google.api_core.exceptions import DeadlineExceeded
+    from app.db.memory import WriteBatch
+    from app.db.repositories import BULK_ORDERS_PER_BATCH
+    app.dependency_overrides[require_admin] = override_require_admin
+    count = BULK_ORDERS_PER_BATCH + 2
+    seed_batch(mock_db, count)
+    order_public_cache.set("BATCH0", "stale-snapshot")
+
+    # The second chunk's commit times out; the first one goes through
+    commit = WriteBatch.commit
+    async def commit_or_time_out(batch):
+        if any(op[1].path.endswith(f"batch_{count - 1}") for op in batch._writes):
+            raise DeadlineExceeded("commit timed out")
+        return await commit(batch)
+    monkeypatch.setattr(WriteBatch, "commit", commit_or_time_out)
+
+    payload = {
+        "to_status": "PRINTED",
+        "items": [{"order_id": f"batch_{i}", "expected_from_status": "READY_FOR_PRINT"} for i in range(count)]
+    }
+    res = client.post("/api/admin/orders/bulk-status", json=payload)
+
+    assert res.status_code == 200
+    body = res.json()
+    assert body["updated_count"] == BULK_ORDERS_PER_BATCH and body["failed_count"] == 2
+    assert [r["result"] for r in body["results"][-2:]] == ["ERROR", "ERROR"]
+    assert "commit timed out" in body["results"][-1]["message"]
+    assert mock_db.peek(f"orders/batch_{count - 1}")["status"] == "READY_FOR_PRINT"
+    assert order_public_cache.get("BATCH0") is MISSING
+
+    app.dependency_overrides.clear()
+
+def test_admin_list_orders_cursor_pages_without_cursor_reads(mock_db, monkeypatch):
+    app.dependency_overrides[require_admin] = override_require_admin
+    base = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+    # Two orders share a created_at: the document ID breaks the tie
+    for i, minutes in enumerate([1, 2, 2, 3, 4]):
+        mock_db.seed(f"orders/page_{i}", {
+            "status": "PAID", "tracking_code": f"PAGE{i}", "created_at": base + datetime.timedelta(minutes=minutes),
+            "recipient_summary": "Moda, Istanbul"
+        })
+
+    def no_document_reads(*args, **kwargs):
+        raise AssertionError("cursor document was fetched")
+    monkeypatch.setattr(mock_db, "_read", no_document_reads)
+
+    seen, cursor = [], None
+    while True:
+        params = {"status": "PAID", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/admin/orders", params=params)
+        assert response.status_code == 200
+        body = response.json()
+        seen += [item["order_id"] for item in body["items"]]
+        if not body["has_more"]:
+            break
+        cursor = body["next_cursor"]
+        # Deleting the last item of the page must not break the next page
+        asyncio.run(mock_db.document(f"orders/{seen[-1]}").delete())
+
+    assert seen == ["page_4", "page_3", "page_2", "page_1", "page_0"]
+
+def test_admin_list_orders_rejects_malformed_cursor(mock_db):
+    app.dependency_overrides[require_admin] = override_require_admin
+    response = client.get("/api/admin/orders", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_admin_list_orders_projects_summary_fields(mock_db):
+    from app.db.repositories import OrderRepository
+    app.dependency_overrides[require_admin] = override_require_admin
+    mock_db.seed("orders/projected", {
+        "status": "PAID", "tracking_code": "PROJ1", "created_at": datetime.datetime.now(),
+        "recipient": {"name": "Zeynep", "address": "Moda, Istanbul"}, "recipient_summary": "Moda, Istanbul",
+        "letter_content": "x" * 20000
+    })
+
+    docs = asyncio.run(OrderRepository(mock_db).list_page("PAID", 10, None))
+    data = docs[0].to_dict()
+    assert data["tracking_code"] == "PROJ1"
+    assert "letter_content" not in data and "recipient" not in data
+
+    # Stored summary for new orders, masked fallback read for the legacy seed
+    items = {item["order_id"]: item for item in client.get("/api/admin/orders").json()["items"]}
+    assert items["projected"]["recipient_summary"] == "Moda, Istanbul"
+    assert items["test_order_1"]["recipient_summary"] == "Kadikoy, Istanbul"
+
+def test_admin_stats_follow_status_changes_and_reconcile(mock_db, monkeypatch):
+    from app.core.config import settings
+    app.dependency_overrides[require_admin] = override_require_admin
+    monkeypatch.setattr(settings, "ENV", "test")  # accepts the ops mock token
+    seed_batch(mock_db, 3)
+
+    # Seeded orders bypassed the write paths: counters start out of sync
+    assert client.get("/api/admin/stats").json()["total"] == 0
+    res = client.post("/api/ops/stats-reconcile", json={"job_id": "reconcile_1"},
+                      headers={"Authorization": "Bearer ops-mock-token"})
+    assert res.status_code == 200
+    assert res.json()["details"]["drift"] == {"CREATED": 1, "READY_FOR_PRINT": 3}
+
+    stats = client.get("/api/admin/stats").json()
+    assert stats["counts"]["READY_FOR_PRINT"] == 3 and stats["counts"]["CREATED"] == 1
+    assert stats["total"] == 4
+
+    client.patch("/api/admin/orders/batch_0/status", json={"to_status": "PRINTED", "expected_from_status": "READY_FOR_PRINT"})
+    client.post("/api/admin/orders/bulk-status", json={
+        "to_status": "PRINTED",
+        "items": [{"order_id": "batch_1", "expected_from_status": "READY_FOR_PRINT"},
+                  {"order_id": "batch_2", "expected_from_status": "PAID"}]  # mismatch: not counted
+    })
+    stats = client.get("/api/admin/stats").json()
+    assert stats["counts"]["READY_FOR_PRINT"] == 1
+    assert stats["counts"]["PRINTED"] == 2
+    assert stats["total"] == 4
+
+    # Counters now agree with the data: nothing to correct
+    res = client.post("/api/ops/stats-reconcile", json={"job_id": "reconcile_2"},
+                      headers={"Authorization": "Bearer ops-mock-token"})
+    assert res.json()["details"]["drift"] == {}
+    assert list(mock_db.dump("order_status_counters")) == ["shard_0"]
+
+    app.dependency_overrides.clear()
@@ -0,0 +1,32 @@
+import asyncio
+import copy
+from benchmarks.compare import find_regressions
+from benchmarks.harness import percentile
+from benchmarks.run import run_benchmarks
+from benchmarks.scenarios import SCENARIOS
+
+def test_percentile_interpolates():
+    samples = [float(n) for n in range(1, 101)]
+    assert percentile(samples, 50) == 50.5
+    assert percentile(samples, 99) == 99.01
+    assert percentile([], 95) == 0.0
+
+def test_benchmark_suite_smoke(memory_db):
+    """Every scenario runs end-to-end against the in-memory engine without errors."""
+    results = asyncio.run(run_benchmarks(list(SCENARIOS), requests=4, concurrency=2))
+
+    assert set(results["scenarios"]) == set(SCENARIOS)
+    for name, stats in results["scenarios"].items():
+        assert stats["requests"] == 4, name
+        assert stats["errors"] == 0, (name, stats["status_codes"])
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+    assert results["meta"]["git"]["sha"]
+
+def test_compare_flags_regressions():
+    base = {"scenarios": {"orders_track": {"p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 30.0, "throughput_rps": 1000.0}}}
+    head = copy.deepcopy(base)
+    assert find_regressions(base, head, threshold=0.1) == []
+
+    head["scenarios"]["orders_track"]["p95_ms"] = 25.0
+    head["scenarios"]["orders_track"]["throughput_rps"] = 800.0
+    assert find_regressions(base, head, threshold=0.1) == ["orders_track.p95_ms", "orders_track.throughput_rps"]
@@ -0,0 +1,42 @@
+from app.core.cache import TTLCache, MISSING
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_expiry_and_negative_entries():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=30, clock=clock)
+    
+    cache.set("A", {"status": "PAID"})
+    cache.set("MISSING_CODE", None, ttl=5)
+    assert cache.get("A") == {"status": "PAID"}
+    assert cache.get("MISSING_CODE") is None
+    
+    clock.now = 6
+    assert cache.get("MISSING_CODE") is MISSING
+    assert cache.get("A") == {"status": "PAID"}
+    
+    clock.now = 31
+    assert cache.get("A") is MISSING
+    assert cache.stats() == {"size": 0, "hits": 3, "misses": 2}
+
+
+def test_lru_eviction_and_invalidation():
+    cache = TTLCache(maxsize=2, ttl=30)
+    cache.set("A", 1)
+    cache.set("B", 2)
+    cache.get("A")  # A is now most recently used
+    cache.set("C", 3)
+    
+    assert cache.get("B") is MISSING
+    assert cache.get("A") == 1
+    assert cache.get("C") == 3
+    
+    cache.invalidate("A")
+    assert cache.get("A") is MISSING
+    assert len(cache) == 1
@@ -1,45 +1,133 @@
 import pytest
-from mockfirestore import MockFirestore
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
 from app.db.collections import ORDERS
 
-# Patch the get_db function to return a MockFirestore client
-@pytest.fixture
-def mock_db(monkeypatch):
-    mock = MockFirestore()
-    monkeypatch.setattr("app.db.firestore.get_db", lambda: mock)
-    return mock
-
-def test_firestore_smoke(mock_db):
+async def test_firestore_smoke(memory_db):
     """
-    Simulates writing and reading a document to verify 
-    the Firestore abstraction wrapper logic works without touching Production.
+    Simulates writing and reading a document to verify
+    the in-memory engine behaves like Firestore without touching Production.
     """
-    doc_ref = mock_db.collection(ORDERS).document("test_order_123")
-    
+    doc_ref = memory_db.collection(ORDERS).document("test_order_123")
+
     # 1. Write document
-    doc_ref.set({
+    await doc_ref.set({
         "status": "CREATED",
         "total_amount": 150.0,
-        "is_guest": True
+        "is_guest": True,
+        "created_at": firestore.SERVER_TIMESTAMP
     })
-    
+
     # 2. Read document
-    doc_snapshot = doc_ref.get()
-    
+    doc_snapshot = await doc_ref.get()
+
     # 3. Assertions
     assert doc_snapshot.exists
-    
     data = doc_snapshot.to_dict()
     assert data["status"] == "CREATED"
     assert data["total_amount"] == 150.0
     assert data["is_guest"] is True
-    
-    # 4. Clean up mock
-    doc_ref.delete()
-    
-    # mockfirestore raises KeyError when trying to get a deleted document
-    try:
-        doc_ref.get()
-        assert False, "Document should have been deleted"
-    except Exception:
-        pass
+    assert hasattr(data["created_at"], "isoformat")
+
+    # 4. Delete: a missing document reads back as exists=False
+    await doc_ref.delete()
+    assert not (await doc_ref.get()).exists
+
+async def test_batch_is_atomic(memory_db):
+    memory_db.seed("orders/taken", {"status": "CREATED"})
+
+    batch = memory_db.batch()
+    batch.set(memory_db.document("orders/new"), {"status": "CREATED"})
+    batch.create(memory_db.document("orders/taken"), {"status": "PAID"})
+
+    with pytest.raises(AlreadyExists):
+        await batch.commit()
+
+    # Neither write was applied
+    assert memory_db.peek("orders/new") is None
+    assert memory_db.peek("orders/taken") == {"status": "CREATED"}
+
+async def test_transaction_conflict_retries(memory_db):
+    memory_db.seed("orders/o1", {"count": 0})
+    ref = memory_db.document("orders/o1")
+    attempts = []
+
+    @firestore.async_transactional
+    async def bump(transaction):
+        attempts.append(1)
+        snap = await ref.get(transaction=transaction)
+        if len(attempts) == 1:
+            # A concurrent writer changes the document after our read
+            await ref.update({"count": 100})
+        transaction.update(ref, {"count": snap.get("count") + 1})
+
+    await bump(memory_db.transaction())
+
+    assert len(attempts) == 2
+    assert memory_db.peek("orders/o1") == {"count": 101}
+
+async def test_transaction_gives_up_after_max_attempts(memory_db):
+    memory_db.seed("orders/o1", {"count": 0})
+    ref = memory_db.document("orders/o1")
+
+    @firestore.async_transactional
+    async def always_conflicts(transaction):
+        await ref.get(transaction=transaction)
+        await ref.update({"count": firestore.Increment(1)})
+        transaction.update(ref, {"count": -1})
+
+    # The decorator wraps the final Aborted in a ValueError, same as on Firestore
+    with pytest.raises(ValueError, match="2 attempts"):
+        await always_conflicts(memory_db.transaction(max_attempts=2))
+
+    assert memory_db.peek("orders/o1") == {"count": 2}
+
+async def test_query_cursor_and_count(memory_db):
+    for i in range(5):
+        memory_db.seed(f"orders/o{i}", {"status": "PAID" if i % 2 == 0 else "CREATED", "n": i})
+
+    paid = memory_db.collection(ORDERS).where("status", "==", "PAID")
+    result = await paid.count(alias="total").get()
+    assert result[0][0].alias == "total"
+    assert result[0][0].value == 3
+
+    first_page = [snap async for snap in paid.order_by("n").limit(2).stream()]
+    assert [s.id for s in first_page] == ["o0", "o2"]
+
+    next_page = [snap async for snap in paid.order_by("n").start_after(first_page[-1]).limit(2).stream()]
+    assert [s.id for s in next_page] == ["o4"]
+
+async def test_transaction_api_matches_async_transaction(memory_db):
+    import inspect
+    from google.cloud.firestore_v1.async_transaction import AsyncTransaction
+    from app.db.memory import Transaction
+
+    # Same call shape as the real client: coroutines resolving to async iterators
+    for name in ("get_all", "get"):
+        assert inspect.iscoroutinefunction(getattr(Transaction, name)) == \
+            inspect.iscoroutinefunction(getattr(AsyncTransaction, name))
+
+    memory_db.seed("orders/a", {"status": "CREATED"})
+    transaction = memory_db.transaction()
+    pending = transaction.get_all([memory_db.document("orders/a")])
+    with pytest.raises(TypeError):
+        async for _ in pending:
+            pass
+    pending.close()
+    snapshots = [snap async for snap in await transaction.get_all([memory_db.document("orders/a")])]
+    assert snapshots[0].to_dict() == {"status": "CREATED"}
+
+
+async def test_backfill_pii_flags(memory_db):
+    from app.db.repositories import OrderRepository
+    memory_db.seed(f"{ORDERS}/legacy_cleaned", {"status": "SHIPPED", "pii_cleaned_at": "2025-01-01"})
+    memory_db.seed(f"{ORDERS}/legacy_open", {"status": "SHIPPED", "recipient": {"name": "Ali"}})
+    memory_db.seed(f"{ORDERS}/new_order", {"status": "PAID", "pii_anonymized": False})
+
+    orders = OrderRepository(memory_db)
+    assert await orders.backfill_pii_flags(2) == (2, "legacy_open")
+    assert await orders.backfill_pii_flags(2, "legacy_open") == (0, None)
+
+    assert memory_db.peek(f"{ORDERS}/legacy_cleaned")["pii_anonymized"] is True
+    assert memory_db.peek(f"{ORDERS}/legacy_open")["pii_anonymized"] is False
+    assert memory_db.peek(f"{ORDERS}/new_order")["pii_anonymized"] is False
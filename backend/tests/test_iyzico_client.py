@@ -0,0 +1,195 @@
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.services.iyzico_client import (
+    CHECKOUT_FORM_INITIALIZE_PATH, CircuitBreaker, IyzicoClient, IyzicoError, ProviderUnavailable
+)
+from app.services.payment_service import payment_service
+
+API_KEY = "stub_api_key"
+SECRET_KEY = "stub_secret_key"
+
+
+class IyzicoStandIn:
+    """Local iyzico checkout-form endpoint; `script` lists how to answer the next calls."""
+
+    def __init__(self):
+        self.calls = []
+        self.script = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                stand_in.calls.append((self.path, json.loads(body)))
+                action = stand_in.script.pop(0) if stand_in.script else "ok"
+                if action == "slow":
+                    time.sleep(0.5)
+                if action == "503":
+                    return self._reply(503, {"status": "failure"})
+                if not stand_in.signed(self.path, body, self.headers):
+                    return self._reply(200, {"status": "failure", "errorMessage": "Invalid signature"})
+                if action == "refuse":
+                    return self._reply(200, {"status": "failure", "errorMessage": "Invalid basket"})
+                token = f"stub_token_{len(stand_in.calls)}"
+                self._reply(200, {"status": "success", "token": token, "paymentPageUrl": f"https://stub/{token}"})
+
+            def _reply(self, status_code, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @staticmethod
+    def signed(path, body, headers) -> bool:
+        auth = base64.b64decode(headers["Authorization"].removeprefix("IYZWSv2 ")).decode()
+        fields = dict(part.split(":", 1) for part in auth.split("&"))
+        expected = hmac.new(
+            SECRET_KEY.encode(), fields["randomKey"].encode() + path.encode() + body, hashlib.sha256
+        ).hexdigest()
+        return fields["apiKey"] == API_KEY and hmac.compare_digest(fields["signature"], expected)
+
+
+@pytest.fixture
+def iyzico():
+    stand_in = IyzicoStandIn()
+    thread = threading.Thread(target=stand_in.server.serve_forever, daemon=True)
+    thread.start()
+    yield stand_in
+    stand_in.server.shutdown()
+    stand_in.server.server_close()
+
+
+def make_client(url, **kwargs):
+    options = dict(timeout=0.2, deadline=2.0, max_retries=2, backoff=0.01)
+    options.update(kwargs)
+    return IyzicoClient(url, API_KEY, SECRET_KEY, **options)
+
+
+async def test_checkout_form_is_signed_and_connections_are_reused(iyzico):
+    client = make_client(iyzico.url)
+    first = await client.initialize_checkout_form({"conversationId": "order_1"})
+    http = client._client()
+    second = await client.initialize_checkout_form({"conversationId": "order_2"})
+    await client.aclose()
+
+    assert first["token"] == "stub_token_1" and second["token"] == "stub_token_2"
+    assert [path for path, _ in iyzico.calls] == [CHECKOUT_FORM_INITIALIZE_PATH] * 2
+    assert iyzico.calls[1][1] == {"conversationId": "order_2"}
+    # One pooled client for both calls
+    assert client._http is None and http.is_closed
+
+
+class RefusedConnections(httpx.AsyncHTTPTransport):
+    """Fails the first `refusals` connection attempts, before anything is sent."""
+
+    def __init__(self, refusals):
+        super().__init__()
+        self.refusals = refusals
+
+    async def handle_async_request(self, request):
+        if self.refusals:
+            self.refusals -= 1
+            raise httpx.ConnectError("connection refused", request=request)
+        return await super().handle_async_request(request)
+
+
+async def test_unsent_requests_are_retried_within_the_deadline(iyzico, monkeypatch):
+    client = make_client(iyzico.url)
+    http = httpx.AsyncClient(base_url=iyzico.url, transport=RefusedConnections(2))
+    monkeypatch.setattr(client, "_client", lambda: http)
+    result = await client.initialize_checkout_form({"conversationId": "order_1"})
+    await http.aclose()
+
+    assert result["token"] == "stub_token_1"
+    assert len(iyzico.calls) == 1
+
+
+@pytest.mark.parametrize("action", ["503", "slow"])
+async def test_failures_after_processing_are_not_retried(iyzico, action):
+    # iyzico got (and may have acted on) the request: resending could open a second checkout
+    iyzico.script = [action, "ok"]
+    client = make_client(iyzico.url)
+    with pytest.raises(ProviderUnavailable):
+        await client.initialize_checkout_form({"conversationId": "order_1"})
+    await client.aclose()
+
+    assert len(iyzico.calls) == 1
+
+
+async def test_deadline_bounds_the_whole_call(iyzico):
+    iyzico.script = ["slow"] * 10
+    client = make_client(iyzico.url, timeout=1.0, deadline=0.3, max_retries=5)
+    started = time.monotonic()
+    with pytest.raises(ProviderUnavailable):
+        await client.initialize_checkout_form({"conversationId": "order_1"})
+    await client.aclose()
+    assert time.monotonic() - started < 0.6
+
+
+async def test_business_errors_are_not_retried_and_keep_the_circuit_closed(iyzico):
+    iyzico.script = ["refuse"]
+    client = make_client(iyzico.url, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30))
+    with pytest.raises(IyzicoError, match="Invalid basket") as excinfo:
+        await client.initialize_checkout_form({"conversationId": "order_1"})
+    await client.aclose()
+
+    assert not isinstance(excinfo.value, ProviderUnavailable)
+    assert len(iyzico.calls) == 1
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_circuit_breaker_fails_fast_then_probes(iyzico):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+    client = make_client(iyzico.url, max_retries=0, breaker=breaker)
+    iyzico.script = ["503", "503"]
+
+    for _ in range(2):
+        with pytest.raises(ProviderUnavailable):
+            await client.initialize_checkout_form({})
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Open: no request reaches the provider
+    with pytest.raises(ProviderUnavailable) as excinfo:
+        await client.initialize_checkout_form({})
+    assert excinfo.value.retry_after == 30
+    assert len(iyzico.calls) == 2
+
+    # After the reset timeout one trial call closes the circuit again
+    now[0] = 31
+    assert (await client.initialize_checkout_form({}))["status"] == "success"
+    assert breaker.state == CircuitBreaker.CLOSED
+    await client.aclose()
+
+
+async def test_payment_service_builds_checkout_request(iyzico, monkeypatch):
+    monkeypatch.setattr(payment_service, "api_key", API_KEY)
+    monkeypatch.setattr(payment_service, "client", make_client(iyzico.url))
+
+    result = await payment_service.create_checkout_intent(
+        "order_1", 150.0, "TRY", {"name": "Ali Veli Yilmaz", "address": "Istanbul"}
+    )
+    await payment_service.client.aclose()
+
+    assert result == {"status": "success", "token": "stub_token_1", "checkout_url": "https://stub/stub_token_1"}
+    request = iyzico.calls[0][1]
+    assert request["conversationId"] == "order_1"
+    assert request["price"] == "150.0"
+    assert request["buyer"]["name"] == "Ali" and request["buyer"]["surname"] == "Veli Yilmaz"
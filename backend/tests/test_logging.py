@@ -0,0 +1,63 @@
+import json
+import logging
+import queue
+import pytest
+from app.core.config import settings
+from app.core.logging import JsonFormatter, NonBlockingQueueHandler, SamplingFilter, InjectRequestId, request_id_var
+
+def make_record(msg, *args, level=logging.INFO, **extra):
+    logger = logging.getLogger("emektup.test")
+    return logger.makeRecord("emektup.test", level, __file__, 1, msg, args, None, extra=extra)
+
+def test_json_formatter_escapes_and_keeps_extra_fields():
+    record = make_record('Iyzico error: "%s"', 'kart "reddedildi"', order_id="o1", attempt=2)
+    record.request_id = "req-1"
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["message"] == 'Iyzico error: "kart "reddedildi""'
+    assert entry["level"] == "INFO"
+    assert entry["request_id"] == "req-1"
+    assert entry["order_id"] == "o1"
+    assert entry["attempt"] == 2
+
+def test_queue_handler_resolves_message_and_traceback_in_caller():
+    records = queue.Queue()
+    handler = NonBlockingQueueHandler(records)
+    handler.addFilter(InjectRequestId())
+    token = request_id_var.set("req-queued")
+    try:
+        try:
+            raise ValueError('bad "input"')
+        except ValueError:
+            record = make_record("failed for %s", "o1", level=logging.ERROR, order_id="o1")
+            record.exc_info = __import__("sys").exc_info()
+            handler.handle(record)
+    finally:
+        request_id_var.reset(token)
+
+    queued = records.get_nowait()
+    entry = json.loads(JsonFormatter().format(queued))
+    assert entry["message"] == "failed for o1"
+    assert entry["request_id"] == "req-queued"
+    assert entry["order_id"] == "o1"
+    assert 'ValueError: bad "input"' in entry["exc_info"]
+
+def test_queue_handler_drops_instead_of_blocking():
+    records = queue.Queue(maxsize=1)
+    handler = NonBlockingQueueHandler(records)
+    handler.handle(make_record("first"))
+    handler.handle(make_record("second"))  # must not block or raise
+    assert records.qsize() == 1
+
+@pytest.mark.parametrize("rate, kept", [("0", 0), ("1", 200)])
+def test_sampling_filter(monkeypatch, rate, kept):
+    monkeypatch.setattr(settings, "LOG_SAMPLE_RATES", f"ops.oidc_verified={rate}")
+    sampler = SamplingFilter()
+
+    sampled = [sampler.filter(make_record("OIDC verified", sample_key="ops.oidc_verified")) for _ in range(200)]
+    assert sum(sampled) == kept
+
+    # Unkeyed lines and warnings always pass
+    assert sampler.filter(make_record("other line"))
+    assert sampler.filter(make_record("OIDC verified", level=logging.WARNING, sample_key="ops.oidc_verified"))
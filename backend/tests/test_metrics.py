@@ -0,0 +1,86 @@
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from app.main import app
+from app.core.config import settings
+from app.core.rate_limit import limiter
+from app.db.repositories import OrderRepository
+
+client = TestClient(app)
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+@pytest.fixture
+def fresh_limiter():
+    limiter.reset()
+    yield
+    limiter.reset()
+
+def test_route_latency_is_labelled_by_template(memory_db):
+    memory_db.seed("order_public/METRICS1", {"status": "CREATED", "created_at": "2026-01-01T00:00:00"})
+    labels = {"method": "GET", "route": "/api/orders/track/{tracking_code}"}
+    before = sample("emektup_http_request_duration_seconds_count", **labels)
+
+    assert client.get("/api/orders/track/METRICS1").status_code == 200
+
+    assert sample("emektup_http_request_duration_seconds_count", **labels) == before + 1
+    assert sample("emektup_http_requests_total", status="200", **labels) >= 1
+
+    res = client.get("/api/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain")
+    assert 'route="/api/orders/track/{tracking_code}"' in res.text
+    # Raw paths never become labels
+    assert "METRICS1" not in res.text
+
+def test_firestore_calls_are_counted_by_repository_method(memory_db):
+    labels = {"operation": "OrderRepository.get_public", "kind": "read"}
+    before = sample("emektup_firestore_calls_total", outcome="ok", **labels)
+
+    client.get("/api/orders/track/UNKNOWN-METRICS")
+
+    assert sample("emektup_firestore_calls_total", outcome="ok", **labels) == before + 1
+    assert sample("emektup_firestore_call_duration_seconds_count", **labels) >= 1
+
+async def test_transaction_retries_are_counted(memory_db):
+    memory_db.seed("orders/o1", {"status": "CREATED", "tracking_code": "T1"})
+    memory_db.seed("order_public/T1", {"status": "CREATED"})
+    operation = {"operation": "OrderRepository.transition_status"}
+    attempts_before = sample("emektup_firestore_transaction_attempts_total", **operation)
+    retries_before = sample("emektup_firestore_transaction_retries_total", **operation)
+
+    # Force one contention abort: a concurrent write lands after the transaction's read
+    original_get = memory_db._read
+    calls = []
+    def read_then_conflict(ref, field_paths, transaction):
+        snapshot = original_get(ref, field_paths, transaction)
+        if transaction is not None and not calls:
+            calls.append(1)
+            memory_db.seed("orders/o1", {"status": "CREATED", "tracking_code": "T1", "touched": True})
+        return snapshot
+    memory_db._read = read_then_conflict
+    try:
+        await OrderRepository(memory_db).transition_status("o1", "CREATED", "PAID", actor_uid="admin")
+    finally:
+        del memory_db._read
+
+    assert sample("emektup_firestore_transaction_attempts_total", **operation) == attempts_before + 2
+    assert sample("emektup_firestore_transaction_retries_total", **operation) == retries_before + 1
+    assert memory_db.peek("orders/o1")["status"] == "PAID"
+
+def test_rate_limit_rejections_are_counted(memory_db, fresh_limiter):
+    route = {"route": "/api/orders/track/{tracking_code}"}
+    before = sample("emektup_rate_limit_rejections_total", **route)
+
+    statuses = [client.get("/api/orders/track/LIMITED").status_code for _ in range(21)]
+
+    assert statuses[-1] == 429
+    assert sample("emektup_rate_limit_rejections_total", **route) == before + 1
+
+def test_metrics_token(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_BEARER_TOKEN", "scrape-secret")
+
+    assert client.get("/api/metrics").status_code == 401
+    assert client.get("/api/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/api/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
@@ -1,10 +1,8 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch
 from app.main import app
-from mockfirestore import MockFirestore
-from app.api.routes.orders import get_db
 from app.core.rate_limit import limiter
+from app.core.cache import order_public_cache
 
 client = TestClient(app)
 
@@ -12,26 +10,12 @@ client = TestClient(app)
 def reset_rate_limit():
     # Clear rate limiter memory before each test
     limiter._storage.reset()
+    order_public_cache.clear()
     yield
 
-class DummyBatch:
-    def __init__(self, db):
-        self.db = db
-    def set(self, ref, data):
-        self.db.collection(ref._path[0]).document(ref.id).set(data)
-    def commit(self):
-        pass
-
 @pytest.fixture
-def mock_db():
-    mock = MockFirestore()
-    # Inject batch method for testing since mockfirestore lacks it
-    mock.batch = lambda: DummyBatch(mock)
-    
-    app.dependency_overrides[get_db] = lambda: mock
-    with patch("app.api.routes.orders.get_db", return_value=mock):
-        yield mock
-    app.dependency_overrides.clear()
+def mock_db(memory_db):
+    return memory_db
 
 def test_order_creation_and_tracking(mock_db):
     # 1. Create Order Payload
@@ -56,6 +40,8 @@ def test_order_creation_and_tracking(mock_db):
     assert data["status"] == "CREATED"
     
     tracking_code = data["tracking_code"]
+    assert mock_db.peek(f"orders/{data['order_id']}")["recipient_summary"] == "Ataturk Cad. No: 1, Istanbul"
+    assert [shard["counts"] for shard in mock_db.dump("order_status_counters").values()] == [{"CREATED": 1}]
     
     # Verify rate limit still applies
     for _ in range(5):
@@ -115,3 +101,48 @@ def test_pydantic_sanitization(mock_db):
     }
     response3 = client.post("/api/orders/create", json=bad_payload)
     assert response3.status_code == 422
+
+def test_tracking_is_served_from_cache(mock_db):
+    mock_db.seed("order_public/CACHED123", {
+        "order_id": "order_cached",
+        "status": "PAID",
+        "created_at": "2026-01-01T00:00:00",
+        "public_step_label": "Ödeme Onaylandı, Hazırlanıyor"
+    })
+    
+    first = client.get("/api/orders/track/CACHED123")
+    assert first.status_code == 200
+    
+    # Remove the document: a cached snapshot must still be served without a read
+    mock_db.reset()
+    second = client.get("/api/orders/track/CACHED123")
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    
+    # Unknown codes are negatively cached until they are created
+    assert client.get("/api/orders/track/LATER123").status_code == 404
+    mock_db.seed("order_public/LATER123", {"status": "CREATED", "created_at": "x"})
+    assert client.get("/api/orders/track/LATER123").status_code == 404
+    
+    order_public_cache.invalidate("LATER123")
+    assert client.get("/api/orders/track/LATER123").status_code == 200
+
+def test_order_creation_is_idempotent_by_client_request_id(mock_db):
+    payload = {
+        "client_request_id": "client-req/42",
+        "is_guest": True,
+        "recipient": {"name": "Ahmet Yilmaz", "address": "Ataturk Cad. No: 1, Istanbul"},
+        "letter_content": "Merhaba"
+    }
+    
+    first = client.post("/api/orders/create", json=payload)
+    retry = client.post("/api/orders/create", json=payload)
+    assert first.status_code == 201
+    assert retry.status_code == 201
+    assert retry.json() == first.json()
+    
+    # Only one order was written, and the key document stores the response
+    assert len(mock_db.dump("orders")) == 1
+    keys = list(mock_db.dump("idempotency_keys").values())
+    assert len(keys) == 1
+    assert keys[0]["response"]["order_id"] == first.json()["order_id"]
@@ -1,67 +1,34 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch
 from app.main import app
-from mockfirestore import MockFirestore
-from app.api.routes.payments import get_db
-from firebase_admin import firestore
-import mockfirestore.document
+from app.core.rate_limit import limiter
 import datetime
 
 client = TestClient(app)
 
-# Inject dummy methods for MockFirestore to simulate transactions
-class DummyTransaction:
-    def __init__(self, db):
-        self.db = db
-    def update(self, ref, data):
-        self.db.collection(ref._path[0]).document(ref.id).update(data)
-    def set(self, ref, data):
-        self.db.collection(ref._path[0]).document(ref.id).set(data)
-    def get(self, ref):
-        return ref.get()
-
-
-
-def fake_transactional(func):
-    def wrapper(transaction, *args, **kwargs):
-        return func(transaction, *args, **kwargs)
-    return wrapper
-firestore.transactional = fake_transactional
-
-original_doc_get = mockfirestore.document.DocumentReference.get
-def fake_doc_get(self, *args, **kwargs):
-    kwargs.pop("transaction", None)
-    return original_doc_get(self, *args, **kwargs)
-mockfirestore.document.DocumentReference.get = fake_doc_get
-
-
-
 @pytest.fixture
-def mock_db():
-    mock = MockFirestore()
-    mock.transaction = lambda: DummyTransaction(mock)
-    
-    app.dependency_overrides[get_db] = lambda: mock
+def mock_db(memory_db):
+    mock = memory_db
+    # create-intent allows 5/minute per client
+    limiter._storage.reset()
     
     now = datetime.datetime.now()
     
     # Pre-seed the database with an order for our specs
-    mock.collection("orders").document("order_payment_1").set({
+    mock.seed("orders/order_payment_1", {
         "status": "CREATED",
         "tracking_code": "TRACKPAY123",
         "total_amount": 100.0,
         "currency": "TRY",
         "payment_status": "PENDING"
     })
-    mock.collection("order_public").document("TRACKPAY123").set({
+    mock.seed("order_public/TRACKPAY123", {
         "status": "CREATED",
         "created_at": now,
         "status_updated_at": now
     })
     
-    with patch("app.api.routes.payments.get_db", return_value=mock):
-        yield mock
+    yield mock
     app.dependency_overrides.clear()
 
 
@@ -78,9 +45,8 @@ def test_create_payment_intent(mock_db):
     assert data["status"] == "success"
     
     # Verify Payment Doc Created
-    payment_doc = mock_db.collection("payments").document(data["token"]).get()
-    assert payment_doc.exists
-    p_data = payment_doc.to_dict()
+    p_data = mock_db.peek(f"payments/{data['token']}")
+    assert p_data is not None
     assert p_data["amount"] == 100.0
     assert p_data["status"] == "PENDING"
     assert p_data["order_id"] == "order_payment_1"
@@ -117,9 +83,16 @@ def test_payment_webhook_invalid_signature(mock_db):
     assert "Invalid webhook signature" in res.json()["detail"]
 
 
+def _status_counts(db):
+    totals = {}
+    for shard in db.dump("order_status_counters").values():
+        for order_status, count in shard["counts"].items():
+            totals[order_status] = totals.get(order_status, 0) + count
+    return {k: v for k, v in totals.items() if v}
+
 def test_payment_webhook_success_and_dedup(mock_db):
     # First, mock a payment that is PENDING
-    mock_db.collection("payments").document("val_token_12").set({
+    mock_db.seed("payments/val_token_12", {
         "order_id": "order_payment_1",
         "status": "PENDING"
     })
@@ -136,17 +109,141 @@ def test_payment_webhook_success_and_dedup(mock_db):
     assert res.json()["message"] == "Webhook processed successfully"
     
     # Verify Fan-out status changes
-    payment = mock_db.collection("payments").document("val_token_12").get().to_dict()
+    payment = mock_db.peek("payments/val_token_12")
     assert payment["status"] == "SUCCEEDED"
     
-    order = mock_db.collection("orders").document("order_payment_1").get().to_dict()
+    order = mock_db.peek("orders/order_payment_1")
     assert order["payment_status"] == "PAID"
     assert order["status"] == "PAID"
     
-    public_doc = mock_db.collection("order_public").document("TRACKPAY123").get().to_dict()
+    public_doc = mock_db.peek("order_public/TRACKPAY123")
     assert public_doc["status"] == "PAID"
     assert "Hazırlanıyor" in public_doc["public_step_label"]
     
     # TEST DEDUP (Process again immediately)
     res2 = client.post("/api/payments/webhook", json=payload, headers={"x-iyz-signature": "mock_valid_signature"})
     assert res2.status_code == 200 # Should still return 200, but do nothing under the hood
+    # Counted once: CREATED -> PAID, not again on the duplicate delivery
+    assert _status_counts(mock_db) == {"CREATED": -1, "PAID": 1}
+
+class RecordingTasksClient:
+    def __init__(self):
+        self.tasks = []
+
+    def queue_path(self, project, location, queue):
+        return f"projects/{project}/locations/{location}/queues/{queue}"
+
+    def create_task(self, request):
+        self.tasks.append(request["task"])
+
+
+def test_payment_webhook_reads_payment_and_order_in_one_batch(mock_db, monkeypatch):
+    from app.core.utils import pdf_job_id
+    from app.services.outbox_dispatcher import outbox_dispatcher
+    mock_db.seed("payments/token_batch", {"order_id": "order_payment_1", "status": "PENDING"})
+
+    get_all_calls, read_paths = [], []
+    original_get_all, original_read = mock_db.get_all, mock_db._read
+
+    def counting_get_all(references, *args, **kwargs):
+        get_all_calls.append([ref.path for ref in references])
+        return original_get_all(references, *args, **kwargs)
+
+    def counting_read(ref, *args, **kwargs):
+        read_paths.append(ref.path)
+        return original_read(ref, *args, **kwargs)
+
+    monkeypatch.setattr(mock_db, "get_all", counting_get_all)
+    monkeypatch.setattr(mock_db, "_read", counting_read)
+    tasks_client = RecordingTasksClient()
+    monkeypatch.setattr(outbox_dispatcher, "_client", tasks_client)
+
+    payload = {"token": "token_batch", "status": "SUCCESS", "paymentId": "iyz_1", "conversationId": "order_payment_1"}
+    res = client.post("/api/payments/webhook", json=payload, headers={"x-iyz-signature": "mock_valid_signature"})
+    assert res.status_code == 200
+
+    # One batched get inside the transaction, no re-read after commit
+    assert get_all_calls == [["payments/token_batch", "orders/order_payment_1"]]
+    assert sorted(read_paths) == ["orders/order_payment_1", "payments/token_batch"]
+
+    # The PDF job was committed to the outbox with the payment, then drained after the response
+    # under the content-derived job ID, which also names the Cloud Tasks task
+    job_id = pdf_job_id("order_payment_1", mock_db.peek("orders/order_payment_1"))
+    entry = mock_db.peek(f"outbox/{job_id}")
+    assert entry["status"] == "DISPATCHED"
+    assert entry["payload"] == {"job_id": job_id, "order_id": "order_payment_1", "tracking_code": "TRACKPAY123"}
+    assert [task["name"].rsplit("/", 1)[1] for task in tasks_client.tasks] == [job_id]
+
+    # Duplicate delivery: still a single batched read, and nothing new to deliver
+    client.post("/api/payments/webhook", json=payload, headers={"x-iyz-signature": "mock_valid_signature"})
+    assert len(get_all_calls) == 2
+    assert len(tasks_client.tasks) == 1
+
+
+def test_create_payment_intent_calls_provider_once_outside_transaction(mock_db, monkeypatch):
+    from app.services.payment_service import payment_service
+    calls = []
+    original = payment_service.create_checkout_intent
+
+    async def counting_intent(order_id, *args):
+        calls.append(order_id)
+        return await original(order_id, *args)
+
+    monkeypatch.setattr(payment_service, "create_checkout_intent", counting_intent)
+
+    first = client.post("/api/payments/create-intent", json={"order_id": "order_payment_1"})
+    second = client.post("/api/payments/create-intent", json={"order_id": "order_payment_1"})
+    assert first.status_code == second.status_code == 200
+    assert second.json()["token"] == first.json()["token"]
+    # The second click is served from the intent cached on the order
+    assert calls == ["order_payment_1"]
+
+    order = mock_db.peek("orders/order_payment_1")
+    assert order["payment_status"] == "PAYMENT_PENDING"
+    assert order["payment_intent"]["status"] == "READY"
+    assert order["payment_intent"]["token"] == first.json()["token"]
+
+
+def test_create_payment_intent_reservation_and_expiry(mock_db, monkeypatch):
+    from app.services.payment_service import payment_service
+    from app.services.iyzico_client import ProviderUnavailable
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    # Another request holds the slot: no second provider call
+    mock_db.seed("orders/order_payment_1", {**mock_db.peek("orders/order_payment_1"), "payment_intent": {
+        "status": "RESERVED", "attempt_id": "other", "reserved_until": now + datetime.timedelta(seconds=30)
+    }})
+    res = client.post("/api/payments/create-intent", json={"order_id": "order_payment_1"})
+    assert res.status_code == 409
+
+    # An expired cached intent is replaced by a fresh one
+    mock_db.seed("orders/order_payment_1", {**mock_db.peek("orders/order_payment_1"), "payment_intent": {
+        "status": "READY", "attempt_id": "old", "token": "expired_token", "checkout_url": "https://old",
+        "expires_at": now - datetime.timedelta(seconds=1)
+    }})
+    res = client.post("/api/payments/create-intent", json={"order_id": "order_payment_1"})
+    assert res.status_code == 200
+    assert res.json()["token"] == "sandbox_token_order_payment_1"
+
+    # A provider failure releases the slot instead of leaving it reserved
+    mock_db.seed("orders/order_payment_1", {**mock_db.peek("orders/order_payment_1"), "payment_intent": None})
+
+    async def failing_intent(*args):
+        raise ProviderUnavailable("iyzico unavailable: ConnectError", retry_after=0)
+
+    monkeypatch.setattr(payment_service, "create_checkout_intent", failing_intent)
+    res = client.post("/api/payments/create-intent", json={"order_id": "order_payment_1"})
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "1"
+    assert "payment_intent" not in mock_db.peek("orders/order_payment_1")
+
+
+def test_payment_webhook_with_coroutine_transaction_get_all(mock_db):
+    # The in-memory Transaction.get_all is a coroutine like AsyncTransaction's
+    # (see test_transaction_api_matches_async_transaction); the webhook must not iterate it
+    mock_db.seed("payments/token_coro", {"order_id": "order_payment_1", "status": "PENDING"})
+
+    payload = {"token": "token_coro", "status": "SUCCESS", "paymentId": "iyz_2", "conversationId": "order_payment_1"}
+    res = client.post("/api/payments/webhook", json=payload, headers={"x-iyz-signature": "mock_valid_signature"})
+    assert res.status_code == 200
+    assert mock_db.peek("orders/order_payment_1")["status"] == "PAID"
@@ -0,0 +1,59 @@
+import io
+import pytest
+from pypdf import PdfReader
+from app.services.pdf_service import pdf_service
+from app.services.pdf_storage import LocalPdfStorage
+
+RECIPIENT = {"name": "Şükrü Öğüt", "address": "İstiklal Cad. No:5\nBeyoğlu / İstanbul"}
+
+
+def _render(letter_content: str):
+    stream = io.BytesIO()
+    result = pdf_service.render_letter(stream, "EMK-TEST01", RECIPIENT, letter_content)
+    return result, stream.getvalue()
+
+
+def test_render_letter_keeps_turkish_text_and_tracking_code():
+    result, data = _render("Canım oğlum,\n\nIşıl ışıl günler dilerim. <b>Sağlıcakla</b> & sevgiyle.")
+
+    assert data.startswith(b"%PDF")
+    assert result.size_bytes == len(data)
+    text = PdfReader(io.BytesIO(data)).pages[0].extract_text()
+    assert "Şükrü Öğüt" in text
+    assert "Işıl ışıl" in text
+    # User text is escaped, not interpreted as markup
+    assert "<b>Sağlıcakla</b> & sevgiyle." in text
+    assert "Takip No: EMK-TEST01" in text
+
+
+def test_render_letter_paginates_long_letters():
+    result, data = _render("\n\n".join(f"Paragraf {i}: " + "uzun bir satır " * 30 for i in range(40)))
+
+    reader = PdfReader(io.BytesIO(data))
+    assert result.pages == len(reader.pages) > 1
+    assert f"Sayfa {result.pages}" in reader.pages[-1].extract_text()
+
+
+def test_render_letter_is_deterministic():
+    # Cloud Tasks retries must overwrite the stored object with identical bytes
+    assert _render("Merhaba")[1] == _render("Merhaba")[1]
+
+
+def test_local_storage_publishes_only_complete_files(tmp_path):
+    storage = LocalPdfStorage(str(tmp_path))
+    key = "orders/o1/generated/letter.pdf"
+
+    with pytest.raises(RuntimeError):
+        with storage.open_write(key) as stream:
+            stream.write(b"%PDF-partial")
+            raise RuntimeError("render failed")
+    assert not storage.path(key).exists()
+    assert list(storage.path(key).parent.iterdir()) == []
+
+    with storage.open_write(key) as stream:
+        stream.write(b"%PDF-complete")
+    assert storage.path(key).read_bytes() == b"%PDF-complete"
+    assert storage.uri(key).startswith("file://")
+
+    with pytest.raises(ValueError):
+        storage.path("../outside.pdf")
@@ -0,0 +1,122 @@
+import fakeredis
+import pytest
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import SlidingWindowCounterRateLimiter
+from app.core.rate_limit_storage import LeasedRedisStorage
+
+@pytest.fixture
+def redis_server():
+    # Local Redis-protocol stand-in shared by the simulated instances
+    return fakeredis.FakeServer()
+
+def instance(server, lease_fraction=0.1, **options):
+    storage = storage_from_string(
+        "leased+redis://shared:6379/0",
+        client=fakeredis.FakeRedis(server=server),
+        lease_fraction=lease_fraction,
+        **options,
+    )
+    return SlidingWindowCounterRateLimiter(storage), storage
+
+def test_scheme_is_registered(redis_server):
+    _, storage = instance(redis_server)
+    assert isinstance(storage, LeasedRedisStorage)
+
+def test_limit_is_shared_across_instances(redis_server):
+    limit = parse("5/minute")
+    instances = [instance(redis_server)[0] for _ in range(3)]
+
+    admitted = [instances[i % 3].hit(limit, "127.0.0.1") for i in range(12)]
+
+    # 3 instances, still 5 per minute in total (not 15)
+    assert admitted.count(True) == 5
+    assert admitted[:5] == [True] * 5
+
+def test_hits_are_served_from_a_local_lease(redis_server):
+    limit = parse("100/minute")
+    limiter, storage = instance(redis_server, lease_fraction=0.1)
+    key = limit.key_for("10.0.0.1")
+    window_key = storage.sliding_window_keys(key, limit.get_expiry(), __import__("time").time())[1]
+    shared = fakeredis.FakeRedis(server=redis_server)
+
+    assert limiter.hit(limit, "10.0.0.1")
+    # One round trip reserved 10 hits in the shared window
+    assert int(shared.get(window_key)) == 10
+    assert storage.local_lease(key) == 9
+
+    for _ in range(9):
+        assert limiter.hit(limit, "10.0.0.1")
+    assert int(shared.get(window_key)) == 10  # no Redis writes for the leased hits
+
+    assert limiter.hit(limit, "10.0.0.1")
+    assert int(shared.get(window_key)) == 20
+
+def test_leases_never_exceed_the_shared_limit(redis_server):
+    limit = parse("10/minute")
+    first, _ = instance(redis_server, lease_fraction=0.5)
+    second, _ = instance(redis_server, lease_fraction=0.5)
+
+    # first holds two leases of 5 (7 used, 3 left locally), so second gets nothing
+    assert [first.hit(limit, "ip") for _ in range(7)] == [True] * 7
+    assert [second.hit(limit, "ip") for _ in range(3)] == [False] * 3
+
+    # first spends the rest of its lease, then the shared limit holds for it too
+    assert [first.hit(limit, "ip") for _ in range(4)] == [True, True, True, False]
+    assert second.get_window_stats(limit, "ip").remaining == 0
+
+def test_small_limits_are_served_from_a_minimum_lease(redis_server):
+    limit = parse("5/minute")
+    limiter, storage = instance(redis_server, min_lease=2)
+    key = limit.key_for("10.0.0.2")
+    window_key = storage.sliding_window_keys(key, limit.get_expiry(), __import__("time").time())[1]
+    shared = fakeredis.FakeRedis(server=redis_server)
+
+    # 5/minute * 0.1 rounds down to 0: the minimum lease still reserves 2 hits per round trip
+    assert limiter.hit(limit, "10.0.0.2")
+    assert int(shared.get(window_key)) == 2
+    assert limiter.hit(limit, "10.0.0.2")
+    assert int(shared.get(window_key)) == 2
+
+    # The lease never exceeds what is left of the limit
+    assert [limiter.hit(limit, "10.0.0.2") for _ in range(4)] == [True, True, True, False]
+    assert int(shared.get(window_key)) == 5
+
+def test_expired_leases_are_handed_back(redis_server):
+    limit = parse("5/minute")
+    first, first_storage = instance(redis_server, min_lease=2, lease_ttl=0)
+    second, _ = instance(redis_server, min_lease=2)
+    key = limit.key_for("ip")
+    window_key = first_storage.sliding_window_keys(key, limit.get_expiry(), __import__("time").time())[1]
+    shared = fakeredis.FakeRedis(server=redis_server)
+
+    assert first.hit(limit, "ip")
+    assert int(shared.get(window_key)) == 2
+    # first's next round trip (for any key) returns the unused hit of its expired lease
+    assert first.hit(limit, "other-ip")
+    assert int(shared.get(window_key)) == 1
+    assert first_storage.local_lease(key) == 0
+
+    # ... which the other instances can use again
+    assert [second.hit(limit, "ip") for _ in range(5)] == [True, True, True, True, False]
+
+async def test_shared_limits_are_checked_off_the_event_loop(monkeypatch):
+    import threading
+    from httpx import AsyncClient, ASGITransport
+    from app.core import rate_limit
+    from app.main import app
+
+    threads = []
+    check = rate_limit.limiter._check_request_limit
+    def recording_check(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return check(*args, **kwargs)
+    monkeypatch.setattr(rate_limit, "SHARED_STORAGE", True)
+    monkeypatch.setattr(rate_limit.limiter, "_check_request_limit", recording_check)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        await ac.get("/api/orders/track/OFFLOOP1")
+
+    # Checked once, by the dependency in the threadpool; the inline check was skipped
+    assert threads and threads != [threading.get_ident()]
+    assert len(threads) == 1
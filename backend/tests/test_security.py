@@ -1,24 +1,11 @@
 from fastapi.testclient import TestClient
 from unittest.mock import patch
 from app.main import app
-from mockfirestore import MockFirestore
 
 client = TestClient(app)
 
 # Test 1: Rate Limiting & Request ID Header
-@patch("app.api.routes.orders.get_db")
-def test_rate_limiting_and_request_id(db_mock):
-    class DummyBatch:
-        def __init__(self, db):
-            self.db = db
-        def set(self, ref, data):
-            self.db.collection(ref._path[0]).document(ref.id).set(data)
-        def commit(self):
-            pass
-
-    mock = MockFirestore()
-    mock.batch = lambda: DummyBatch(mock)
-    db_mock.return_value = mock
+def test_rate_limiting_and_request_id(memory_db):
     
     # Attempt to hit the route multiple times to trigger rate limit (5/min)
     responses = []
@@ -67,9 +54,8 @@ def test_user_forbidden_admin_route(verify_mock):
     assert response.json()["detail"] == "The user doesn't have enough privileges"
 
 # Test 4: Admin User accessing Admin Route -> 200
-@patch("app.api.routes.admin.get_db")
 @patch("app.api.deps.auth.verify_id_token")
-def test_admin_access_allowed(verify_mock, db_mock):
+def test_admin_access_allowed(verify_mock, memory_db):
     # Mocking verify_id_token to return admin claims
     verify_mock.return_value = {
         "uid": "admin_uid_99",
@@ -77,7 +63,89 @@ def test_admin_access_allowed(verify_mock, db_mock):
         "admin": True
     }
     
-    db_mock.return_value = MockFirestore()
     
     response = client.get("/api/admin/orders", headers={"Authorization": "Bearer valid-admin-token"})
     assert response.status_code == 200
+
+# Test 5: Verified tokens are cached until exp and honour revocation
+@patch("app.api.deps.auth.verify_id_token")
+def test_verified_token_cache(verify_mock, memory_db):
+    import time
+    from app.core.security import firebase_token_cache
+    firebase_token_cache.clear()
+    
+    verify_mock.return_value = {
+        "uid": "admin_uid_cached",
+        "email": "admin@emektup.com",
+        "admin": True,
+        "iat": time.time() - 10,
+        "exp": time.time() + 3600
+    }
+    headers = {"Authorization": "Bearer cached-admin-token"}
+    
+    for _ in range(3):
+        assert client.get("/api/admin/orders", headers=headers).status_code == 200
+    assert verify_mock.call_count == 1
+    assert firebase_token_cache.hits == 2
+    assert firebase_token_cache.misses == 1
+    
+    # Revoking the user rejects the cached token without re-verification
+    firebase_token_cache.revoke_uid("admin_uid_cached")
+    assert client.get("/api/admin/orders", headers=headers).status_code == 401
+    firebase_token_cache.clear()
+
+# Test 5b: Revocations are bounded and expire after one token lifetime
+def test_revocations_are_bounded(monkeypatch):
+    import time
+    from app.core.config import settings
+    from app.core.security import VerifiedTokenCache
+    monkeypatch.setattr(settings, "AUTH_REVOCATION_MAX_ENTRIES", 2)
+    cache = VerifiedTokenCache(maxsize=8)
+
+    for uid in ["uid_1", "uid_2", "uid_3"]:
+        cache.revoke_uid(uid)
+    assert cache._revoked_before.stats()["size"] == 2
+
+    issued = {"uid": "uid_3", "iat": time.time() - 10}
+    assert cache.is_revoked(issued)
+    later = time.time() + settings.AUTH_REVOCATION_TTL_SECONDS + 1
+    monkeypatch.setattr(cache._revoked_before, "_clock", lambda: later)
+    assert not cache.is_revoked(issued)
+
+# Test 6: Request ID reaches log records and honours a safe incoming X-Request-Id
+def test_request_id_is_propagated_to_logs():
+    import logging
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+    from app.core.logging import RequestIdMiddleware, InjectRequestId, logger
+
+    records = []
+    class Capture(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+    capture = Capture()
+    capture.addFilter(InjectRequestId())
+    logger.addHandler(capture)
+
+    def endpoint(request):
+        logger.info("handling request")
+        return PlainTextResponse(request.state.request_id)
+
+    probe = TestClient(RequestIdMiddleware(Starlette(routes=[Route("/", endpoint)])))
+    try:
+        res = probe.get("/", headers={"X-Request-Id": "lb-trace-123"})
+        assert res.headers["x-request-id"] == "lb-trace-123"
+        assert res.text == "lb-trace-123"
+        assert records[-1].request_id == "lb-trace-123"
+
+        # Unsafe incoming IDs are replaced with a fresh UUID
+        res = probe.get("/", headers={"X-Request-Id": 'bad" id\n'})
+        assert res.headers["x-request-id"] != 'bad" id\n'
+        assert records[-1].request_id == res.headers["x-request-id"]
+
+        # Outside a request the default applies
+        logger.info("startup")
+        assert records[-1].request_id == "system"
+    finally:
+        logger.removeHandler(capture)